@@ -0,0 +1,247 @@
+"""Batched optimal matching of riders and drivers.
+
+This module needs NumPy. The rest of the simulation does not, so it is only
+imported by code that asks for a BatchDispatcher.
+
+=== Constants ===
+UNREACHABLE: The travel time given to a driver who cannot reach a rider by
+    the roads, longer than any rider waits.
+"""
+
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from dispatcher import Dispatcher
+from driver import Driver
+from rider import Rider
+from roads import DistanceOracle
+
+# A power of two, so it is exact as a float64 and as an int64.
+UNREACHABLE = 2 ** 62
+
+
+class BatchDispatcher(Dispatcher):
+    """A dispatcher that matches riders in batches rather than one at a time.
+
+    A rider who requests a driver joins a batch instead of being matched
+    straight away. A batch is matched <window> time units after its first
+    rider's request, by solving a minimum-cost assignment between its
+    riders and the available drivers, where the cost of a pair is the
+    driver's travel time to the rider. Pairs that could not meet before the
+    rider cancels, or whose travel time exceeds <max_travel_time>, are
+    pruned. Batch riders who are not matched stay on the waiting list.
+    Travel times are measured as by Driver.get_travel_time, so on roads the
+    batch is matched by the same distances as by a Dispatcher.
+
+    A driver who requests a rider is still given the rider who has waited
+    longest, straight away.
+    """
+
+    # === Private Attributes ===
+    _window: int
+    #     The time between a batch's first request and its match.
+    _max_travel_time: Optional[int]
+    #     The longest travel time of a pair that may be matched, or None for
+    #     no limit.
+    _batch: OrderedDict
+    #     The riders in the current batch, keyed by rider id, with the time
+    #     by which each must be picked up before they cancel.
+    _match_time: Optional[int]
+    #     The time at which the current batch will be matched, or None if no
+    #     batch is open.
+
+    def __init__(self, window: int = 0,
+                 max_travel_time: Optional[int] = None,
+                 oracle: Optional[DistanceOracle] = None) -> None:
+        """Initialize a BatchDispatcher.
+
+        oracle: The distances on the roads, which registered drivers travel
+            by. Defaults to None, for an open grid.
+
+        Precondition: window >= 0
+        """
+        super().__init__(oracle)
+        self._window = window
+        self._max_travel_time = max_travel_time
+        self._batch = OrderedDict()
+        self._match_time = None
+
+    def _request_driver(self, rider: Rider) -> Optional[Driver]:
+        """Add the rider to the waiting list, to be matched with the rest of
+        the batch, and return None.
+
+        """
+        self.riders[rider.id] = rider
+        return None
+
+    def batch_match_time(self, rider: Rider, timestamp: int) -> Optional[int]:
+        """Add <rider>, who requested a driver at <timestamp>, to the open
+        batch. Return the time the batch will be matched if this request
+        opened it, and None otherwise.
+
+        """
+        self._batch[rider.id] = (rider, timestamp + rider.patience)
+        if self._match_time is not None:
+            return None
+        self._match_time = timestamp + self._window
+        return self._match_time
+
+    def match_batch(self, timestamp: int) -> List[Tuple[Rider, Driver]]:
+        """Match the riders of the open batch who are still waiting with
+        available drivers at <timestamp>, minimizing the total travel time,
+        and return the matched (rider, driver) pairs.
+
+        """
+        batch = [(rider, deadline) for rider, deadline in self._batch.values()
+                 if rider.id in self.riders]
+        self._batch = OrderedDict()
+        self._match_time = None
+        drivers = list(self._activdrivers)
+        if not batch or not drivers:
+            return []
+
+        cost = travel_times([rider for rider, _ in batch], drivers,
+                            self._oracle)
+        limit = np.array([deadline - timestamp for _, deadline in batch])
+        # A driver who arrives when the rider cancels arrives too late.
+        feasible = cost < limit[:, np.newaxis]
+        if self._max_travel_time is not None:
+            feasible &= cost <= self._max_travel_time
+        # Drop the riders and drivers that are in no feasible pair.
+        rows = np.flatnonzero(feasible.any(axis=1))
+        cols = np.flatnonzero(feasible.any(axis=0))
+        if not len(rows):
+            return []
+        cost = cost[np.ix_(rows, cols)]
+        feasible = feasible[np.ix_(rows, cols)]
+        # Infeasible pairs get a cost above that of any set of feasible
+        # pairs, so the most feasible pairs possible are matched.
+        infeasible = int(cost[feasible].max() + 1) * min(cost.shape) + 1
+        cost = np.where(feasible, cost, infeasible)
+
+        matches = []
+        for i, j in zip(*min_cost_assignment(cost)):
+            if feasible[i, j]:
+                rider, driver = batch[rows[i]][0], drivers[cols[j]]
+                del self.riders[rider.id]
+                self._activdrivers.remove(driver)
+                matches.append((rider, driver))
+        return matches
+
+
+def travel_times(riders: List[Rider], drivers: List[Driver],
+                 oracle: Optional[DistanceOracle] = None) -> np.ndarray:
+    """Return the matrix of travel times from each driver in <drivers> to the
+    origin of each rider in <riders>, with one row per rider.
+
+    The travel times are those of Driver.get_travel_time. On an open grid,
+    where <oracle> is None, they are computed in one vectorized pass. On
+    roads, the drivers travel by <oracle>, and each time is asked of its
+    driver. A driver the roads do not lead from to a rider is given a
+    travel time of UNREACHABLE, so the pair is never feasible.
+
+    >>> from location import Location
+    >>> from roads import RoadNetwork
+    >>> roads = RoadNetwork(3, 3)
+    >>> roads.block(Location(1, 1))
+    >>> roads.one_way(Location(0, 0), Location(0, 1))
+    >>> oracle = DistanceOracle(roads)
+    >>> driver = Driver("Amaranth", Location(0, 1), 1)
+    >>> rider = Rider("Cerise", 10, Location(0, 0), Location(2, 2))
+    >>> travel_times([rider], [driver]).tolist()
+    [[1]]
+    >>> driver.set_distance_oracle(oracle)
+    >>> travel_times([rider], [driver], oracle).tolist()
+    [[7]]
+
+    A driver at a dead end cannot reach anyone:
+
+    >>> roads = RoadNetwork(3, 3)
+    >>> roads.one_way(Location(0, 1), Location(0, 0))
+    >>> roads.one_way(Location(1, 0), Location(0, 0))
+    >>> oracle = DistanceOracle(roads)
+    >>> stuck = Driver("Bergamot", Location(0, 0), 1)
+    >>> for each in (driver, stuck):
+    ...     each.set_distance_oracle(oracle)
+    >>> rider = Rider("Dun", 10, Location(2, 2), Location(1, 1))
+    >>> travel_times([rider], [driver, stuck], oracle).tolist() == [
+    ...     [3, UNREACHABLE]]
+    True
+    """
+    if oracle is not None:
+        times = np.array([[driver.get_travel_time(rider.origin)
+                           for driver in drivers] for rider in riders],
+                         dtype=np.float64).reshape(len(riders), len(drivers))
+        return np.minimum(times, UNREACHABLE).astype(np.int64)
+    origin = np.array([(r.origin.rows, r.origin.columns) for r in riders])
+    where = np.array([(d.location.rows, d.location.columns) for d in drivers])
+    speed = np.array([d.get_speed() for d in drivers])
+    dist = (np.abs(origin[:, np.newaxis, 0] - where[np.newaxis, :, 0])
+            + np.abs(origin[:, np.newaxis, 1] - where[np.newaxis, :, 1]))
+    # np.round and round both round halves to even.
+    return np.round(dist / speed).astype(np.int64)
+
+
+def min_cost_assignment(cost: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the row and column indices of a minimum-cost assignment for
+    the rectangular <cost> matrix, which assigns min(rows, columns) pairs.
+
+    This is the Hungarian algorithm with shortest augmenting paths, which
+    takes O(n^2 m) time for n = min(rows, columns) and m = max(rows,
+    columns).
+
+    >>> rows, cols = min_cost_assignment(np.array([[4, 1, 3], [2, 0, 5],
+    ...                                            [3, 2, 2]]))
+    >>> rows.tolist(), cols.tolist()
+    ([0, 1, 2], [1, 0, 2])
+    """
+    if cost.shape[0] > cost.shape[1]:
+        cols, rows = min_cost_assignment(cost.T)
+        order = np.argsort(rows)
+        return rows[order], cols[order]
+
+    n, m = cost.shape
+    cost = cost.astype(np.float64)
+    # Index 0 of u, v and the column arrays is a sentinel, so rows and
+    # columns are numbered from 1.
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    owner = np.zeros(m + 1, dtype=np.int64)
+    way = np.zeros(m + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        owner[0] = i
+        col = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while owner[col] != 0:
+            used[col] = True
+            row = owner[col]
+            reduced = cost[row - 1] - u[row] - v[1:]
+            better = ~used[1:] & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = col
+            masked = np.where(used, np.inf, minv)
+            nxt = int(np.argmin(masked))
+            delta = masked[nxt]
+            u[owner[used]] += delta
+            v[used] -= delta
+            minv[~used] -= delta
+            col = nxt
+        while col:
+            prev = way[col]
+            owner[col] = owner[prev]
+            col = prev
+    cols = np.flatnonzero(owner[1:])
+    rows = owner[1:][cols] - 1
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={'extra-imports': ['collections', 'typing', 'numpy',
+                                  'dispatcher', 'driver', 'rider',
+                                  'roads']})
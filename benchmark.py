@@ -0,0 +1,274 @@
+"""Throughput benchmarks for the simulation.
+
+Each benchmark scenario generates a seeded synthetic event file and runs a
+Simulation on it, recording the number of events processed per second, the
+peak memory allocated, and the time spent in each subsystem: the event
+queue, the dispatcher and the monitor. Each scenario is run with each kind
+of event queue, so that the queues can be compared. Results are compared to
+a stored baseline, so that regressions show up.
+
+Timings of a single run vary by a quarter or more from run to run, so each
+benchmark is timed over several runs and the fastest is kept, both in the
+results and in the baseline. The fastest run is the one least disturbed by
+the rest of the machine. The runs of a scenario with each kind of queue
+take turns, so that a machine whose speed drifts over minutes slows every
+queue alike, and their results stay comparable.
+
+Run this module to benchmark every scenario:
+
+    python benchmark.py                 # compare to benchmark_baseline.json
+    python benchmark.py --save          # replace the stored baseline
+    python benchmark.py -s small -s dense
+    python benchmark.py -q calendar     # only with a CalendarQueue
+    python benchmark.py -r 1            # time a single run of each
+    python benchmark.py --lint          # check the module with python_ta
+
+=== Constants ===
+SCENARIOS: The benchmark scenarios, keyed by name.
+QUEUES: Functions returning the empty event queues to benchmark, keyed by
+    name. Results with the "heap" queue are named after their scenario, and
+    those with another queue after their scenario and queue, as in
+    "small/calendar".
+BASELINE: The default file that baseline results are stored in.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from operator import attrgetter, methodcaller
+from typing import Callable, Dict, List, Optional
+
+from container import CalendarQueue, Container, PriorityQueue
+from dispatcher import Dispatcher
+from event import create_event_list
+from generator import Workload, generate
+from monitor import Monitor
+from simulation import Simulation
+
+SCENARIOS = {
+    "small": Workload(rows=30, columns=30, drivers=50, riders=5000,
+                      duration=5000),
+    "dense": Workload(rows=100, columns=100, drivers=2000, riders=20000,
+                      duration=4000, driver_ramp=100,
+                      speeds={1: 0.5, 2: 0.3, 4: 0.2}),
+    "hotspot": Workload(rows=300, columns=300, drivers=500, riders=20000,
+                        duration=5000, arrival="rush",
+                        hotspots=[(60, 60, 3.0, 15.0), (220, 180, 1.0, 30.0)],
+                        hotspot_fraction=0.7, speeds={2: 0.7, 5: 0.3},
+                        patience="exponential", patience_range=(20, 200)),
+}
+
+QUEUES = {
+    "heap": lambda: PriorityQueue(methodcaller('is_live')),
+    "calendar": lambda: CalendarQueue(attrgetter('timestamp'),
+                                      methodcaller('is_live')),
+}
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "benchmark_baseline.json")
+
+
+class _Timed:
+    """A proxy that forwards method calls to an object, timing each call.
+
+    === Public Attributes ===
+    elapsed: The total time spent in calls through this proxy, in seconds.
+    calls: The number of calls through this proxy, keyed by method name.
+
+    === Private Attributes ===
+    _target: The object that calls are forwarded to.
+    """
+
+    elapsed: float
+    calls: Dict[str, int]
+    _target: object
+
+    def __init__(self, target: object) -> None:
+        """Initialize a proxy for <target>.
+
+        """
+        self._target = target
+        self.elapsed = 0.0
+        self.calls = {}
+
+    def __getattr__(self, name: str) -> object:
+        """Return the attribute <name> of the target, timing it if it is a
+        method.
+
+        """
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        def timed(*args: object, **kwargs: object) -> object:
+            start = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                self.elapsed += time.perf_counter() - start
+                self.calls[name] = self.calls.get(name, 0) + 1
+        return timed
+
+
+def run_benchmark(workload: Workload, seed: int = 0,
+                  make_events: Optional[Callable[[], Container]] = None,
+                  repeats: int = 5) -> Dict[str, float]:
+    """Return benchmark results for a simulation of <workload>, generated
+    with the random seed <seed>, from the fastest of <repeats> runs.
+
+    make_events: Returns the empty event queue to simulate with. Defaults to
+        the queue a Simulation uses by default.
+
+    Precondition: repeats >= 1
+    """
+    if make_events is None:
+        make_events = QUEUES["heap"]
+    return run_queues(workload, seed, {"": make_events}, repeats)[""]
+
+
+def run_queues(workload: Workload, seed: int,
+               queues: Dict[str, Callable[[], Container]],
+               repeats: int = 5) -> Dict[str, Dict[str, float]]:
+    """Return benchmark results for a simulation of <workload>, generated
+    with the random seed <seed>, with each of the event queues made by
+    <queues>, keyed as in <queues>. Each result is from the fastest of
+    <repeats> runs, and the runs with each queue take turns.
+
+    Precondition: repeats >= 1
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "events.txt")
+        generate(workload, filename, seed)
+
+        best = {}
+        for _ in range(repeats):
+            for name, make_events in queues.items():
+                queue = _Timed(make_events())
+                dispatcher = _Timed(Dispatcher())
+                monitor = _Timed(Monitor())
+                initial_events = create_event_list(filename)
+                start = time.perf_counter()
+                Simulation(monitor, dispatcher, queue).run(initial_events)
+                seconds = time.perf_counter() - start
+                if name not in best or seconds < best[name][0]:
+                    best[name] = (seconds, queue, dispatcher, monitor)
+
+        results = {}
+        for name, make_events in queues.items():
+            seconds, queue, dispatcher, monitor = best[name]
+            # Measure memory in a separate run, since tracing slows it down.
+            tracemalloc.start()
+            Simulation(events=make_events()).run(create_event_list(filename))
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            processed = queue.calls.get("remove", 0)
+            results[name] = {"events": processed,
+                             "seconds": seconds,
+                             "events_per_sec": processed / seconds,
+                             "peak_mb": peak / 2 ** 20,
+                             "queue_s": queue.elapsed,
+                             "dispatcher_s": dispatcher.elapsed,
+                             "monitor_s": monitor.elapsed,
+                             "repeats": repeats}
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]],
+            baseline: Dict[str, Dict[str, float]],
+            tolerance: float = 0.2) -> List[str]:
+    """Return a description of each regression of <results> against
+    <baseline>: a scenario whose throughput fell, or whose peak memory rose,
+    by more than the fraction <tolerance>.
+
+    >>> compare({"a": {"events_per_sec": 70.0, "peak_mb": 1.0}},
+    ...         {"a": {"events_per_sec": 100.0, "peak_mb": 1.0}})
+    ['a: 70 events/sec, down from 100']
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        if result["events_per_sec"] < base["events_per_sec"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: {result['events_per_sec']:.0f} events/sec, "
+                f"down from {base['events_per_sec']:.0f}")
+        if result["peak_mb"] > base["peak_mb"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: {result['peak_mb']:.1f} MB peak, "
+                f"up from {base['peak_mb']:.1f}")
+    return regressions
+
+
+def _print_result(name: str, result: Dict[str, float]) -> None:
+    """Print the benchmark <result> named <name> on one line.
+
+    """
+    print(f"{name:18} {result['events']:>8} events "
+          f"{result['events_per_sec']:>10.0f} events/sec "
+          f"{result['peak_mb']:>8.1f} MB peak  "
+          f"queue {result['queue_s']:.2f}s  "
+          f"dispatcher {result['dispatcher_s']:.2f}s  "
+          f"monitor {result['monitor_s']:.2f}s")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the benchmarks named on the command line <argv>, report the
+    results and any regressions, and return the exit status.
+
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("-s", "--scenario", action="append",
+                        choices=sorted(SCENARIOS),
+                        help="a scenario to run (default: all)")
+    parser.add_argument("-q", "--queue", action="append",
+                        choices=sorted(QUEUES),
+                        help="an event queue to run with (default: all)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-r", "--repeats", type=int, default=5,
+                        help="runs to time, keeping the fastest")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save", action="store_true",
+                        help="store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    results = {}
+    queues = {queue: QUEUES[queue] for queue in args.queue or QUEUES}
+    for scenario in args.scenario or SCENARIOS:
+        by_queue = run_queues(SCENARIOS[scenario], args.seed, queues,
+                              args.repeats)
+        for queue, result in by_queue.items():
+            name = scenario if queue == "heap" else f"{scenario}/{queue}"
+            results[name] = result
+            _print_result(name, result)
+
+    if args.save:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+        return 0
+    if not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline) as file:
+        regressions = compare(results, json.load(file), args.tolerance)
+    for regression in regressions:
+        print("REGRESSION", regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['--lint']:
+        import python_ta
+        python_ta.check_all(
+            config={
+                'allowed-io': ['_print_result', 'main'],
+                'extra-imports': ['argparse', 'json', 'os', 'sys', 'tempfile',
+                                  'time', 'tracemalloc', 'operator', 'typing',
+                                  'container', 'dispatcher', 'event',
+                                  'generator', 'monitor', 'simulation']})
+    else:
+        sys.exit(main())
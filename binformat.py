@@ -0,0 +1,175 @@
+"""A compact binary format for event files.
+
+An event file in the text format of the assignment handout can be converted
+once into a binary file of fixed-width records, which is then loaded
+through a read-only memory map without splitting any strings. Several
+processes reading the same binary file share its pages.
+
+A binary event file is laid out as follows, with all integers
+little-endian:
+
+    header:  magic (8 bytes), version (uint32), record count (uint64),
+             offset of the id table (uint64)
+    records: one fixed-width record per event, in timestamp order
+    ids:     id count (uint32), then for each id its length in bytes
+             (uint16) followed by its UTF-8 encoding
+
+Each record holds the timestamp (int64), the index of the actor's id in the
+id table (uint32), the row and column of the location or origin (int32),
+the row and column of the destination (int32, zero for drivers), the speed
+or patience (int32), and the event kind (uint8).
+
+=== Constants ===
+DRIVER_REQUEST: The record kind of a DriverRequest event.
+RIDER_REQUEST: The record kind of a RiderRequest event.
+"""
+
+import mmap
+import struct
+from typing import Dict, Iterator, List, Tuple
+
+from driver import Driver
+from event import Event, DriverRequest, RiderRequest, stream_events
+from location import Location
+from rider import Rider
+
+DRIVER_REQUEST = 0
+RIDER_REQUEST = 1
+
+_MAGIC = b"RIDEEVT\0"
+_VERSION = 1
+_HEADER = struct.Struct("<8sIQQ")
+_RECORD = struct.Struct("<qIiiiiiB3x")
+_ID_COUNT = struct.Struct("<I")
+_ID_LENGTH = struct.Struct("<H")
+
+# The NumPy layout of a record, used by read_arrays.
+_RECORD_FIELDS = [("timestamp", "<i8"), ("id", "<u4"), ("row", "<i4"),
+                  ("column", "<i4"), ("dest_row", "<i4"),
+                  ("dest_column", "<i4"), ("value", "<i4"), ("kind", "u1"),
+                  ("padding", "V3")]
+
+
+def convert(text_filename: str, binary_filename: str) -> int:
+    """Convert the event file <text_filename> to a binary event file
+    called <binary_filename>. Return the number of events converted.
+
+    The events are written in timestamp order, with ties in file order, so
+    the binary file can be passed straight to Simulation.run.
+
+    Precondition: the file stored at <text_filename> is in the format
+    specified by the assignment handout.
+    """
+    ids = {}
+    count = 0
+    with open(binary_filename, "wb") as file:
+        file.write(_HEADER.pack(_MAGIC, _VERSION, 0, 0))
+        for event in stream_events(text_filename):
+            file.write(_pack(event, ids))
+            count += 1
+        id_offset = file.tell()
+        file.write(_ID_COUNT.pack(len(ids)))
+        for identifier in ids:
+            encoded = identifier.encode("utf-8")
+            file.write(_ID_LENGTH.pack(len(encoded)))
+            file.write(encoded)
+        file.seek(0)
+        file.write(_HEADER.pack(_MAGIC, _VERSION, count, id_offset))
+    return count
+
+
+def read_events(filename: str) -> Iterator[Event]:
+    """Yield the events in the binary event file <filename>, in timestamp
+    order.
+
+    """
+    with open(filename, "rb") as file, \
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        count, id_offset = _read_header(mapped)
+        ids = _read_ids(mapped, id_offset)
+        end = _HEADER.size + count * _RECORD.size
+        records = memoryview(mapped)[_HEADER.size:end]
+        try:
+            for (timestamp, index, row, col, dest_row, dest_col, value,
+                 kind) in _RECORD.iter_unpack(records):
+                if kind == DRIVER_REQUEST:
+                    yield DriverRequest(timestamp, Driver(
+                        ids[index], Location(row, col), value))
+                else:
+                    yield RiderRequest(timestamp, Rider(
+                        ids[index], value, Location(row, col),
+                        Location(dest_row, dest_col)))
+        finally:
+            records.release()
+
+
+def read_arrays(filename: str) -> Tuple[object, List[str]]:
+    """Return the records in the binary event file <filename> as a NumPy
+    structured array, along with the list of actor ids that its id field
+    indexes.
+
+    The array is a read-only view of a memory map of the file, so no record
+    is copied until it is used. Needs NumPy.
+    """
+    import numpy as np
+
+    with open(filename, "rb") as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    count, id_offset = _read_header(mapped)
+    ids = _read_ids(mapped, id_offset)
+    records = np.frombuffer(mapped, dtype=np.dtype(_RECORD_FIELDS),
+                            count=count, offset=_HEADER.size)
+    return records, ids
+
+
+def _pack(event: Event, ids: Dict[str, int]) -> bytes:
+    """Return the binary record for <event>, adding the id of its actor to
+    <ids> if it is not already there.
+
+    """
+    if isinstance(event, DriverRequest):
+        actor = event.driver
+        origin, dest = actor.location, Location(0, 0)
+        kind, value = DRIVER_REQUEST, actor.get_speed()
+    else:
+        actor = event.rider
+        origin, dest = actor.origin, actor.dest
+        kind, value = RIDER_REQUEST, actor.patience
+    index = ids.setdefault(actor.id, len(ids))
+    return _RECORD.pack(event.timestamp, index, origin.rows, origin.columns,
+                        dest.rows, dest.columns, value, kind)
+
+
+def _read_header(mapped: mmap.mmap) -> Tuple[int, int]:
+    """Return the record count and id table offset of the binary event file
+    mapped by <mapped>.
+
+    """
+    magic, version, count, id_offset = _HEADER.unpack_from(mapped, 0)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError("Not a binary event file, or an unsupported version")
+    return count, id_offset
+
+
+def _read_ids(mapped: mmap.mmap, offset: int) -> List[str]:
+    """Return the id table that starts at <offset> in <mapped>.
+
+    """
+    (count,) = _ID_COUNT.unpack_from(mapped, offset)
+    offset += _ID_COUNT.size
+    ids = []
+    for _ in range(count):
+        (length,) = _ID_LENGTH.unpack_from(mapped, offset)
+        offset += _ID_LENGTH.size
+        ids.append(mapped[offset:offset + length].decode("utf-8"))
+        offset += length
+    return ids
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={
+            'allowed-io': ['convert', 'read_events', 'read_arrays'],
+            'extra-imports': ['mmap', 'struct', 'typing', 'numpy', 'driver',
+                              'event', 'location', 'rider']})
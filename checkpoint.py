@@ -0,0 +1,400 @@
+"""Checkpoints of a running simulation.
+
+A Simulation stopped part way through a run, with Simulation.run(...,
+until=...), can be saved to a checkpoint file and loaded again later, to
+resume the run or to start several experiments from the same warmed-up
+state. A checkpoint holds the pending events, the state of every rider and
+driver they refer to, the waiting and available lists of the dispatcher,
+and the totals of the monitor.
+
+Rather than pickling the object graph, each kind of object is written as a
+table of fixed-width records, in which riders, drivers and ids refer to
+each other by index, so saving and loading stay fast with millions of
+objects. A checkpoint file is laid out as follows, with all integers
+little-endian, and each table being a record count (uint64) followed by
+its records:
+
+    header:     magic (8 bytes), version (uint32)
+    ids:        the length in bytes (uint64) of the ids, then the ids in
+                UTF-8, separated by newlines, which no id contains
+    riders:     a table of riders
+    drivers:    a table of drivers
+    events:     a table of the live events in the event queue, in the order
+                they were added
+    dispatcher: tables of the registered drivers, the available drivers in
+                the order they became available, and the waiting riders in
+                the order they started waiting
+    monitor:    the monitor kind (uint8), then its history or totals
+
+Only a Dispatcher, and a Monitor or StreamingMonitor, can be saved; the
+event queue is loaded into the queue the restored Simulation is given. A
+simulation still reading its initial events lazily, from an iterator such
+as event.stream_events, cannot be saved, since the rest of its input is not
+part of its state; run it on a list of initial events to checkpoint it.
+"""
+
+import struct
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from container import Container
+from dispatcher import Dispatcher
+from driver import Driver
+from event import (Event, RiderRequest, DriverRequest, Cancellation, Pickup,
+                   Dropoff)
+from location import Location
+from monitor import (Monitor, StreamingMonitor, RIDER, DRIVER, REQUEST,
+                     CANCEL, PICKUP, DROPOFF)
+from rider import Rider, WAITING, CANCELLED, SATISFIED
+from roads import DistanceOracle
+from simulation import Simulation
+
+_MAGIC = b"RIDECKP\0"
+_VERSION = 2
+_HEADER = struct.Struct("<8sI")
+_COUNT = struct.Struct("<Q")
+
+# id, patience, origin row and column, destination row and column, status.
+_RIDER = struct.Struct("<IiiiiiB")
+# id, speed, location row and column, destination row and column, whether
+# there is a destination, whether the driver is idle, rider id or -1.
+_DRIVER = struct.Struct("<IiiiiiBBi")
+# timestamp, kind, whether cancelled, rider index or -1, driver index or -1.
+_EVENT = struct.Struct("<qBBii")
+# A rider or driver index.
+_INDEX = struct.Struct("<I")
+# category, id, time, description, location row and column.
+_ACTIVITY = struct.Struct("<BIqBii")
+# total wait time, wait count, total distance, ride distance.
+_TOTALS = struct.Struct("<qqqq")
+# id, time of first activity, number of activities.
+_RIDER_TOTALS = struct.Struct("<Iqq")
+# id, location row and column, description of the latest activity.
+_DRIVER_TOTALS = struct.Struct("<IiiB")
+
+_EVENT_KINDS = (RiderRequest, DriverRequest, Cancellation, Pickup, Dropoff)
+_STATUSES = (WAITING, CANCELLED, SATISFIED)
+_CATEGORIES = (RIDER, DRIVER)
+_DESCRIPTIONS = (REQUEST, CANCEL, PICKUP, DROPOFF)
+_FULL_MONITOR = 0
+_STREAMING_MONITOR = 1
+
+
+class _Tables:
+    """The ids, riders and drivers of a checkpoint, each numbered by its
+    position in its table.
+
+    === Public Attributes ===
+    ids: Every id, keyed by id, with its number.
+    riders: Every rider, keyed by object identity, with its number and the
+        rider.
+    drivers: Every driver, keyed by object identity, with its number and
+        the driver.
+    """
+
+    ids: Dict[str, int]
+    riders: Dict[int, Tuple[int, Rider]]
+    drivers: Dict[int, Tuple[int, Driver]]
+
+    def __init__(self) -> None:
+        """Initialize empty tables.
+
+        """
+        self.ids = {}
+        self.riders = {}
+        self.drivers = {}
+
+    def id(self, identifier: str) -> int:
+        """Return the number of <identifier>, adding it if it is new.
+
+        """
+        return self.ids.setdefault(identifier, len(self.ids))
+
+    def rider(self, rider: Rider) -> int:
+        """Return the number of <rider>, adding it if it is new.
+
+        """
+        entry = self.riders.get(id(rider))
+        if entry is None:
+            entry = self.riders[id(rider)] = (len(self.riders), rider)
+            self.id(rider.id)
+        return entry[0]
+
+    def driver(self, driver: Driver) -> int:
+        """Return the number of <driver>, adding it if it is new.
+
+        """
+        entry = self.drivers.get(id(driver))
+        if entry is None:
+            entry = self.drivers[id(driver)] = (len(self.drivers), driver)
+            self.id(driver.id)
+            # pylint: disable=protected-access
+            if driver._rider is not None:
+                self.id(driver._rider)
+        return entry[0]
+
+
+def save(simulation: Simulation, filename: str) -> None:
+    """Save the state of <simulation> to a checkpoint file called
+    <filename>.
+
+    <simulation> can carry on running afterwards. Raise ValueError if it
+    has initial events left to read from a lazily read source.
+    """
+    # pylint: disable=protected-access
+    dispatcher = simulation._dispatcher
+    monitor = simulation._monitor
+    if type(dispatcher) is not Dispatcher:
+        raise TypeError(f"Cannot save a {type(dispatcher).__name__}")
+    if type(monitor) not in (Monitor, StreamingMonitor):
+        raise TypeError(f"Cannot save a {type(monitor).__name__}")
+
+    if simulation._pending is not None:
+        raise ValueError("Cannot save a simulation with initial events left "
+                         "to read from a lazily read source")
+
+    tables = _Tables()
+    event_rows = [_event_row(event, tables) for event in simulation._events]
+    registered = [tables.driver(driver)
+                  for driver in dispatcher.drivers.values()]
+    available = [tables.driver(driver)
+                 for driver in dispatcher._activdrivers]
+    waiting = [tables.rider(rider) for rider in dispatcher.riders.values()]
+    monitor_rows = _monitor_rows(monitor, tables)
+
+    with open(filename, "wb") as file:
+        file.write(_HEADER.pack(_MAGIC, _VERSION))
+        encoded = "\n".join(tables.ids).encode("utf-8")
+        file.write(_COUNT.pack(len(encoded)))
+        file.write(encoded)
+        _write_table(file, _RIDER, [
+            (tables.ids[rider.id], rider.patience, rider.origin.rows,
+             rider.origin.columns, rider.dest.rows, rider.dest.columns,
+             _STATUSES.index(rider.status))
+            for _, rider in tables.riders.values()])
+        _write_table(file, _DRIVER, [
+            _driver_row(driver, tables)
+            for _, driver in tables.drivers.values()])
+        _write_table(file, _EVENT, event_rows)
+        for indices in (registered, available, waiting):
+            _write_table(file, _INDEX, [(index,) for index in indices])
+        file.write(bytes([_monitor_kind(monitor)]))
+        for table, rows in monitor_rows:
+            _write_table(file, table, rows)
+
+
+def load(filename: str, events: Optional[Container] = None,
+         oracle: Optional[DistanceOracle] = None) -> Simulation:
+    """Return the simulation saved in the checkpoint file <filename>.
+
+    Resume it with run([]).
+
+    events: The empty event queue to schedule events in, as for Simulation.
+    oracle: The distances on the roads that drivers travel by, as for
+        Dispatcher. A checkpoint does not hold the road network, so pass
+        the oracle the saved simulation used.
+    """
+    with open(filename, "rb") as file:
+        data = memoryview(file.read())
+    magic, version = _HEADER.unpack_from(data, 0)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError("Not a checkpoint file, or an unsupported version")
+    offset = _HEADER.size
+    (length,) = _COUNT.unpack_from(data, offset)
+    offset += _COUNT.size
+    ids = str(data[offset:offset + length], "utf-8").split("\n")
+    offset += length
+
+    rows, offset = _read_table(data, offset, _RIDER)
+    riders = []
+    for index, patience, row, col, dest_row, dest_col, status in rows:
+        rider = Rider(ids[index], patience, Location(row, col),
+                      Location(dest_row, dest_col))
+        rider.status = _STATUSES[status]
+        riders.append(rider)
+    rows, offset = _read_table(data, offset, _DRIVER)
+    drivers = [_driver(row, ids) for row in rows]
+    if oracle is not None:
+        for driver in drivers:
+            driver.set_distance_oracle(oracle)
+
+    rows, offset = _read_table(data, offset, _EVENT)
+    queued = [_event(row, riders, drivers) for row in rows]
+
+    dispatcher = Dispatcher(oracle)
+    rows, offset = _read_table(data, offset, _INDEX)
+    for (index,) in rows:
+        dispatcher.drivers[drivers[index].id] = drivers[index]
+    rows, offset = _read_table(data, offset, _INDEX)
+    for (index,) in rows:
+        # No rider is waiting yet, so each driver becomes available.
+        dispatcher.request_rider(drivers[index])
+    rows, offset = _read_table(data, offset, _INDEX)
+    for (index,) in rows:
+        dispatcher.riders[riders[index].id] = riders[index]
+
+    kind = data[offset]
+    offset += 1
+    if kind == _FULL_MONITOR:
+        monitor = Monitor()
+        rows, offset = _read_table(data, offset, _ACTIVITY)
+        for category, index, time, description, row, col in rows:
+            monitor.notify(time, _CATEGORIES[category],
+                           _DESCRIPTIONS[description], ids[index],
+                           Location(row, col))
+    else:
+        monitor = _load_streaming(data, offset, ids)
+
+    simulation = Simulation(monitor, dispatcher, events)
+    # pylint: disable=protected-access
+    simulation._events.add_all(queued)
+    return simulation
+
+
+def _event_row(event: Event, tables: _Tables) -> tuple:
+    """Return the record for <event>, adding its rider and driver to
+    <tables>.
+
+    """
+    if type(event) not in _EVENT_KINDS:
+        raise TypeError(f"Cannot save a {type(event).__name__}")
+    rider = getattr(event, "rider", None)
+    driver = getattr(event, "driver", None)
+    return (event.timestamp, _EVENT_KINDS.index(type(event)),
+            event.cancelled,
+            -1 if rider is None else tables.rider(rider),
+            -1 if driver is None else tables.driver(driver))
+
+
+def _driver_row(driver: Driver, tables: _Tables) -> tuple:
+    """Return the record for <driver>.
+
+    """
+    # pylint: disable=protected-access
+    dest = driver.destination
+    return (tables.ids[driver.id], driver.get_speed(), driver.location.rows,
+            driver.location.columns,
+            0 if dest is None else dest.rows,
+            0 if dest is None else dest.columns,
+            dest is not None, driver.is_idle,
+            -1 if driver._rider is None else tables.ids[driver._rider])
+
+
+def _monitor_kind(monitor: Monitor) -> int:
+    """Return the kind of <monitor>.
+
+    """
+    if isinstance(monitor, StreamingMonitor):
+        return _STREAMING_MONITOR
+    return _FULL_MONITOR
+
+
+def _monitor_rows(monitor: Monitor, tables: _Tables) -> List[tuple]:
+    """Return the (struct, records) tables holding the state of <monitor>,
+    adding its ids to <tables>.
+
+    """
+    # pylint: disable=protected-access
+    if isinstance(monitor, StreamingMonitor):
+        totals = (monitor._wait_time, monitor._wait_count,
+                  monitor._total_distance, monitor._ride_distance)
+        riders = [(tables.id(identifier), first, count)
+                  for identifier, (first, count) in monitor._riders.items()]
+        drivers = [(tables.id(identifier), location.rows, location.columns,
+                    _DESCRIPTIONS.index(description))
+                   for identifier, (location, description)
+                   in monitor._drivers.items()]
+        return [(_TOTALS, [totals]), (_RIDER_TOTALS, riders),
+                (_DRIVER_TOTALS, drivers)]
+    activities = []
+    for category, history in monitor._activities.items():
+        for identifier, actions in history.items():
+            index = tables.id(identifier)
+            for activity in actions:
+                activities.append(
+                    (_CATEGORIES.index(category), index, activity.time,
+                     _DESCRIPTIONS.index(activity.description),
+                     activity.location.rows, activity.location.columns))
+    return [(_ACTIVITY, activities)]
+
+
+def _load_streaming(data: memoryview, offset: int,
+                    ids: List[str]) -> StreamingMonitor:
+    """Return the StreamingMonitor whose tables start at <offset> in
+    <data>.
+
+    """
+    # pylint: disable=protected-access
+    monitor = StreamingMonitor()
+    rows, offset = _read_table(data, offset, _TOTALS)
+    (monitor._wait_time, monitor._wait_count, monitor._total_distance,
+     monitor._ride_distance) = rows[0]
+    rows, offset = _read_table(data, offset, _RIDER_TOTALS)
+    for index, first, count in rows:
+        monitor._riders[ids[index]] = [first, count]
+    rows, offset = _read_table(data, offset, _DRIVER_TOTALS)
+    for index, row, col, description in rows:
+        monitor._drivers[ids[index]] = (Location(row, col),
+                                        _DESCRIPTIONS[description])
+    return monitor
+
+
+def _driver(row: tuple, ids: List[str]) -> Driver:
+    """Return the driver stored in the record <row>.
+
+    """
+    # pylint: disable=protected-access
+    (index, speed, loc_row, loc_col, dest_row, dest_col, has_dest, is_idle,
+     rider) = row
+    driver = Driver(ids[index], Location(loc_row, loc_col), speed)
+    if has_dest:
+        driver.destination = Location(dest_row, dest_col)
+    driver.is_idle = bool(is_idle)
+    driver._rider = None if rider < 0 else ids[rider]
+    return driver
+
+
+def _event(row: tuple, riders: List[Rider], drivers: List[Driver]) -> Event:
+    """Return the event stored in the record <row>.
+
+    """
+    timestamp, kind, cancelled, rider, driver = row
+    cls = _EVENT_KINDS[kind]
+    if cls is DriverRequest:
+        event = DriverRequest(timestamp, drivers[driver])
+    elif cls in (Pickup, Dropoff):
+        event = cls(timestamp, riders[rider], drivers[driver])
+    else:
+        event = cls(timestamp, riders[rider])
+    event.cancelled = bool(cancelled)
+    return event
+
+
+def _write_table(file: BinaryIO, table: struct.Struct,
+                 rows: List[tuple]) -> None:
+    """Write <rows> to <file> as a table of <table> records.
+
+    """
+    file.write(_COUNT.pack(len(rows)))
+    file.write(b"".join([table.pack(*row) for row in rows]))
+
+
+def _read_table(data: memoryview, offset: int,
+                table: struct.Struct) -> Tuple[List[tuple], int]:
+    """Return the records of the table of <table> records that starts at
+    <offset> in <data>, and the offset just past it.
+
+    """
+    (count,) = _COUNT.unpack_from(data, offset)
+    offset += _COUNT.size
+    end = offset + count * table.size
+    return list(table.iter_unpack(data[offset:end])), end
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={
+            'allowed-io': ['save', 'load'],
+            'extra-imports': ['struct', 'typing', 'container', 'dispatcher',
+                              'driver', 'event', 'location', 'monitor',
+                              'rider', 'roads', 'simulation']})
@@ -0,0 +1,212 @@
+"""A columnar activity log for the simulation, backed by NumPy arrays.
+
+This module needs NumPy. The rest of the simulation does not, so it is only
+imported by code that asks for a ColumnarMonitor.
+
+=== Constants ===
+CATEGORY_CODES: The integer code stored for each activity category.
+DESCRIPTION_CODES: The integer code stored for each activity description.
+"""
+
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from location import Location
+from monitor import Monitor, RIDER, DRIVER, REQUEST, CANCEL, PICKUP, DROPOFF
+
+CATEGORY_CODES = {RIDER: 0, DRIVER: 1}
+DESCRIPTION_CODES = {REQUEST: 0, CANCEL: 1, PICKUP: 2, DROPOFF: 3}
+
+# The number of activities a new ColumnarMonitor has room for.
+_INITIAL_CAPACITY = 1024
+
+# The name and type of each column of the log.
+_COLUMNS = (("time", np.int64), ("category", np.int8),
+            ("description", np.int8), ("actor", np.int32),
+            ("row", np.int32), ("column", np.int32))
+
+
+class ColumnarMonitor(Monitor):
+    """A monitor that records activities in growable columnar arrays.
+
+    Each activity is stored as one row across six columns: timestamp,
+    category code, description code, actor index, and the row and column of
+    its location. Actor identifiers are interned per category, so the log
+    holds no Python object per activity. Reports are computed with
+    vectorized NumPy over the columns, and match those of a Monitor.
+    """
+
+    # === Private Attributes ===
+    _columns: Dict[str, np.ndarray]
+    #       The columns of the log, keyed by name. Only the first _size
+    #       entries of each column are in use.
+    _size: int
+    #       The number of activities recorded.
+    _actors: Dict[str, Dict[str, int]]
+    #       For each category, the index assigned to each actor identifier.
+    _names: Dict[str, List[str]]
+    #       For each category, the actor identifiers in index order.
+
+    def __init__(self) -> None:
+        """Initialize a ColumnarMonitor.
+
+        """
+        super().__init__()
+        self._columns = {name: np.empty(_INITIAL_CAPACITY, dtype)
+                         for name, dtype in _COLUMNS}
+        self._size = 0
+        self._actors = {RIDER: {}, DRIVER: {}}
+        self._names = {RIDER: [], DRIVER: []}
+
+    def __str__(self) -> str:
+        """Return a string representation.
+
+        """
+        return "ColumnarMonitor ({} drivers, {} riders)".format(
+            len(self._names[DRIVER]), len(self._names[RIDER]))
+
+    def __len__(self) -> int:
+        """Return the number of activities recorded.
+
+        """
+        return self._size
+
+    def notify(self, timestamp: int, category: str, description: str,
+               identifier: str, location: Location) -> None:
+        """Notify the monitor of the activity.
+
+        timestamp: The time of the activity.
+        category: The category (DRIVER or RIDER) for the activity.
+        description: A description (REQUEST | CANCEL | PICKUP | DROP_OFF)
+            of the activity.
+        identifier: The identifier for the actor.
+        location: The location of the activity.
+        """
+        actors = self._actors[category]
+        actor = actors.get(identifier)
+        if actor is None:
+            actor = actors[identifier] = len(actors)
+            self._names[category].append(identifier)
+        if self._size == len(self._columns["time"]):
+            self._grow()
+        i = self._size
+        columns = self._columns
+        columns["time"][i] = timestamp
+        columns["category"][i] = CATEGORY_CODES[category]
+        columns["description"][i] = DESCRIPTION_CODES[description]
+        columns["actor"][i] = actor
+        columns["row"][i] = location.rows
+        columns["column"][i] = location.columns
+        self._size += 1
+
+    def column(self, name: str) -> np.ndarray:
+        """Return a read-only view of the column called <name>, holding one
+        entry per recorded activity.
+
+        name: One of time, category, description, actor, row or column.
+        """
+        view = self._columns[name][:self._size]
+        view.flags.writeable = False
+        return view
+
+    def driver_distances(self) -> Dict[str, Tuple[int, int]]:
+        """Return the total distance and the distance on rides that each
+        driver has driven, keyed by driver id.
+
+        """
+        total, ride = self._driver_distance_arrays()
+        return {name: (int(total[i]), int(ride[i]))
+                for i, name in enumerate(self._names[DRIVER])}
+
+    def _average_wait_time(self) -> float:
+        """Return the average wait time of riders that have either been picked
+        up or have cancelled their ride.
+
+        """
+        time, _, _, starts, counts = self._grouped(RIDER)
+        # The first activity of a rider is REQUEST, and the second is PICKUP
+        # or CANCEL. The wait time is the difference between the two.
+        finished = starts[counts >= 2]
+        if not len(finished):
+            return 0.0
+        wait_time = int(np.sum(time[finished + 1] - time[finished]))
+        return wait_time / len(finished)
+
+    def _average_total_distance(self) -> float:
+        """Return the average distance drivers have driven.
+
+        """
+        if not self._names[DRIVER]:
+            return 0.0
+        total, _ = self._driver_distance_arrays()
+        return int(total.sum()) / len(self._names[DRIVER])
+
+    def _average_ride_distance(self) -> float:
+        """Return the average distance drivers have driven on rides.
+
+        """
+        if not self._names[DRIVER]:
+            return 0.0
+        _, ride = self._driver_distance_arrays()
+        return int(ride.sum()) / len(self._names[DRIVER])
+
+    def _driver_distance_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Return arrays of the total distance and the distance on rides that
+        each driver has driven, indexed by driver index.
+
+        """
+        n = len(self._names[DRIVER])
+        _, order, actor, _, _ = self._grouped(DRIVER)
+        rows = self._columns["row"][:self._size][order]
+        cols = self._columns["column"][:self._size][order]
+        desc = self._columns["description"][:self._size][order]
+        # Consecutive activities of the same driver form one segment.
+        same = actor[1:] == actor[:-1]
+        dist = (np.abs(np.diff(rows.astype(np.int64)))
+                + np.abs(np.diff(cols.astype(np.int64))))
+        dist = np.where(same, dist, 0)
+        on_ride = same & (desc[:-1] == DESCRIPTION_CODES[PICKUP]) \
+            & (desc[1:] == DESCRIPTION_CODES[DROPOFF])
+        total = np.bincount(actor[:-1], weights=dist, minlength=n)
+        ride = np.bincount(actor[:-1], weights=np.where(on_ride, dist, 0),
+                           minlength=n)
+        return total.astype(np.int64), ride.astype(np.int64)
+
+    def _grouped(self, category: str) -> Tuple[np.ndarray, np.ndarray,
+                                               np.ndarray, np.ndarray,
+                                               np.ndarray]:
+        """Return the activities of <category>, grouped by actor.
+
+        The result is a tuple of the timestamps of those activities grouped
+        by actor and in recorded order within each actor, the indices into
+        the log of those activities, their actor indices, the position of
+        the first activity of each actor, and the number of activities of
+        each actor.
+        """
+        size = self._size
+        mask = self._columns["category"][:size] == CATEGORY_CODES[category]
+        indices = np.flatnonzero(mask)
+        actor = self._columns["actor"][:size][indices]
+        order = indices[np.argsort(actor, kind="stable")]
+        actor = self._columns["actor"][order]
+        counts = np.bincount(actor, minlength=len(self._names[category]))
+        starts = np.cumsum(counts) - counts
+        return self._columns["time"][order], order, actor, starts, counts
+
+    def _grow(self) -> None:
+        """Double the capacity of every column.
+
+        """
+        for name, column in self._columns.items():
+            grown = np.empty(2 * len(column), column.dtype)
+            grown[:len(column)] = column
+            self._columns[name] = grown
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={
+            'max-args': 6,
+            'extra-imports': ['typing', 'numpy', 'location', 'monitor']})
@@ -1,4 +1,13 @@
 """Containers of objects"""
+from collections import deque
+from heapq import heapify, heappop, heappush
+from itertools import count
+from operator import itemgetter
+from typing import Callable, Iterable, Iterator, List, Optional
+
+# The smallest number of stored items at which PriorityQueue and
+# CalendarQueue compact away items that are no longer live.
+_MIN_COMPACTION = 64
 
 
 class Container:
@@ -13,18 +22,48 @@ class Container:
         """
         raise NotImplementedError("Implemented in a subclass")
 
+    def add_all(self, items: Iterable) -> None:
+        """Add every item in <items> to this Container, in iteration order.
+
+        Subclasses may override this with a faster bulk load.
+        """
+        for item in items:
+            self.add(item)
+
     def remove(self) -> object:
         """Remove and return a single item from this Container.
 
         """
         raise NotImplementedError("Implemented in a subclass")
 
+    def peek(self) -> object:
+        """Return the item that remove() would return, without removing it.
+
+        Precondition: <self> should not be empty.
+        """
+        raise NotImplementedError("Implemented in a subclass")
+
     def is_empty(self) -> bool:
         """Return True iff this Container is empty.
 
         """
         raise NotImplementedError("Implemented in a subclass")
 
+    def __len__(self) -> int:
+        """Return the number of items stored in this Container, including
+        any that are no longer live but have not been discarded yet.
+
+        """
+        raise NotImplementedError("Implemented in a subclass")
+
+    def __iter__(self) -> Iterator:
+        """Yield the live items in this Container, without removing them,
+        in an order that add_all can restore an empty Container of the same
+        kind from.
+
+        """
+        raise NotImplementedError("Implemented in a subclass")
+
 
 class PriorityQueue(Container):
     """A queue of items that operates in priority order.
@@ -40,21 +79,38 @@ class PriorityQueue(Container):
     If x < y, then x has a *HIGHER* priority than y.
 
     All objects in the container must be of the same type.
+
+    A PriorityQueue may be given a <live> predicate. Items for which it
+    returns False are tombstones: they are never removed from the queue,
+    and are dropped in bulk once the queue has doubled in size since it was
+    last compacted.
     """
 
     # === Private Attributes ===
     _items: list
-    #     The items stored in the priority queue.
+    #     The items stored in the priority queue, as (item, sequence) pairs.
+    _counter: count
+    #     Source of insertion sequence numbers, used to break ties in FIFO
+    #     order.
+    _live: Optional[Callable[[object], bool]]
+    #     Returns False for items that should be skipped, or None if every
+    #     item is live.
+    _compact_at: int
+    #     The number of stored items at which the queue is next compacted.
     #
     # === Representation Invariants ===
-    # _items is a sorted list, where the first item in the queue is the
-    # item with the highest priority.
+    # _items is a binary min-heap, so _items[0] holds the item with the
+    # highest priority. No two pairs in _items share a sequence number.
 
-    def __init__(self) -> None:
+    def __init__(self,
+                 live: Optional[Callable[[object], bool]] = None) -> None:
         """Initialize an empty PriorityQueue.
 
         """
         self._items = []
+        self._counter = count()
+        self._live = live
+        self._compact_at = _MIN_COMPACTION
 
     def remove(self) -> object:
         """Remove and return the next item from this PriorityQueue.
@@ -75,7 +131,22 @@ class PriorityQueue(Container):
         >>> pq.remove()
         'yellow'
         """
-        return self._items.pop(0)
+        self._skip_dead()
+        return heappop(self._items)[0]
+
+    def peek(self) -> object:
+        """Return the next item in this PriorityQueue, without removing it.
+
+        Precondition: <self> should not be empty.
+
+        >>> pq = PriorityQueue()
+        >>> pq.add("red")
+        >>> pq.add("blue")
+        >>> pq.peek()
+        'blue'
+        """
+        self._skip_dead()
+        return self._items[0][0]
 
     def is_empty(self) -> bool:
         """
@@ -87,9 +158,38 @@ class PriorityQueue(Container):
         >>> pq.add("thing")
         >>> pq.is_empty()
         False
+        >>> pq = PriorityQueue(lambda item: item != "dead")
+        >>> pq.add("dead")
+        >>> pq.is_empty()
+        True
         """
+        self._skip_dead()
         return len(self._items) == 0
 
+    def __len__(self) -> int:
+        """Return the number of items stored in this PriorityQueue,
+        including tombstones that have not been discarded yet.
+
+        >>> pq = PriorityQueue()
+        >>> pq.add_all(["red", "blue"])
+        >>> len(pq)
+        2
+        """
+        return len(self._items)
+
+    def __iter__(self) -> Iterator:
+        """Yield the live items in this PriorityQueue in the order they were
+        added, without removing them.
+
+        >>> pq = PriorityQueue(lambda item: item != "dead")
+        >>> pq.add_all(["red", "dead", "blue"])
+        >>> list(pq)
+        ['red', 'blue']
+        """
+        for item, _ in sorted(self._items, key=itemgetter(1)):
+            if self._live is None or self._live(item):
+                yield item
+
     def add(self, item: object) -> None:
         """Add <item> to this PriorityQueue.
 
@@ -98,21 +198,307 @@ class PriorityQueue(Container):
         >>> pq.add("blue")
         >>> pq.add("red")
         >>> pq.add("green")
-        >>> pq._items
+        >>> pq._items[0]
+        ('blue', 1)
+        """
+        heappush(self._items, (item, next(self._counter)))
+        if len(self._items) >= self._compact_at:
+            self._compact()
+
+    def add_all(self, items: Iterable) -> None:
+        """Add every item in <items> to this PriorityQueue.
+
+        Items that compare equal are removed in the order they appear in
+        <items>. Loading an empty queue this way takes linear time.
+
+        >>> pq = PriorityQueue()
+        >>> pq.add_all(["yellow", "blue", "red", "green"])
+        >>> [pq.remove() for _ in range(4)]
         ['blue', 'green', 'red', 'yellow']
         """
-        if not self._items:
-            self._items.append(item)
-            return None
+        if self._items:
+            super().add_all(items)
         else:
-            for i in range(len(self._items)):
-                if item < self._items[i]:
-                    self._items.insert(i, item)
+            self._items = [(item, next(self._counter)) for item in items]
+            heapify(self._items)
+            self._compact_at = max(_MIN_COMPACTION, 2 * len(self._items))
+
+    def _skip_dead(self) -> None:
+        """Discard tombstones from the front of this PriorityQueue.
+
+        """
+        if self._live is not None:
+            while self._items and not self._live(self._items[0][0]):
+                heappop(self._items)
+
+    def _compact(self) -> None:
+        """Discard every tombstone in this PriorityQueue.
+
+        >>> pq = PriorityQueue(lambda item: item % 2 == 0)
+        >>> pq.add_all(range(10))
+        >>> pq._compact()
+        >>> sorted(item for item, _ in pq._items)
+        [0, 2, 4, 6, 8]
+        """
+        if self._live is not None:
+            self._items = [entry for entry in self._items
+                           if self._live(entry[0])]
+            heapify(self._items)
+        self._compact_at = max(_MIN_COMPACTION, 2 * len(self._items))
+
+
+class CalendarQueue(Container):
+    """A queue of items with integer priorities, such as event timestamps.
+
+    Items are removed in increasing order of <key>, and ties are resolved in
+    FIFO order, as in a PriorityQueue ordered by key. Instead of comparing
+    items, a CalendarQueue files each one in a wheel of buckets, one per
+    key in a span of <size> consecutive keys starting at the smallest key
+    not yet removed. Adding and removing items takes amortized constant
+    time, as long as most items are added a short horizon ahead. Items
+    beyond the span wait in an overflow heap, and move into the wheel as
+    the span advances; the wheel doubles in size whenever the overflow
+    holds more items than the wheel.
+
+    A CalendarQueue may be given a <live> predicate, which is used as in a
+    PriorityQueue.
+
+    >>> cq = CalendarQueue(len, size=4)
+    >>> cq.add_all(["red", "blue", "yellow", "green", "pink"])
+    >>> [cq.remove() for _ in range(5)]
+    ['red', 'blue', 'pink', 'green', 'yellow']
+    """
+
+    # === Private Attributes ===
+    _key: Callable[[object], int]
+    #     Returns the integer priority of an item.
+    _live: Optional[Callable[[object], bool]]
+    #     Returns False for items that should be skipped, or None if every
+    #     item is live.
+    _buckets: List[deque]
+    #     The wheel of buckets. The bucket for key k is _buckets[k % size],
+    #     for keys in the span _now <= k < _now + size.
+    _now: int
+    #     The smallest key in the span of the wheel.
+    _in_wheel: int
+    #     The number of items stored in the wheel.
+    _overflow: list
+    #     The items beyond the span of the wheel, as a heap of (key,
+    #     sequence, item) triples.
+    _counter: count
+    #     Source of sequence numbers for the overflow, used to break ties in
+    #     FIFO order.
+    _compact_at: int
+    #     The number of stored items at which the queue is next compacted.
+    #
+    # === Representation Invariants ===
+    # Every item in the wheel has a key in the span of the wheel, and is in
+    # the bucket for its key, after the items added before it. Every item
+    # in the overflow has a key beyond the span of the wheel.
+
+    def __init__(self, key: Callable[[object], int],
+                 live: Optional[Callable[[object], bool]] = None,
+                 size: int = 1024) -> None:
+        """Initialize an empty CalendarQueue whose wheel spans <size> keys.
+
+        Precondition: size > 0
+        """
+        self._key = key
+        self._live = live
+        self._buckets = [deque() for _ in range(size)]
+        self._now = 0
+        self._in_wheel = 0
+        self._overflow = []
+        self._counter = count()
+        self._compact_at = _MIN_COMPACTION
+
+    def add(self, item: object) -> None:
+        """Add <item> to this CalendarQueue.
+
+        """
+        key = self._key(item)
+        if key < self._now:
+            self._rewind(key)
+        size = len(self._buckets)
+        if key < self._now + size:
+            self._buckets[key % size].append(item)
+            self._in_wheel += 1
+        else:
+            heappush(self._overflow, (key, next(self._counter), item))
+            if len(self._overflow) > max(self._in_wheel, size):
+                self._resize(2 * size)
+        if self._in_wheel + len(self._overflow) >= self._compact_at:
+            self._compact()
+
+    def remove(self) -> object:
+        """Remove and return the next item from this CalendarQueue.
+
+        Precondition: <self> should not be empty.
+        """
+        bucket = self._front()
+        self._in_wheel -= 1
+        return bucket.popleft()
+
+    def peek(self) -> object:
+        """Return the next item in this CalendarQueue, without removing it.
+
+        Precondition: <self> should not be empty.
+        """
+        return self._front()[0]
+
+    def is_empty(self) -> bool:
+        """Return True iff this CalendarQueue has no live items.
+
+        >>> cq = CalendarQueue(len, lambda item: item != "dead")
+        >>> cq.add("dead")
+        >>> cq.is_empty()
+        True
+        """
+        return self._front() is None
+
+    def __len__(self) -> int:
+        """Return the number of items stored in this CalendarQueue,
+        including tombstones that have not been discarded yet.
+
+        """
+        return self._in_wheel + len(self._overflow)
+
+    def __iter__(self) -> Iterator:
+        """Yield the live items in this CalendarQueue in the order they would
+        be removed, without removing them.
+
+        >>> cq = CalendarQueue(len, size=2)
+        >>> cq.add_all(["ab", "cde", "fg", "hijkl"])
+        >>> list(cq)
+        ['ab', 'fg', 'cde', 'hijkl']
+        """
+        for item in self._ordered():
+            if self._live is None or self._live(item):
+                yield item
+
+    def _front(self) -> Optional[deque]:
+        """Return the bucket holding the next live item, at the front of
+        the wheel, discarding tombstones before it. Return None if there is
+        no live item.
+
+        """
+        live = self._live
+        while True:
+            if not self._in_wheel:
+                if not self._overflow:
                     return None
-            self._items.append(item)
-            return None
+                # Skip the empty span up to the next item.
+                self._now = self._overflow[0][0]
+                self._fill()
+            bucket = self._buckets[self._now % len(self._buckets)]
+            if live is not None:
+                while bucket and not live(bucket[0]):
+                    bucket.popleft()
+                    self._in_wheel -= 1
+            if bucket:
+                return bucket
+            self._now += 1
+            self._fill()
+
+    def _fill(self) -> None:
+        """Move the items of the overflow that are in the span of the wheel
+        into the wheel.
+
+        """
+        overflow = self._overflow
+        end = self._now + len(self._buckets)
+        while overflow and overflow[0][0] < end:
+            key, _, item = heappop(overflow)
+            self._buckets[key % len(self._buckets)].append(item)
+            self._in_wheel += 1
+
+    def _ordered(self) -> Iterator:
+        """Yield every stored item in the order they would be removed.
+
+        """
+        size = len(self._buckets)
+        for offset in range(size):
+            yield from self._buckets[(self._now + offset) % size]
+        for _, _, item in sorted(self._overflow):
+            yield item
+
+    def _rebuild(self, now: int, size: int) -> None:
+        """Store the same items again, in a wheel of <size> buckets whose
+        span starts at <now>.
+
+        Precondition: no stored item has a key less than <now>.
+        """
+        items = list(self._ordered())
+        self._buckets = [deque() for _ in range(size)]
+        self._now = now
+        self._in_wheel = 0
+        self._overflow = []
+        end = now + size
+        for item in items:
+            key = self._key(item)
+            if key < end:
+                self._buckets[key % size].append(item)
+                self._in_wheel += 1
+            else:
+                self._overflow.append((key, next(self._counter), item))
+        # The overflow was built in removal order, so it is already a heap.
+
+    def _rewind(self, key: int) -> None:
+        """Move the span of the wheel back to start at <key>, moving the
+        items whose keys are beyond the new span into the overflow.
+
+        This takes time proportional to how far the span moves, up to the
+        size of the wheel, rather than to the number of stored items, so an
+        item added just before the span, as when the span was advanced by
+        peek, is cheap.
+
+        >>> cq = CalendarQueue(int, size=4)
+        >>> cq.add_all([5, 8, 9])
+        >>> cq.peek()
+        5
+        >>> cq.add_all([3, 8])
+        >>> [cq.remove() for _ in range(5)]
+        [3, 5, 8, 8, 9]
+        """
+        size = len(self._buckets)
+        for k in range(max(key + size, self._now), self._now + size):
+            bucket = self._buckets[k % size]
+            while bucket:
+                heappush(self._overflow,
+                         (k, next(self._counter), bucket.popleft()))
+                self._in_wheel -= 1
+        self._now = key
+
+    def _resize(self, size: int) -> None:
+        """Change the wheel to <size> buckets.
+
+        """
+        self._rebuild(self._now, size)
+
+    def _compact(self) -> None:
+        """Discard every tombstone in this CalendarQueue.
+
+        >>> cq = CalendarQueue(int, lambda item: item % 2 == 0, size=4)
+        >>> cq.add_all(range(10))
+        >>> cq._compact()
+        >>> len(cq), list(cq)
+        (5, [0, 2, 4, 6, 8])
+        """
+        if self._live is not None:
+            live = self._live
+            for i, bucket in enumerate(self._buckets):
+                if bucket:
+                    self._buckets[i] = deque(item for item in bucket
+                                             if live(item))
+            self._in_wheel = sum(map(len, self._buckets))
+            self._overflow = [entry for entry in self._overflow
+                              if live(entry[2])]
+            heapify(self._overflow)
+        self._compact_at = max(_MIN_COMPACTION, 2 * len(self))
 
 
 if __name__ == '__main__':
     import python_ta
-    python_ta.check_all()
+    python_ta.check_all(
+        config={'extra-imports': ['collections', 'heapq', 'itertools',
+                                   'operator', 'typing']})
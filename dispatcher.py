@@ -1,9 +1,15 @@
 """Dispatcher for the simulation"""
 
-from typing import Optional
+import math
+from collections import OrderedDict
+from heapq import heappop, heappush
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Tuple
 
 from driver import Driver
 from rider import Rider
+from roads import DistanceOracle
+from spatial import DriverGrid, RiderGrid
 
 
 class Dispatcher:
@@ -22,74 +28,275 @@ class Dispatcher:
     rider requests.
 
     === Public attributes ===
-    riders: Riders who have requested a driver from dispatcher
-    drivers: Drivers who have requested a rider from dispatcher
+    riders: Riders waiting for a driver, keyed by id, in the order they
+        were placed on the waiting list
+    drivers: Drivers who have requested a rider from dispatcher, keyed by id
     """
-    drivers: list
-    riders: list
-    _activdrivers: list
+    drivers: Dict[str, Driver]
+    riders: OrderedDict
+    _activdrivers: DriverGrid
+    _observer: Optional[Callable[[float, int], None]]
+    _oracle: Optional[DistanceOracle]
 
-    def __init__(self) -> None:
+    def __init__(self, oracle: Optional[DistanceOracle] = None) -> None:
         """Initialize a Dispatcher.
 
+        oracle: The distances on the roads, which registered drivers travel
+            by. Defaults to None, for an open grid.
         """
-        self.drivers = []
-        self.riders = []
-        self._activdrivers = []
+        self.drivers = {}
+        self.riders = OrderedDict()
+        self._activdrivers = DriverGrid()
+        self._observer = None
+        self._oracle = oracle
 
     def __str__(self) -> str:
         """Return a string representation.
 
         """
-        did = [dr.id for dr in self.drivers]
-        rid = [dr.id for dr in self.riders]
+        did = list(self.drivers)
+        rid = list(self.riders)
         return f"The drivers who have requested a ride: {did}" \
                f"The riders who have requested a drive: {rid}"
 
-    def request_driver(self, rider: Rider) -> Optional[Driver]:
-        """Return a driver for the rider, or None if no driver is available.
+    def request_driver(self, rider: Rider,
+                       timestamp: Optional[int] = None) -> Optional[Driver]:
+        """Return a driver for the rider, who requested one at <timestamp>,
+        or None if no driver is available.
 
         Add the rider to the waiting list if there is no available driver.
 
         """
-        if not self._activdrivers:
-            self.riders.append(rider)
+        if self._observer is None:
+            return self._request_driver(rider)
+        start = perf_counter()
+        scanned = self._activdrivers.scanned
+        driver = self._request_driver(rider)
+        self._observer(perf_counter() - start,
+                       self._activdrivers.scanned - scanned)
+        return driver
+
+    def set_match_observer(
+            self, observer: Optional[Callable[[float, int], None]]) -> None:
+        """Call <observer> after each request_driver call with the time the
+        call took, in seconds, and the number of drivers it scanned. Pass
+        None to stop observing.
+
+        """
+        self._observer = observer
+
+    def _request_driver(self, rider: Rider) -> Optional[Driver]:
+        """Return the available driver nearest to the rider, or None if no
+        driver is available, as for request_driver.
+
+        """
+        driver = self._activdrivers.nearest(rider.origin)
+        if driver is None:
+            self.riders[rider.id] = rider
             return None
         else:
-            lst = []
-            for dr in self._activdrivers:
-                tt = dr.get_travel_time(rider.origin)
-                lst.append(tt)
-            if not lst:
-                self.riders.append(rider)
-                return None
-            else:
-                ind = lst.index(min(lst))
-                return self._activdrivers.pop(ind)
+            self._activdrivers.remove(driver)
+            return driver
 
-    def request_rider(self, driver: Driver) -> Optional[Rider]:
-        """Return a rider for the driver, or None if no rider is available.
+    def request_rider(self, driver: Driver,
+                      timestamp: Optional[int] = None) -> Optional[Rider]:
+        """Return a rider for the driver, who requested one at <timestamp>,
+        or None if no rider is available.
 
         If this is a new driver, register the driver for future rider requests.
+        If no rider is available, the driver becomes available to riders who
+        request a driver later.
 
         """
-        if driver not in self._activdrivers:
-            self._activdrivers.append(driver)
-        if driver not in self.drivers:
-            self.drivers.append(driver)
-        if not self.riders:
-            return None
-        else:
-            dr = self.riders.pop(0)
-            return dr
+        if driver.id not in self.drivers:
+            self.drivers[driver.id] = driver
+            if self._oracle is not None:
+                driver.set_distance_oracle(self._oracle)
+        rider = self._select_rider(driver, timestamp)
+        if rider is None and driver not in self._activdrivers:
+            self._activdrivers.add(driver)
+        return rider
+
+    def _select_rider(self, driver: Driver,
+                      timestamp: Optional[int]) -> Optional[Rider]:
+        """Remove and return the waiting rider to send <driver> to at
+        <timestamp>, or None if there is none, as for request_rider.
+
+        A Dispatcher sends the driver to the rider who has waited longest
+        among those the driver can reach.
+        """
+        for rider in self.riders.values():
+            if driver.get_travel_time(rider.origin) != math.inf:
+                return self.riders.pop(rider.id)
+        return None
+
+    def batch_match_time(self, rider: Rider, timestamp: int) -> Optional[int]:
+        """Return the time at which waiting riders should next be matched in
+        a batch, if <rider>'s request at <timestamp> needs a new batch match
+        to be scheduled, and None otherwise.
+
+        This is called after request_driver puts <rider> on the waiting
+        list. A Dispatcher matches riders one at a time, so it never needs a
+        batch match.
+        """
+        return None
+
+    def match_batch(self, timestamp: int) -> List[Tuple[Rider, Driver]]:
+        """Match waiting riders with available drivers at <timestamp>, and
+        return the matched (rider, driver) pairs.
+
+        A Dispatcher never defers matches, so there is nothing to match.
+        """
+        return []
+
+    def cancel_ride(self, rider: Rider) -> None:
+        """Cancel the ride for rider.
+        """
+        self.riders.pop(rider.id, None)
+
+
+class SpatialDispatcher(Dispatcher):
+    """A dispatcher that sends a driver who requests a rider to a waiting
+    rider near them, instead of to the rider who has waited longest.
+
+    Waiting riders are indexed by their location in a RiderGrid. The
+    <policy> chooses among the riders the driver can reach before they
+    cancel:
+
+        "nearest"   the rider the driver can reach soonest
+        "score"     the rider with the lowest travel time plus <weight>
+                    times the patience they would have left on pickup, so
+                    that riders about to give up are preferred
+
+    A rider whose patience will run out before the driver arrives is
+    skipped, and stays on the waiting list for a nearer driver. Riders whose
+    patience has run out are dropped from the index through a heap of their
+    deadlines, so they are never scanned again. Requests without a
+    timestamp have no deadline, and the driver is sent to the nearest rider.
+
+    Riders requesting a driver are matched as by a Dispatcher.
+
+    >>> from location import Location
+    >>> dispatcher = SpatialDispatcher()
+    >>> far = Rider("Far", 100, Location(0, 0), Location(1, 1))
+    >>> near = Rider("Near", 100, Location(9, 9), Location(1, 1))
+    >>> late = Rider("Late", 2, Location(8, 9), Location(1, 1))
+    >>> for rider in [far, near, late]:
+    ...     dispatcher.request_driver(rider, 0)
+    >>> driver = Driver("Fast", Location(9, 8), 1)
+    >>> dispatcher.request_rider(driver, 1).id
+    'Near'
+    >>> list(dispatcher.riders)
+    ['Far', 'Late']
+    """
+
+    # === Private Attributes ===
+    _policy: str
+    #     How a waiting rider is chosen: "nearest" or "score".
+    _weight: float
+    #     How much each unit of patience left on pickup adds to a rider's
+    #     score.
+    _waiting: RiderGrid
+    #     The riders on the waiting list, by location.
+    _deadlines: Dict[str, int]
+    #     The time by which each waiting rider with a deadline must be
+    #     picked up before they cancel, keyed by rider id.
+    _expiry: List[Tuple[int, str]]
+    #     (deadline, rider id) pairs as a heap, including pairs of riders
+    #     who are no longer waiting.
+    #
+    # === Representation Invariants ===
+    # _waiting and the waiting list hold exactly the same riders.
+
+    def __init__(self, policy: str = "nearest", weight: float = 0.5,
+                 oracle: Optional[DistanceOracle] = None,
+                 cell_size: int = 4) -> None:
+        """Initialize a SpatialDispatcher.
+
+        Precondition: weight >= 0 and cell_size > 0
+        """
+        if policy not in ("nearest", "score"):
+            raise ValueError(f"Unknown rider selection policy {policy!r}")
+        super().__init__(oracle)
+        self._policy = policy
+        self._weight = weight
+        self._waiting = RiderGrid(cell_size)
+        self._deadlines = {}
+        self._expiry = []
+
+    def request_driver(self, rider: Rider,
+                       timestamp: Optional[int] = None) -> Optional[Driver]:
+        """Return a driver for the rider, who requested one at <timestamp>,
+        or None if no driver is available.
+
+        Add the rider to the waiting list if there is no available driver.
+
+        """
+        driver = super().request_driver(rider, timestamp)
+        if driver is None:
+            self._waiting.add(rider)
+            if timestamp is not None:
+                deadline = timestamp + rider.patience
+                self._deadlines[rider.id] = deadline
+                heappush(self._expiry, (deadline, rider.id))
+        return driver
 
     def cancel_ride(self, rider: Rider) -> None:
         """Cancel the ride for rider.
         """
-        if rider in self.riders:
-            self.riders.remove(rider)
+        if rider in self._waiting:
+            self._remove(rider)
+
+    def _select_rider(self, driver: Driver,
+                      timestamp: Optional[int]) -> Optional[Rider]:
+        """Remove and return the waiting rider to send <driver> to at
+        <timestamp>, or None if there is none, as for request_rider.
+
+        """
+        if timestamp is not None:
+            self._expire(timestamp)
+        if not self.riders:
+            return None
+        deadlines = self._deadlines
+        weight = self._weight if self._policy == "score" else 0
+
+        def score(rider: Rider, travel_time: int) -> Optional[float]:
+            deadline = deadlines.get(rider.id)
+            if deadline is None or timestamp is None:
+                return travel_time
+            slack = deadline - timestamp - travel_time
+            if slack <= 0:
+                return None
+            return travel_time + weight * slack
+
+        rider = self._waiting.best(driver, score)
+        if rider is not None:
+            self._remove(rider)
+        return rider
+
+    def _expire(self, now: int) -> None:
+        """Take the riders whose patience has run out by <now> off the
+        waiting list.
+
+        """
+        expiry = self._expiry
+        while expiry and expiry[0][0] <= now:
+            deadline, identifier = heappop(expiry)
+            # Skip pairs of riders who were matched or cancelled.
+            if self._deadlines.get(identifier) == deadline:
+                self._remove(self.riders[identifier])
+
+    def _remove(self, rider: Rider) -> None:
+        """Take <rider> off the waiting list.
+
+        """
+        del self.riders[rider.id]
+        self._waiting.remove(rider)
+        self._deadlines.pop(rider.id, None)
 
 
 if __name__ == '__main__':
     import python_ta
-    python_ta.check_all(config={'extra-imports': ['typing', 'driver', 'rider']})
+    python_ta.check_all(config={
+        'extra-imports': ['math', 'collections', 'heapq', 'time', 'typing',
+                          'driver', 'rider', 'roads', 'spatial']})
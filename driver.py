@@ -1,8 +1,13 @@
 """Drivers for the simulation"""
-from typing import Optional
+from __future__ import annotations
+import math
+from typing import TYPE_CHECKING, Callable, Optional
 from location import Location, manhattan_distance
 from rider import Rider
 
+if TYPE_CHECKING:
+    from roads import DistanceOracle
+
 
 class Driver:
     """A driver for a ride-sharing service.
@@ -16,22 +21,33 @@ class Driver:
     === Private Attributes ===
     _speed: Integer value of the driver's speed
     _rider: String value storing current passenger
+    _location: The current location of the driver
+    _listener: Function called with this driver whenever it moves
+        (May be None)
+    _oracle: Answers the distance between two locations on the roads
+        (May be None, for an open grid)
     """
+    __slots__ = ("id", "is_idle", "destination", "_speed", "_rider",
+                 "_location", "_listener", "_oracle")
 
     id: str
-    location: Location
     is_idle: bool
     destination: Optional[Location]
 
     _speed: int
     _rider: Optional[str]
+    _location: Location
+    _listener: Optional[Callable[[Driver], None]]
+    _oracle: Optional[DistanceOracle]
 
     def __init__(self, identifier: str, location: Location, speed: int) -> None:
         """Initialize a Driver.
 
         """
         self.id = identifier
-        self.location = location
+        self._listener = None
+        self._oracle = None
+        self._location = location
         self.is_idle = True
         self._speed = speed
         self.destination = None
@@ -50,21 +66,65 @@ class Driver:
         """
         return self.id == other.id and self.location == other.location
 
-    def get_travel_time(self, destination: Location) -> int:
+    @property
+    def location(self) -> Location:
+        """Return the current location of the driver.
+
+        """
+        return self._location
+
+    @location.setter
+    def location(self, location: Location) -> None:
+        """Move the driver to <location>, notifying its move listener.
+
+        """
+        self._location = location
+        if self._listener is not None:
+            self._listener(self)
+
+    def set_move_listener(
+            self, listener: Optional[Callable[[Driver], None]]) -> None:
+        """Call <listener> with this driver whenever it moves, replacing any
+        previous listener. Pass None to stop notifying.
+
+        """
+        self._listener = listener
+
+    def set_distance_oracle(self, oracle: Optional[DistanceOracle]) -> None:
+        """Travel by the distances <oracle> gives from now on, or on an open
+        grid if <oracle> is None.
+
+        """
+        self._oracle = oracle
+
+    def get_speed(self) -> int:
+        """Return the speed of the driver.
+
+        """
+        return self._speed
+
+    def get_travel_time(self, destination: Location) -> float:
         """Return the time it will take to arrive at the destination,
-        rounded to the nearest integer.
+        rounded to the nearest integer, or math.inf if the roads do not
+        lead there.
 
         """
-        dist = manhattan_distance(self.location, destination)
+        if self._oracle is None:
+            dist = manhattan_distance(self.location, destination)
+        else:
+            dist = self._oracle.distance(self.location, destination)
+            if dist == math.inf:
+                return dist
         return round(dist / self._speed)
 
     def start_drive(self, location: Location) -> int:
         """Start driving to the location.
         Return the time that the drive will take.
 
+        Raise ValueError if the roads do not lead there.
         """
         self.destination = location
-        return self.get_travel_time(self.destination)
+        return self._drive_time()
 
     def end_drive(self) -> None:
         """End the drive and arrive at the destination.
@@ -77,12 +137,24 @@ class Driver:
     def start_ride(self, rider: Rider) -> int:
         """Start a ride and return the time the ride will take.
 
+        Raise ValueError if the roads do not lead to the rider's destination.
         """
         self.location = rider.origin
         self.destination = rider.dest
         self.is_idle = False
         self._rider = rider.id
-        return self.get_travel_time(self.destination)
+        return self._drive_time()
+
+    def _drive_time(self) -> int:
+        """Return the time it will take to arrive at the destination.
+
+        Raise ValueError if the roads do not lead there.
+        """
+        time = self.get_travel_time(self.destination)
+        if time == math.inf:
+            raise ValueError(f"There is no route from {self.location} to "
+                             f"{self.destination}")
+        return time
 
     def end_ride(self) -> None:
         """End the current ride, and arrive at the rider's destination.
@@ -99,4 +171,5 @@ class Driver:
 if __name__ == '__main__':
     import python_ta
     python_ta.check_all(
-        config={'extra-imports': ['location', 'rider']})
+        config={'extra-imports': ['math', 'typing', 'location', 'rider',
+                                   'roads']})
@@ -0,0 +1,310 @@
+"""An event engine that keeps pending events as compact records.
+
+A Simulation makes an Event object for every pickup, drop-off, driver
+request and cancellation, and orders its queue through Event.__lt__. A
+RecordSimulation runs the same simulation without either. Each pending
+event is a record of a type code and the indices of its rider and driver,
+stored in slots of preallocated lists that are reused through a free list.
+The queue is a heap of integer keys that pack the timestamp, a sequence
+number and the slot, so ordering a heap is a comparison of integers in C,
+and ties are still broken in the order events were scheduled. Each record
+is done by the handler its type code selects from a table.
+
+The handlers do exactly what the do method of the matching Event does,
+in the same order, so a RecordSimulation gives the same report as a
+Simulation with the same dispatcher and monitor.
+
+=== Constants ===
+RIDER_REQUEST: The type code of a rider's request for a driver.
+DRIVER_REQUEST: The type code of a driver's request for a rider.
+CANCELLATION: The type code of a rider's cancellation.
+PICKUP: The type code of a driver picking up a rider.
+DROPOFF: The type code of a driver dropping off a rider.
+BATCH_MATCH: The type code of a batch match of waiting riders.
+"""
+
+from collections import abc
+from heapq import heappop, heappush
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from dispatcher import Dispatcher
+from driver import Driver
+from event import Event, DriverRequest, RiderRequest
+from monitor import (Monitor, RIDER, DRIVER, REQUEST, CANCEL,
+                     PICKUP as PICKUP_ACTIVITY, DROPOFF as DROPOFF_ACTIVITY)
+from rider import Rider, WAITING, CANCELLED, SATISFIED
+
+RIDER_REQUEST = 0
+DRIVER_REQUEST = 1
+CANCELLATION = 2
+PICKUP = 3
+DROPOFF = 4
+BATCH_MATCH = 5
+
+# A heap key is (timestamp << _TIME_SHIFT) | (sequence << _SLOT_BITS) | slot.
+_SLOT_BITS = 32
+_SEQUENCE_BITS = 40
+_TIME_SHIFT = _SLOT_BITS + _SEQUENCE_BITS
+_SLOT_MASK = (1 << _SLOT_BITS) - 1
+
+# The number of records a new RecordSimulation has room for.
+_INITIAL_CAPACITY = 1024
+
+# The actor index stored for an event without a rider or driver.
+_NONE = -1
+
+
+class RecordSimulation:
+    """A simulation whose pending events are compact records.
+
+    Riders and drivers are numbered as their initial events are scheduled,
+    and are assumed to have unique ids, as in an event file.
+
+    >>> from event import create_event_list
+    >>> RecordSimulation().run(create_event_list("events.txt"))
+    {'rider_wait_time': 0.5, 'driver_total_distance': 4.5, \
+'driver_ride_distance': 3.8333333333333335}
+    """
+
+    # === Private Attributes ===
+    _dispatcher: Dispatcher
+    #     The dispatcher associated with the simulation.
+    _monitor: Monitor
+    #     The monitor associated with the simulation.
+    _handlers: List[Callable[[int, int, int], None]]
+    #     The handler of each type of record, indexed by type code. Each is
+    #     called with the timestamp and the rider and driver indices.
+    _heap: List[int]
+    #     The heap keys of the pending records.
+    _codes: List[int]
+    #     The type code of the record in each slot.
+    _rider_of: List[int]
+    #     The index of the rider of the record in each slot, or _NONE.
+    _driver_of: List[int]
+    #     The index of the driver of the record in each slot, or _NONE.
+    _free: List[int]
+    #     The slots not holding a pending record.
+    _sequence: int
+    #     The number of records ever scheduled.
+    _riders: List[Rider]
+    #     The riders, by index.
+    _drivers: List[Driver]
+    #     The drivers, by index.
+    _rider_index: Dict[str, int]
+    #     The index of each rider, keyed by rider id.
+    _driver_index: Dict[str, int]
+    #     The index of each driver, keyed by driver id.
+
+    def __init__(self, monitor: Optional[Monitor] = None,
+                 dispatcher: Optional[Dispatcher] = None) -> None:
+        """Initialize a RecordSimulation.
+
+        monitor: The monitor to record activities with. Defaults to a new
+            Monitor.
+        dispatcher: The dispatcher to match riders and drivers with.
+            Defaults to a new Dispatcher.
+        """
+        self._dispatcher = Dispatcher() if dispatcher is None else dispatcher
+        self._monitor = Monitor() if monitor is None else monitor
+        self._handlers = [self._rider_request, self._driver_request,
+                          self._cancellation, self._pickup, self._dropoff,
+                          self._batch_match]
+        self._heap = []
+        self._codes = [0] * _INITIAL_CAPACITY
+        self._rider_of = [_NONE] * _INITIAL_CAPACITY
+        self._driver_of = [_NONE] * _INITIAL_CAPACITY
+        self._free = list(range(_INITIAL_CAPACITY - 1, -1, -1))
+        self._sequence = 0
+        self._riders = []
+        self._drivers = []
+        self._rider_index = {}
+        self._driver_index = {}
+
+    def run(self, initial_events: Iterable[Event]) -> Dict[str, float]:
+        """Run the simulation on the events in <initial_events>, and return
+        the statistics of the simulation, as Simulation.run does.
+
+        initial_events: A list of RiderRequest and DriverRequest events, or
+            any other sequence of them, in any order. This may instead be an
+            iterator or other iterable that yields them in timestamp order;
+            it is then read lazily, and ValueError is raised if an event is
+            earlier than the one before it.
+
+        >>> from event import create_event_list
+        >>> events = create_event_list("customev.txt")
+        >>> RecordSimulation().run(tuple(events))
+        {'rider_wait_time': 1.0, 'driver_total_distance': 8.0, \
+'driver_ride_distance': 4.0}
+        >>> RecordSimulation().run(iter(events))
+        Traceback (most recent call last):
+        ...
+        ValueError: Initial events are out of timestamp order: 0 follows 15
+        """
+        if isinstance(initial_events, abc.Sequence):
+            for event in initial_events:
+                self._schedule(event.timestamp, *self._register(event))
+            source = iter([])
+        else:
+            source = iter(initial_events)
+        pending = next(source, None)
+
+        heap, free, handlers = self._heap, self._free, self._handlers
+        codes, rider_of, driver_of = \
+            self._codes, self._rider_of, self._driver_of
+        riders = self._riders
+        while pending is not None or heap:
+            # Initial events from the source are done before queued records
+            # with equal timestamps, and are never queued.
+            if pending is not None and (
+                    not heap or pending.timestamp <= heap[0] >> _TIME_SHIFT):
+                code, rider, driver = self._register(pending)
+                handlers[code](pending.timestamp, rider, driver)
+                following = next(source, None)
+                if following is not None \
+                        and following.timestamp < pending.timestamp:
+                    raise ValueError(
+                        f"Initial events are out of timestamp order: "
+                        f"{following.timestamp} follows {pending.timestamp}")
+                pending = following
+                continue
+            key = heappop(heap)
+            slot = key & _SLOT_MASK
+            free.append(slot)
+            code, rider = codes[slot], rider_of[slot]
+            if code == CANCELLATION and riders[rider].status == SATISFIED:
+                # The rider has been picked up, so the record is dead.
+                continue
+            handlers[code](key >> _TIME_SHIFT, rider, driver_of[slot])
+        return self._monitor.report()
+
+    def _register(self, event: Event) -> Tuple[int, int, int]:
+        """Number the rider or driver of the initial <event>, and return the
+        type code of its record and its rider and driver indices.
+
+        """
+        if isinstance(event, RiderRequest):
+            index = self._rider_index[event.rider.id] = len(self._riders)
+            self._riders.append(event.rider)
+            return RIDER_REQUEST, index, _NONE
+        if isinstance(event, DriverRequest):
+            index = self._driver_index[event.driver.id] = len(self._drivers)
+            self._drivers.append(event.driver)
+            return DRIVER_REQUEST, _NONE, index
+        raise TypeError(f"{type(event).__name__} is not an initial event")
+
+    def _schedule(self, timestamp: int, code: int, rider: int,
+                  driver: int) -> None:
+        """Schedule a record of type <code> for the rider and driver with
+        indices <rider> and <driver> at <timestamp>.
+
+        """
+        if not self._free:
+            self._grow()
+        slot = self._free.pop()
+        self._codes[slot] = code
+        self._rider_of[slot] = rider
+        self._driver_of[slot] = driver
+        heappush(self._heap, (((timestamp << _SEQUENCE_BITS) | self._sequence)
+                              << _SLOT_BITS) | slot)
+        self._sequence += 1
+
+    def _grow(self) -> None:
+        """Double the number of slots.
+
+        """
+        size = len(self._codes)
+        self._codes.extend([0] * size)
+        self._rider_of.extend([_NONE] * size)
+        self._driver_of.extend([_NONE] * size)
+        self._free.extend(range(2 * size - 1, size - 1, -1))
+
+    def _rider_request(self, timestamp: int, rider: int, _: int) -> None:
+        """Do a RiderRequest by the rider with index <rider>.
+
+        """
+        person = self._riders[rider]
+        self._monitor.notify(timestamp, RIDER, REQUEST, person.id,
+                             person.origin)
+        driver = self._dispatcher.request_driver(person, timestamp)
+        if driver is not None:
+            travel_time = driver.start_drive(person.origin)
+            self._schedule(timestamp + travel_time, PICKUP, rider,
+                           self._driver_index[driver.id])
+        else:
+            match_time = self._dispatcher.batch_match_time(person, timestamp)
+            if match_time is not None:
+                self._schedule(match_time, BATCH_MATCH, _NONE, _NONE)
+        self._schedule(timestamp + person.patience, CANCELLATION, rider,
+                       _NONE)
+
+    def _driver_request(self, timestamp: int, _: int, driver: int) -> None:
+        """Do a DriverRequest by the driver with index <driver>.
+
+        """
+        person = self._drivers[driver]
+        self._monitor.notify(timestamp, DRIVER, REQUEST, person.id,
+                             person.location)
+        rider = self._dispatcher.request_rider(person, timestamp)
+        if rider:
+            travel_time = person.start_drive(rider.origin)
+            self._schedule(timestamp + travel_time, PICKUP,
+                           self._rider_index[rider.id], driver)
+
+    def _cancellation(self, timestamp: int, rider: int, _: int) -> None:
+        """Do a Cancellation by the rider with index <rider>.
+
+        """
+        person = self._riders[rider]
+        if person.status != SATISFIED:
+            self._dispatcher.cancel_ride(person)
+            person.cancelled()
+            self._monitor.notify(timestamp, RIDER, CANCEL, person.id,
+                                 person.origin)
+
+    def _pickup(self, timestamp: int, rider: int, driver: int) -> None:
+        """Do a Pickup of the rider with index <rider> by the driver with
+        index <driver>.
+
+        """
+        person, car = self._riders[rider], self._drivers[driver]
+        if person.status == WAITING:
+            self._monitor.notify(timestamp, RIDER, PICKUP_ACTIVITY,
+                                 person.id, person.origin)
+            self._monitor.notify(timestamp, DRIVER, PICKUP_ACTIVITY, car.id,
+                                 person.origin)
+            car.end_drive()
+            time = car.start_ride(person)
+            person.satisfied()
+            self._schedule(timestamp + time, DROPOFF, rider, driver)
+        elif person.status == CANCELLED:
+            car.end_drive()
+            time = timestamp + car.get_travel_time(person.dest)
+            self._schedule(time, DRIVER_REQUEST, _NONE, driver)
+
+    def _dropoff(self, timestamp: int, _: int, driver: int) -> None:
+        """Do a Dropoff by the driver with index <driver>.
+
+        """
+        car = self._drivers[driver]
+        car.end_ride()
+        self._monitor.notify(timestamp, DRIVER, DROPOFF_ACTIVITY, car.id,
+                             car.location)
+        self._schedule(timestamp, DRIVER_REQUEST, _NONE, driver)
+
+    def _batch_match(self, timestamp: int, _: int, __: int) -> None:
+        """Do a BatchMatch.
+
+        """
+        for rider, driver in self._dispatcher.match_batch(timestamp):
+            travel_time = driver.start_drive(rider.origin)
+            self._schedule(timestamp + travel_time, PICKUP,
+                           self._rider_index[rider.id],
+                           self._driver_index[driver.id])
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={'extra-imports': ['collections', 'heapq', 'typing',
+                                  'dispatcher', 'driver', 'event', 'monitor',
+                                  'rider']})
@@ -4,7 +4,10 @@ This file should contain all of the classes necessary to model the different
 kinds of events in the simulation.
 """
 from __future__ import annotations
-from typing import List
+import heapq
+import os
+import tempfile
+from typing import Iterator, List, Optional
 
 from rider import Rider, WAITING, CANCELLED, SATISFIED
 from dispatcher import Dispatcher
@@ -28,11 +31,17 @@ class Event:
 
     Document any such changes carefully!
 
+    Events can be withdrawn after they are scheduled. A withdrawn event is
+    not live, and the simulation skips it instead of doing it.
+
     === Attributes ===
     timestamp: A timestamp for this event.
+    cancelled: True iff this event has been withdrawn.
     """
+    __slots__ = ("timestamp", "cancelled")
 
     timestamp: int
+    cancelled: bool
 
     def __init__(self, timestamp: int) -> None:
         """Initialize an Event with a given timestamp.
@@ -43,6 +52,7 @@ class Event:
         7
         """
         self.timestamp = timestamp
+        self.cancelled = False
 
     # The following six 'magic methods' are overridden to allow for easy
     # comparison of Event instances. All comparisons simply perform the
@@ -133,6 +143,25 @@ class Event:
         """
         raise NotImplementedError("Implemented in a subclass")
 
+    def cancel(self) -> None:
+        """Withdraw this event, so that it is skipped instead of done.
+
+        >>> event = Event(1)
+        >>> event.cancel()
+        >>> event.is_live()
+        False
+        """
+        self.cancelled = True
+
+    def is_live(self) -> bool:
+        """Return True iff doing this event could still change the state of
+        the simulation.
+
+        >>> Event(1).is_live()
+        True
+        """
+        return not self.cancelled
+
     def do(self, dispatcher: Dispatcher, monitor: Monitor) -> List[Event]:
         """Do this Event.
 
@@ -158,6 +187,7 @@ class RiderRequest(Event):
     === Attributes ===
     rider: The rider.
     """
+    __slots__ = ("rider",)
 
     rider: Rider
 
@@ -174,18 +204,24 @@ class RiderRequest(Event):
         the rider.
 
         Return a Cancellation event. If the rider is assigned to a driver,
-        also return a Pickup event.
+        also return a Pickup event. If the dispatcher defers the match to a
+        batch that is not yet scheduled, also return a BatchMatch event.
 
         """
         monitor.notify(self.timestamp, RIDER, REQUEST,
                        self.rider.id, self.rider.origin)
 
         events = []
-        driver = dispatcher.request_driver(self.rider)
+        driver = dispatcher.request_driver(self.rider, self.timestamp)
         if driver is not None:
             travel_time = driver.start_drive(self.rider.origin)
             events.append(Pickup(self.timestamp + travel_time,
                                  self.rider, driver))
+        else:
+            match_time = dispatcher.batch_match_time(self.rider,
+                                                     self.timestamp)
+            if match_time is not None:
+                events.append(BatchMatch(match_time))
         events.append(Cancellation(self.timestamp + self.rider.patience,
                                    self.rider))
         return events
@@ -203,6 +239,7 @@ class DriverRequest(Event):
     === Attributes ===
     driver: The driver.
     """
+    __slots__ = ("driver",)
 
     driver: Driver
 
@@ -229,7 +266,7 @@ class DriverRequest(Event):
         monitor.notify(self.timestamp, DRIVER, REQUEST,
                        self.driver.id, self.driver.location)
         events = []
-        rider = dispatcher.request_rider(self.driver)
+        rider = dispatcher.request_rider(self.driver, self.timestamp)
         if rider:
             travel_time = self.driver.start_drive(rider.origin)
             events.append(Pickup(self.timestamp + travel_time,
@@ -249,6 +286,7 @@ class Cancellation(Event):
     === Attributes ===
     driver: The driver.
     """
+    __slots__ = ("rider",)
 
     rider: Rider
 
@@ -259,6 +297,13 @@ class Cancellation(Event):
         super().__init__(timestamp)
         self.rider = rider
 
+    def is_live(self) -> bool:
+        """Return True iff this event has not been withdrawn and the rider
+        has not been picked up.
+
+        """
+        return not self.cancelled and self.rider.status != SATISFIED
+
     def do(self, dispatcher: Dispatcher, monitor: Monitor) -> List[Event]:
         """ Cancel the rider's ride
 
@@ -287,6 +332,7 @@ class Pickup(Event):
     driver: The driver.
     rider: The rider being picked up
     """
+    __slots__ = ("rider", "driver")
 
     rider: Rider
     driver: Driver
@@ -334,6 +380,7 @@ class Dropoff(Event):
     driver: The driver.
     rider: The rider being dropped off
     """
+    __slots__ = ("rider", "driver")
 
     rider: Rider
     driver: Driver
@@ -364,54 +411,284 @@ class Dropoff(Event):
         return f"At {self.timestamp}, {self.driver} drops off {self.rider}"
 
 
+class BatchMatch(Event):
+    """The dispatcher matches the riders waiting for a batched match with
+    available drivers.
+    """
+    __slots__ = ()
+
+    def do(self, dispatcher: Dispatcher, monitor: Monitor) -> List[Event]:
+        """Match waiting riders with drivers. Each matched driver starts
+        driving to their rider.
+
+        Return a Pickup event for each match.
+
+        """
+        events = []
+        for rider, driver in dispatcher.match_batch(self.timestamp):
+            travel_time = driver.start_drive(rider.origin)
+            events.append(Pickup(self.timestamp + travel_time, rider, driver))
+        return events
+
+    def __str__(self) -> str:
+        """Return a string representation of this event.
+
+        """
+        return f"{self.timestamp} -- Match waiting riders in a batch"
+
+
 def create_event_list(filename: str) -> List[Event]:
     """Return a list of Events based on raw list of events in <filename>.
 
-    Precondition: the file stored at <filename> is in the format specified
-    by the assignment handout.
+    Raise ValueError, naming and quoting the line, if a line is malformed.
+    For large files, parsing.load_events is much faster.
 
     filename: The name of a file that contains the list of events.
     """
     events = []
     with open(filename, "r") as file:
-        for line in file:
-            line = line.strip()
-
-            if not line or line.startswith("#"):
-                # Skip lines that are blank or start with #.
-                continue
-
-            # Create a list of words in the line, e.g.
-            # ['10', 'RiderRequest', 'Cerise', '4,2', '1,5', '15'].
-            # Note that these are strings, and you'll need to convert some
-            # of them to a different type.
-            tokens = line.split()
-            timestamp = int(tokens[0])
-            event_type = tokens[1]
-
-            # HINT: Use Location.deserialize to convert the location string to
-            # a location.
-            if event_type == "DriverRequest":
-                drivid = tokens[2]
-                drivloc = deserialize_location(tokens[3])
-                speed = int(tokens[4])
-                event = DriverRequest(timestamp, Driver(drivid, drivloc, speed))
-            elif event_type == "RiderRequest":
-                ridid = tokens[2]
-                ridloc = deserialize_location(tokens[3])
-                riddest = deserialize_location(tokens[4])
-                patience = int(tokens[5])
-                event = RiderRequest(timestamp, Rider(ridid, patience,
-                                                      ridloc, riddest))
-            events.append(event)
+        for number, line in enumerate(file, 1):
+            event = _parse_line(filename, number, line)
+            if event is not None:
+                events.append(event)
 
     return events
 
 
+def _parse_line(filename: str, number: int, line: str) -> Optional[Event]:
+    """Return the Event described by <line>, line <number> of the event
+    file <filename>, or None if the line is blank or a comment.
+
+    Raise ValueError, naming the file and line and quoting the line, if the
+    line is malformed.
+    """
+    try:
+        return parse_event(line)
+    except (ValueError, IndexError) as error:
+        raise ValueError(f"{filename}, line {number}: {error}: "
+                         f"{line.strip()!r}") from error
+
+
+def parse_event(line: str) -> Optional[Event]:
+    """Return the Event described by one <line> of an event file, or None if
+    the line is blank or a comment.
+
+    >>> parse_event("10 RiderRequest Cerise 4,2 1,5 15").rider.id
+    'Cerise'
+    >>> parse_event("# a comment") is None
+    True
+    """
+    line = line.strip()
+
+    if not line or line.startswith("#"):
+        # Skip lines that are blank or start with #.
+        return None
+
+    # Create a list of words in the line, e.g.
+    # ['10', 'RiderRequest', 'Cerise', '4,2', '1,5', '15'].
+    tokens = line.split()
+    timestamp = int(tokens[0])
+    event_type = tokens[1]
+
+    if event_type == "DriverRequest":
+        drivid = tokens[2]
+        drivloc = deserialize_location(tokens[3])
+        speed = int(tokens[4])
+        return DriverRequest(timestamp, Driver(drivid, drivloc, speed))
+    elif event_type == "RiderRequest":
+        ridid = tokens[2]
+        ridloc = deserialize_location(tokens[3])
+        riddest = deserialize_location(tokens[4])
+        patience = int(tokens[5])
+        return RiderRequest(timestamp, Rider(ridid, patience,
+                                             ridloc, riddest))
+    raise ValueError(f"Unknown event type {event_type!r}")
+
+
+def stream_events(filename: str, chunk_size: int = 100000,
+                  fan_in: int = 64) -> Iterator[Event]:
+    """Yield the Events in <filename> lazily, in timestamp order.
+
+    Events with equal timestamps are yielded in the order they appear in the
+    file. If the file is already in timestamp order, only one event is held
+    in memory at a time. Otherwise, the file is sorted externally first: it
+    is split into sorted runs of at most <chunk_size> lines, which are
+    written to temporary files and merged, at most <fan_in> runs at a time,
+    so that no more than <fan_in> files are open at once however long the
+    file is.
+
+    >>> [event.timestamp for event in stream_events("customev.txt",
+    ...                                            chunk_size=2, fan_in=2)]
+    [0, 0, 0, 2, 5, 5, 8, 10, 12, 15]
+
+    Raise ValueError, naming the file and line, if a line is malformed, when
+    the events up to it have been yielded, or before any event if the file
+    must be sorted:
+
+    >>> import os, tempfile
+    >>> with tempfile.TemporaryDirectory() as directory:
+    ...     filename = os.path.join(directory, "events.txt")
+    ...     with open(filename, "w") as file:
+    ...         _ = file.write("5 DriverRequest Amaranth 1,1 1\\n"
+    ...                        "0 RiderRequest Cerise 4,2 1;5 15\\n")
+    ...     list(stream_events(filename))  # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+    ...
+    ValueError: .../events.txt, line 2: ...: '0 RiderRequest Cerise 4,2 1;5 15'
+
+    Precondition: the file stored at <filename> is in the format specified
+    by the assignment handout, and fan_in >= 2.
+
+    filename: The name of a file that contains the list of events.
+    chunk_size: The largest number of lines sorted in memory at once.
+    fan_in: The largest number of runs merged at once.
+    """
+    if _is_sorted(filename):
+        with open(filename, "r") as file:
+            for number, line in enumerate(file, 1):
+                event = _parse_line(filename, number, line)
+                if event is not None:
+                    yield event
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        runs = _write_sorted_runs(filename, directory, chunk_size)
+        level = 0
+        while len(runs) > fan_in:
+            runs = _merge_runs(runs, directory, fan_in, level)
+            level += 1
+        files = [open(run, "r") for run in runs]
+        try:
+            for line in heapq.merge(*files, key=_run_timestamp):
+                number, line = line.split(None, 1)
+                yield _parse_line(filename, int(number), line)
+        finally:
+            for file in files:
+                file.close()
+
+
+def _line_timestamp(line: str) -> int:
+    """Return the timestamp of the event on a non-blank, non-comment <line>.
+
+    """
+    return int(line.split(None, 1)[0])
+
+
+def _run_timestamp(line: str) -> int:
+    """Return the timestamp of the event on a <line> of a run file, which is
+    an event line prefixed with its line number in the event file.
+
+    """
+    return int(line.split(None, 2)[1])
+
+
+def _checked_timestamp(filename: str, number: int, line: str) -> int:
+    """Return the timestamp of the event on the non-blank, non-comment
+    <line>, line <number> of the event file <filename>.
+
+    Raise ValueError, naming the file and line and quoting the line, if
+    there is no timestamp.
+    """
+    try:
+        return _line_timestamp(line)
+    except ValueError as error:
+        raise ValueError(f"{filename}, line {number}: {error}: "
+                         f"{line!r}") from error
+
+
+def _is_sorted(filename: str) -> bool:
+    """Return True iff the events in <filename> are in timestamp order.
+
+    Raise ValueError, naming the line, if a line before the first one out
+    of order has no timestamp.
+    """
+    last = None
+    with open(filename, "r") as file:
+        for number, line in enumerate(file, 1):
+            line = line.strip()
+            if line and not line.startswith("#"):
+                timestamp = _checked_timestamp(filename, number, line)
+                if last is not None and timestamp < last:
+                    return False
+                last = timestamp
+    return True
+
+
+def _write_sorted_runs(filename: str, directory: str,
+                       chunk_size: int) -> List[str]:
+    """Split the events in <filename> into runs of at most <chunk_size>
+    lines, each sorted by timestamp, and write each run to a file in
+    <directory>. Each line of a run is prefixed with its line number in
+    <filename>, so that errors can name it.
+
+    Return the names of the run files, in file order. Raise ValueError,
+    naming the line, if a line has no timestamp.
+    """
+    runs = []
+    with open(filename, "r") as file:
+        chunk = []
+        for number, line in enumerate(file, 1):
+            line = line.strip()
+            if line and not line.startswith("#"):
+                _checked_timestamp(filename, number, line)
+                chunk.append(f"{number} {line}")
+                if len(chunk) == chunk_size:
+                    runs.append(_write_run(chunk, directory, len(runs)))
+                    chunk = []
+        if chunk:
+            runs.append(_write_run(chunk, directory, len(runs)))
+    return runs
+
+
+def _merge_runs(runs: List[str], directory: str, fan_in: int,
+                level: int) -> List[str]:
+    """Merge each group of <fan_in> consecutive runs in <runs> into one run
+    in <directory>, and delete the merged runs. Return the names of the new
+    runs, in order.
+
+    Merging consecutive runs keeps events with equal timestamps in file
+    order. <level> is the number of merge passes done so far.
+    """
+    merged = []
+    for start in range(0, len(runs), fan_in):
+        group = runs[start:start + fan_in]
+        if len(group) == 1:
+            merged.append(group[0])
+            continue
+        name = os.path.join(directory, f"merge{level}_{len(merged)}.txt")
+        files = [open(run, "r") for run in group]
+        try:
+            with open(name, "w") as run:
+                run.writelines(heapq.merge(*files, key=_run_timestamp))
+        finally:
+            for file in files:
+                file.close()
+        for run in group:
+            os.remove(run)
+        merged.append(name)
+    return merged
+
+
+def _write_run(chunk: List[str], directory: str, number: int) -> str:
+    """Sort the lines of a run in <chunk> by timestamp and write them to a
+    new file in <directory>. Return the name of the file.
+
+    """
+    chunk.sort(key=_run_timestamp)
+    name = os.path.join(directory, f"run{number}.txt")
+    with open(name, "w") as run:
+        run.write("\n".join(chunk))
+        run.write("\n")
+    return name
+
+
 if __name__ == '__main__':
     import python_ta
     python_ta.check_all(
         config={
-            'allowed-io': ['create_event_list'],
-            'extra-imports': ['rider', 'dispatcher', 'driver',
-                              'location', 'monitor']})
+            'allowed-io': ['create_event_list', 'stream_events',
+                           '_is_sorted', '_write_sorted_runs', '_merge_runs',
+                           '_write_run'],
+            'extra-imports': ['heapq', 'os', 'tempfile', 'typing', 'rider',
+                              'dispatcher', 'driver', 'location',
+                              'monitor']})
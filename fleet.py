@@ -0,0 +1,216 @@
+"""Fleet state in parallel arrays, for vectorized nearest-driver queries.
+
+This module needs NumPy. The rest of the simulation does not, so it is only
+imported by code that asks for a VectorDispatcher.
+"""
+
+import math
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from dispatcher import Dispatcher
+from driver import Driver
+from location import Location
+from roads import DistanceOracle
+
+# The number of drivers a new FleetArrays has room for.
+_INITIAL_CAPACITY = 64
+
+
+class FleetArrays:
+    """An index over drivers that keeps their locations and speeds in
+    parallel NumPy arrays, answering nearest-driver queries by travel time.
+
+    A query computes the travel time of every indexed driver at once, with
+    a single vectorized pass, instead of calling get_travel_time on each
+    driver in turn. There is no spatial structure to maintain, so adding,
+    removing and moving a driver take constant time. This suits dense
+    fleets, where a DriverGrid would scan many drivers per query anyway.
+
+    Drivers report their own moves to the index, so the arrays stay in sync
+    as drivers drive and ride while indexed.
+
+    On roads, the Manhattan travel times are lower bounds, and the
+    candidates are checked in order of them with get_travel_time until no
+    other driver can be nearer.
+
+    Ties in travel time are resolved in favour of the driver that was added
+    to the index *earliest*, as by a DriverGrid.
+
+    >>> fleet = FleetArrays()
+    >>> for name, row, speed in [("Slow", 1, 1), ("Fast", 9, 4)]:
+    ...     fleet.add(Driver(name, Location(row, 0), speed))
+    >>> fleet.nearest(Location(5, 0)).id
+    'Fast'
+
+    === Public Attributes ===
+    scanned: The number of drivers whose travel time has been computed by
+        nearest() so far.
+    """
+    scanned: int
+
+    # === Private Attributes ===
+    _oracle: Optional[DistanceOracle]
+    #     The distances on the roads the drivers travel by, or None for an
+    #     open grid.
+    _rows: np.ndarray
+    #     The row of each indexed driver, by slot.
+    _columns: np.ndarray
+    #     The column of each indexed driver, by slot.
+    _speeds: np.ndarray
+    #     The speed of each indexed driver, by slot.
+    _order: np.ndarray
+    #     The sequence number each indexed driver was added with, by slot.
+    _drivers: List[Driver]
+    #     The indexed drivers, by slot.
+    _slots: Dict[str, int]
+    #     The slot of each indexed driver, keyed by driver id.
+    _added: int
+    #     The number of drivers ever added to the index.
+    #
+    # === Representation Invariants ===
+    # The first len(_drivers) entries of each array are in use, and slot i
+    # of each array holds the state of _drivers[i].
+
+    def __init__(self, oracle: Optional[DistanceOracle] = None) -> None:
+        """Initialize an empty FleetArrays, for drivers that travel by
+        <oracle>, or on an open grid if it is None.
+
+        """
+        self._oracle = oracle
+        self._rows = np.empty(_INITIAL_CAPACITY, np.int64)
+        self._columns = np.empty(_INITIAL_CAPACITY, np.int64)
+        self._speeds = np.empty(_INITIAL_CAPACITY, np.float64)
+        self._order = np.empty(_INITIAL_CAPACITY, np.int64)
+        self._drivers = []
+        self._slots = {}
+        self._added = 0
+        self.scanned = 0
+
+    def __len__(self) -> int:
+        """Return the number of drivers in this index.
+
+        """
+        return len(self._drivers)
+
+    def __contains__(self, driver: Driver) -> bool:
+        """Return True iff <driver> is in this index.
+
+        """
+        return driver.id in self._slots
+
+    def __iter__(self) -> Iterator[Driver]:
+        """Yield the drivers in this index, in the order they were added.
+
+        """
+        size = len(self._drivers)
+        for slot in np.argsort(self._order[:size], kind="stable"):
+            yield self._drivers[slot]
+
+    def add(self, driver: Driver) -> None:
+        """Add <driver> to this index and start tracking its moves.
+
+        Precondition: <driver> is not in this index.
+        """
+        slot = len(self._drivers)
+        if slot == len(self._rows):
+            self._grow()
+        self._rows[slot] = driver.location.rows
+        self._columns[slot] = driver.location.columns
+        self._speeds[slot] = driver.get_speed()
+        self._order[slot] = self._added
+        self._added += 1
+        self._drivers.append(driver)
+        self._slots[driver.id] = slot
+        driver.set_move_listener(self.relocate)
+
+    def remove(self, driver: Driver) -> None:
+        """Remove <driver> from this index and stop tracking its moves.
+
+        Precondition: <driver> is in this index.
+        """
+        slot = self._slots.pop(driver.id)
+        last = len(self._drivers) - 1
+        moved = self._drivers.pop()
+        if slot != last:
+            # Fill the hole with the driver in the last slot.
+            for array in (self._rows, self._columns, self._speeds,
+                          self._order):
+                array[slot] = array[last]
+            self._drivers[slot] = moved
+            self._slots[moved.id] = slot
+        driver.set_move_listener(None)
+
+    def relocate(self, driver: Driver) -> None:
+        """Record the current location of <driver>.
+
+        Precondition: <driver> is in this index.
+        """
+        slot = self._slots[driver.id]
+        self._rows[slot] = driver.location.rows
+        self._columns[slot] = driver.location.columns
+
+    def nearest(self, location: Location) -> Optional[Driver]:
+        """Return the driver with the shortest travel time to <location>,
+        or None if no driver in this index can reach it.
+
+        """
+        size = len(self._drivers)
+        if not size:
+            return None
+        self.scanned += size
+        dist = (np.abs(self._rows[:size] - location.rows)
+                + np.abs(self._columns[:size] - location.columns))
+        # np.rint and round both round halves to even.
+        times = np.rint(dist / self._speeds[:size])
+        if self._oracle is None:
+            ties = np.flatnonzero(times == times.min())
+            return self._drivers[ties[np.argmin(self._order[ties])]]
+
+        best = None
+        for slot in np.lexsort((self._order[:size], times)):
+            if best is not None and times[slot] > best[0]:
+                break
+            driver = self._drivers[slot]
+            candidate = (driver.get_travel_time(location),
+                         self._order[slot], driver)
+            if candidate[0] != math.inf and (
+                    best is None or candidate[:2] < best[:2]):
+                best = candidate
+        return None if best is None else best[2]
+
+    def _grow(self) -> None:
+        """Double the capacity of every array.
+
+        """
+        for name in ("_rows", "_columns", "_speeds", "_order"):
+            array = getattr(self, name)
+            grown = np.empty(2 * len(array), array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+
+
+class VectorDispatcher(Dispatcher):
+    """A dispatcher that finds the nearest available driver for a rider with
+    a vectorized pass over the fleet, held in FleetArrays, instead of a
+    search of a DriverGrid.
+
+    It matches riders and drivers exactly as a Dispatcher does.
+    """
+
+    def __init__(self, oracle: Optional[DistanceOracle] = None) -> None:
+        """Initialize a VectorDispatcher.
+
+        oracle: The distances on the roads, which registered drivers travel
+            by. Defaults to None, for an open grid.
+        """
+        super().__init__(oracle)
+        self._activdrivers = FleetArrays(oracle)
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={'extra-imports': ['math', 'typing', 'numpy', 'dispatcher',
+                                  'driver', 'location', 'roads']})
@@ -0,0 +1,166 @@
+"""Synthetic workloads for the simulation.
+
+A Workload describes a city and its demand: the size of the grid, how many
+drivers and riders there are, when riders arrive, where they come from and
+go to, how fast drivers are and how patient riders are. generate() writes a
+seeded random event file for a workload, in the format of the assignment
+handout, so the same seed always gives the same file.
+
+=== Constants ===
+ARRIVALS: The supported rider arrival processes.
+PATIENCES: The supported rider patience distributions.
+"""
+
+import random
+from typing import Dict, List, Optional, Tuple
+
+ARRIVALS = ("uniform", "poisson", "rush")
+PATIENCES = ("uniform", "exponential")
+
+# A hotspot is a (row, column, weight, spread) tuple: riders are drawn
+# around (row, column) with a standard deviation of <spread> blocks, and
+# hotspots are chosen in proportion to their weight.
+Hotspot = Tuple[int, int, float, float]
+
+
+class Workload:
+    """A description of a synthetic workload.
+
+    === Public Attributes ===
+    rows: The number of rows in the grid.
+    columns: The number of columns in the grid.
+    drivers: The number of drivers.
+    riders: The number of riders.
+    duration: The time over which riders arrive.
+    arrival: How riders arrive, one of ARRIVALS. Uniform arrivals are spread
+        evenly at random, Poisson arrivals have exponential gaps, and rush
+        arrivals bunch up around the middle of the run.
+    driver_ramp: The time over which drivers first request riders.
+    hotspots: The hotspots riders are drawn around.
+    hotspot_fraction: The fraction of origins and destinations drawn around
+        a hotspot rather than uniformly over the grid.
+    speeds: The relative frequency of each driver speed.
+    patience: How patient riders are, one of PATIENCES.
+    patience_range: For uniform patience, the smallest and largest patience.
+        For exponential patience, the mean and the largest patience.
+    """
+
+    rows: int
+    columns: int
+    drivers: int
+    riders: int
+    duration: int
+    arrival: str
+    driver_ramp: int
+    hotspots: List[Hotspot]
+    hotspot_fraction: float
+    speeds: Dict[int, float]
+    patience: str
+    patience_range: Tuple[int, int]
+
+    def __init__(self, rows: int = 50, columns: int = 50,
+                 drivers: int = 100, riders: int = 1000,
+                 duration: int = 1000, arrival: str = "poisson",
+                 driver_ramp: int = 0,
+                 hotspots: Optional[List[Hotspot]] = None,
+                 hotspot_fraction: float = 0.0,
+                 speeds: Optional[Dict[int, float]] = None,
+                 patience: str = "uniform",
+                 patience_range: Tuple[int, int] = (5, 30)) -> None:
+        """Initialize a Workload.
+
+        Precondition: arrival in ARRIVALS and patience in PATIENCES
+        """
+        self.rows = rows
+        self.columns = columns
+        self.drivers = drivers
+        self.riders = riders
+        self.duration = duration
+        self.arrival = arrival
+        self.driver_ramp = driver_ramp
+        self.hotspots = [] if hotspots is None else hotspots
+        self.hotspot_fraction = hotspot_fraction
+        self.speeds = {1: 1.0} if speeds is None else speeds
+        self.patience = patience
+        self.patience_range = patience_range
+
+
+def generate(workload: Workload, filename: str, seed: int = 0) -> int:
+    """Write a random event file for <workload> to <filename>, using the
+    random seed <seed>. Return the number of events written.
+
+    The events are written in timestamp order.
+    """
+    rand = random.Random(seed)
+    lines = []
+    speeds = list(workload.speeds)
+    weights = list(workload.speeds.values())
+    for i in range(workload.drivers):
+        timestamp = rand.randint(0, workload.driver_ramp)
+        row, col = _point(workload, rand)
+        speed = rand.choices(speeds, weights)[0]
+        lines.append((timestamp, f"DriverRequest D{i} {row},{col} {speed}"))
+    for i, timestamp in enumerate(_arrivals(workload, rand)):
+        origin = _point(workload, rand)
+        dest = _point(workload, rand)
+        patience = _patience(workload, rand)
+        lines.append((timestamp,
+                      f"RiderRequest R{i} {origin[0]},{origin[1]} "
+                      f"{dest[0]},{dest[1]} {patience}"))
+    lines.sort(key=lambda line: line[0])
+    with open(filename, "w") as file:
+        for timestamp, line in lines:
+            file.write(f"{timestamp} {line}\n")
+    return len(lines)
+
+
+def _arrivals(workload: Workload, rand: random.Random) -> List[int]:
+    """Return the request times of the riders in <workload>, in order.
+
+    """
+    n, duration = workload.riders, workload.duration
+    if workload.arrival == "poisson":
+        times = []
+        now = 0.0
+        for _ in range(n):
+            now += rand.expovariate(n / duration)
+            times.append(int(now))
+        return times
+    if workload.arrival == "rush":
+        times = [rand.triangular(0, duration) for _ in range(n)]
+    else:
+        times = [rand.uniform(0, duration) for _ in range(n)]
+    return sorted(int(time) for time in times)
+
+
+def _point(workload: Workload, rand: random.Random) -> Tuple[int, int]:
+    """Return a random location on the grid of <workload>.
+
+    """
+    if workload.hotspots and rand.random() < workload.hotspot_fraction:
+        weights = [hotspot[2] for hotspot in workload.hotspots]
+        row, col, _, spread = rand.choices(workload.hotspots, weights)[0]
+        row = round(rand.gauss(row, spread))
+        col = round(rand.gauss(col, spread))
+        return (min(max(row, 0), workload.rows - 1),
+                min(max(col, 0), workload.columns - 1))
+    return (rand.randrange(workload.rows), rand.randrange(workload.columns))
+
+
+def _patience(workload: Workload, rand: random.Random) -> int:
+    """Return a random patience for a rider in <workload>.
+
+    """
+    low, high = workload.patience_range
+    if workload.patience == "exponential":
+        return min(max(1, round(rand.expovariate(1 / low))), high)
+    return rand.randint(low, high)
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={
+            'max-args': 13,
+            'allowed-io': ['generate'],
+            'extra-imports': ['random', 'typing']})
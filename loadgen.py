@@ -0,0 +1,184 @@
+"""A load generator for the live dispatch service.
+
+The load generator replays an event file against a running DispatchService,
+sending each request when the wall clock reaches its timestamp, sped up
+<speed> times. Requests are spread round-robin over several client
+connections, each of which pipelines its requests, and the time from
+sending each request to receiving its response is measured, so the results
+show the dispatch latency and throughput a client would see.
+
+Run this module against a service started with the same speed:
+
+    python service.py --speed 10 &
+    python loadgen.py events.txt --speed 10 --clients 4
+    python loadgen.py --lint            # check the module with python_ta
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from event import Event, DriverRequest, stream_events
+from location import Location
+from service import DEFAULT_PORT
+
+
+async def replay(filename: str, host: str = "127.0.0.1",
+                 port: int = DEFAULT_PORT, speed: float = 1.0,
+                 clients: int = 1) -> Dict[str, float]:
+    """Replay the event file <filename> against the service on <host> and
+    <port>, <speed> times faster than one time unit per second, over
+    <clients> connections. Return the results.
+
+    The results are the number of requests answered, the wall time taken,
+    the requests answered per second, the 50th, 95th and 99th percentile and
+    maximum latency in milliseconds, and the number of error responses.
+    """
+    schedules = [[] for _ in range(clients)]
+    for i, event in enumerate(stream_events(filename)):
+        schedules[i % clients].append((event.timestamp / speed,
+                                       _request_line(event)))
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    results = await asyncio.gather(
+        *[_run_client(host, port, schedule, start)
+          for schedule in schedules])
+    elapsed = loop.time() - start
+
+    latencies = sorted(latency for client in results
+                       for latency in client[0])
+    answered = len(latencies)
+    return {"requests": answered,
+            "seconds": elapsed,
+            "requests_per_sec": answered / elapsed,
+            "latency_p50_ms": _percentile(latencies, 0.50) * 1000,
+            "latency_p95_ms": _percentile(latencies, 0.95) * 1000,
+            "latency_p99_ms": _percentile(latencies, 0.99) * 1000,
+            "latency_max_ms": latencies[-1] * 1000 if latencies else 0.0,
+            "errors": sum(client[1] for client in results)}
+
+
+async def fetch_stats(host: str = "127.0.0.1",
+                      port: int = DEFAULT_PORT) -> Dict[str, object]:
+    """Return the statistics of the service on <host> and <port>.
+
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(b"Stats\n")
+    await writer.drain()
+    line = await reader.readline()
+    writer.close()
+    return json.loads(line)
+
+
+async def _run_client(host: str, port: int,
+                      schedule: List[Tuple[float, str]],
+                      start: float) -> Tuple[List[float], int]:
+    """Send each request in <schedule> over one connection once <start>
+    plus its send time has passed, and return the latency of every
+    response, in seconds, and the number of error responses.
+
+    """
+    loop = asyncio.get_running_loop()
+    reader, writer = await asyncio.open_connection(host, port)
+    sent = deque()
+    latencies = []
+    errors = 0
+
+    async def receive() -> None:
+        nonlocal errors
+        for _ in schedule:
+            line = await reader.readline()
+            if not line:
+                break
+            latencies.append(loop.time() - sent.popleft())
+            if line.startswith(b"error"):
+                errors += 1
+
+    receiver = asyncio.create_task(receive())
+    for send_at, request in schedule:
+        delay = start + send_at - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        sent.append(loop.time())
+        writer.write(request.encode("utf-8"))
+        # Wait while the service is applying backpressure.
+        await writer.drain()
+    await receiver
+    writer.close()
+    return latencies, errors
+
+
+def _request_line(event: Event) -> str:
+    """Return the request line for the initial event <event>.
+
+    >>> from driver import Driver
+    >>> _request_line(DriverRequest(3, Driver("Amaranth", Location(1, 2), 1)))
+    'DriverRequest Amaranth 1,2 1\\n'
+    """
+    if isinstance(event, DriverRequest):
+        driver = event.driver
+        return f"DriverRequest {driver.id} {_serialize(driver.location)} " \
+               f"{driver.get_speed()}\n"
+    rider = event.rider
+    return f"RiderRequest {rider.id} {_serialize(rider.origin)} " \
+           f"{_serialize(rider.dest)} {rider.patience}\n"
+
+
+def _serialize(location: Location) -> str:
+    """Return <location> in the format of an event file.
+
+    """
+    return f"{location.rows},{location.columns}"
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    """Return the value at <fraction> of the way through the sorted list
+    <values>, or 0.0 if it is empty.
+
+    >>> _percentile([1.0, 2.0, 3.0, 4.0], 0.5)
+    3.0
+    """
+    if not values:
+        return 0.0
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Replay the event file named on the command line <argv>, report the
+    results, and return the exit status.
+
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("filename")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="simulated time units per second")
+    parser.add_argument("--clients", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(replay(args.filename, args.host, args.port,
+                                 args.speed, args.clients))
+    for key, value in results.items():
+        print(f"{key:18} {value:.3f}")
+    stats = asyncio.run(fetch_stats(args.host, args.port))
+    print(json.dumps(stats, indent=2, sort_keys=True))
+    return 0
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['--lint']:
+        import python_ta
+        python_ta.check_all(
+            config={
+                'allowed-io': ['main'],
+                'extra-imports': ['argparse', 'asyncio', 'json', 'sys',
+                                  'collections', 'typing', 'event', 'location',
+                                  'service']})
+    else:
+        sys.exit(main())
@@ -1,23 +1,56 @@
 """Locations for the simulation"""
 
 from __future__ import annotations
+from typing import Dict, Tuple
 
 
 class Location:
     """A two-dimensional location.
+
+    Locations are immutable and hashable, so they can be used as dict keys
+    and set members. Locations are interned: creating a location at the
+    same coordinates as an existing one returns the existing object.
+
+    >>> Location(1, 2) is Location(1, 2)
+    True
+    >>> len({Location(1, 2), Location(1, 2), Location(2, 1)})
+    2
+
     === Public Attributes ===
     rows: Number of blocks location is from bottom of grid
     columns: Number of blocks location is from left of grid
     """
+    __slots__ = ("rows", "columns")
     rows: int
     columns: int
 
-    def __init__(self, row: int, column: int) -> None:
-        """Initialize a location.
+    def __new__(cls, row: int, column: int) -> Location:
+        """Return the location at <row> and <column>.
+
+        """
+        key = (row, column)
+        location = _INTERNED.get(key)
+        if location is None:
+            location = super().__new__(cls)
+            object.__setattr__(location, "rows", row)
+            object.__setattr__(location, "columns", column)
+            _INTERNED[key] = location
+        return location
+
+    def __setattr__(self, name: str, value: object) -> None:
+        """Refuse to change a location.
+
+        >>> Location(1, 2).rows = 3
+        Traceback (most recent call last):
+        AttributeError: Location is immutable
+        """
+        raise AttributeError("Location is immutable")
+
+    def __reduce__(self) -> tuple:
+        """Return how to rebuild this location, interned, when unpickling.
 
         """
-        self.rows = row
-        self.columns = column
+        return Location, (self.rows, self.columns)
 
     def __str__(self) -> str:
         """Return a string representation.
@@ -25,12 +58,24 @@ class Location:
         """
         return f"({self.rows}, {self.columns})"
 
-    def __eq__(self, other: Location) -> bool:
+    def __eq__(self, other: object) -> bool:
         """Return True if self equals other, and false otherwise.
 
         """
+        if not isinstance(other, Location):
+            return NotImplemented
         return self.columns == other.columns and self.rows == other.rows
 
+    def __hash__(self) -> int:
+        """Return a hash of this location's coordinates.
+
+        """
+        return hash((self.rows, self.columns))
+
+
+# Every location created so far, keyed by (row, column).
+_INTERNED: Dict[Tuple[int, int], Location] = {}
+
 
 def manhattan_distance(origin: Location, destination: Location) -> int:
     """Return the Manhattan distance between the origin and the destination.
@@ -46,10 +91,10 @@ def deserialize_location(location_str: str) -> Location:
 
     location_str: A location in the format 'row,col'
     """
-    row, col = int(location_str.split(',')[0]), int(location_str.split(',')[1])
-    return Location(row, col)
+    row, col = location_str.split(',')
+    return Location(int(row), int(col))
 
 
 if __name__ == '__main__':
     import python_ta
-    python_ta.check_all()
+    python_ta.check_all(config={'extra-imports': ['typing']})
@@ -1,7 +1,8 @@
 """
-The Monitor module contains the Monitor class, the Activity class,
-and a collection of constants. Together the elements of the module
-help keep a record of activities that have occurred.
+The Monitor module contains the Monitor class, the StreamingMonitor
+class, the EvictingMonitor class, the WindowedMonitor class, the Activity
+class, and a collection of constants. Together the
+elements of the module help keep a record of activities that have occurred.
 
 Activities fall into two categories: Rider activities and Driver
 activities. Each activity also has a description, which is one of
@@ -16,10 +17,13 @@ PICKUP: A constant used for the pickup activity description.
 DROPOFF: A constant used for the dropoff activity description.
 """
 
-from typing import Dict, List
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
 
 import location
-from location import Location
+from location import Location, manhattan_distance
+from quantiles import P2Quantile
+from spill import RiderSpill, PICKED_UP, GAVE_UP
 
 RIDER = "rider"
 DRIVER = "driver"
@@ -39,6 +43,7 @@ class Activity:
     identifier: An identifier for the person doing the activity.
     location: The location at which the activity occurred.
     """
+    __slots__ = ("time", "description", "id", "location")
 
     time: int
     description: str
@@ -104,6 +109,13 @@ class Monitor:
     def report(self) -> Dict[str, float]:
         """Return a report of the activities that have occurred.
 
+        An average over no riders or drivers is 0.0, as in a report of a run
+        stopped, with Simulation.run(..., until=...), before any rider has
+        finished waiting or any driver has requested a rider.
+
+        >>> Monitor().report()
+        {'rider_wait_time': 0.0, 'driver_total_distance': 0.0, \
+'driver_ride_distance': 0.0}
         """
         return {"rider_wait_time": self._average_wait_time(),
                 "driver_total_distance": self._average_total_distance(),
@@ -124,6 +136,8 @@ class Monitor:
                 # or CANCEL. The wait time is the difference between the two.
                 wait_time += activities[1].time - activities[0].time
                 count += 1
+        if count == 0:
+            return 0.0
         return wait_time / count
 
     def _average_total_distance(self) -> float:
@@ -139,6 +153,8 @@ class Monitor:
                 if len(act) >= 2 and i != len(act) - 1:
                     tot_dist += location.manhattan_distance(act[i].location,
                                                             act[i + 1].location)
+        if cnt == 0:
+            return 0.0
         return tot_dist / cnt
 
     def _average_ride_distance(self) -> float:
@@ -155,12 +171,408 @@ class Monitor:
                         == PICKUP and act[i + 1].description == DROPOFF:
                     tot_dist += location.manhattan_distance(act[i].location,
                                                             act[i + 1].location)
+        if cnt == 0:
+            return 0.0
         return tot_dist / cnt
 
 
+class StreamingMonitor(Monitor):
+    """A monitor that keeps running totals instead of a record of every
+    activity.
+
+    A StreamingMonitor produces the same report as a Monitor, but its memory
+    grows with the number of riders and drivers rather than the number of
+    activities, and report() takes constant time.
+    """
+
+    # === Private Attributes ===
+    _riders: Dict[str, List[int]]
+    #       For each rider, a two-element list holding the time of their
+    #       first activity and the number of activities they have had.
+    _drivers: Dict[str, Tuple[Location, str]]
+    #       For each driver, the location and description of their latest
+    #       activity.
+    _wait_time: int
+    #       The total wait time of riders who have been picked up or have
+    #       cancelled.
+    _wait_count: int
+    #       The number of riders who have been picked up or have cancelled.
+    _total_distance: int
+    #       The total distance driven by all drivers.
+    _ride_distance: int
+    #       The total distance driven by all drivers on rides.
+
+    def __init__(self) -> None:
+        """Initialize a StreamingMonitor.
+
+        """
+        super().__init__()
+        self._riders = {}
+        self._drivers = {}
+        self._wait_time = 0
+        self._wait_count = 0
+        self._total_distance = 0
+        self._ride_distance = 0
+
+    def __str__(self) -> str:
+        """Return a string representation.
+
+        """
+        return "StreamingMonitor ({} drivers, {} riders)".format(
+            len(self._drivers), len(self._riders))
+
+    def notify(self, timestamp: int, category: str, description: str,
+               identifier: str, location: Location) -> None:
+        """Notify the monitor of the activity.
+
+        timestamp: The time of the activity.
+        category: The category (DRIVER or RIDER) for the activity.
+        description: A description (REQUEST | CANCEL | PICKUP | DROP_OFF)
+            of the activity.
+        identifier: The identifier for the actor.
+        location: The location of the activity.
+        """
+        if category == RIDER:
+            rider = self._riders.get(identifier)
+            if rider is None:
+                self._riders[identifier] = [timestamp, 1]
+            else:
+                rider[1] += 1
+                if rider[1] == 2:
+                    self._wait_time += timestamp - rider[0]
+                    self._wait_count += 1
+        else:
+            last = self._drivers.get(identifier)
+            if last is not None:
+                dist = manhattan_distance(last[0], location)
+                self._total_distance += dist
+                if last[1] == PICKUP and description == DROPOFF:
+                    self._ride_distance += dist
+            self._drivers[identifier] = (location, description)
+
+    def _average_wait_time(self) -> float:
+        """Return the average wait time of riders that have either been picked
+        up or have cancelled their ride.
+
+        """
+        if self._wait_count == 0:
+            return 0.0
+        return self._wait_time / self._wait_count
+
+    def _average_total_distance(self) -> float:
+        """Return the average distance drivers have driven.
+
+        """
+        if not self._drivers:
+            return 0.0
+        return self._total_distance / len(self._drivers)
+
+    def _average_ride_distance(self) -> float:
+        """Return the average distance drivers have driven on rides.
+
+        """
+        if not self._drivers:
+            return 0.0
+        return self._ride_distance / len(self._drivers)
+
+
+class EvictingMonitor(StreamingMonitor):
+    """A streaming monitor that forgets each rider once they stop waiting.
+
+    A StreamingMonitor keeps a record of every rider it has been notified
+    of, so its memory grows with the number of riders served. An
+    EvictingMonitor folds a rider's wait into its running totals when they
+    are picked up or cancel, and drops their record, so its memory grows
+    only with the number of riders waiting at once. If given a RiderSpill,
+    it first appends the rider's record to it, on disk.
+
+    Its report is the same as a StreamingMonitor's, as long as no rider id
+    is reused: a rider who requests a driver again after being forgotten is
+    counted as a new rider.
+
+    >>> monitor = EvictingMonitor()
+    >>> monitor.notify(2, RIDER, REQUEST, "r", Location(0, 4))
+    >>> monitor.notify(6, RIDER, CANCEL, "r", Location(0, 4))
+    >>> monitor.evicted, monitor.waiting()
+    (1, 0)
+
+    === Public Attributes ===
+    evicted: The number of riders forgotten.
+    """
+
+    evicted: int
+
+    # === Private Attributes ===
+    _spill: Optional[RiderSpill]
+    #       The store that finished riders are appended to, or None if they
+    #       are not kept.
+
+    def __init__(self, spill: Optional[RiderSpill] = None) -> None:
+        """Initialize an EvictingMonitor that appends each finished rider to
+        <spill>, if it is given.
+
+        """
+        super().__init__()
+        self._spill = spill
+        self.evicted = 0
+
+    def __str__(self) -> str:
+        """Return a string representation.
+
+        """
+        return "EvictingMonitor ({} drivers, {} riders waiting)".format(
+            len(self._drivers), len(self._riders))
+
+    def notify(self, timestamp: int, category: str, description: str,
+               identifier: str, location: Location) -> None:
+        """Notify the monitor of the activity.
+
+        timestamp: The time of the activity.
+        category: The category (DRIVER or RIDER) for the activity.
+        description: A description (REQUEST | CANCEL | PICKUP | DROP_OFF)
+            of the activity.
+        identifier: The identifier for the actor.
+        location: The location of the activity.
+        """
+        if category != RIDER:
+            super().notify(timestamp, category, description, identifier,
+                           location)
+            return
+        rider = self._riders.pop(identifier, None)
+        if rider is None:
+            self._riders[identifier] = [timestamp, 1]
+            return
+        self._wait_time += timestamp - rider[0]
+        self._wait_count += 1
+        self.evicted += 1
+        if self._spill is not None:
+            self._spill.append(identifier, rider[0], timestamp,
+                               GAVE_UP if description == CANCEL
+                               else PICKED_UP, location)
+
+    def waiting(self) -> int:
+        """Return the number of riders who have requested a driver and not
+        yet stopped waiting.
+
+        """
+        return len(self._riders)
+
+
+class _Window:
+    """The activities of one window of time, for a WindowedMonitor.
+
+    === Public Attributes ===
+    start: The time the window starts.
+    end: The time the window ends, exclusive.
+    requests: The number of rider requests in the window.
+    finished: The number of riders who stopped waiting in the window, by
+        being picked up or cancelling.
+    cancelled: The number of riders who cancelled in the window.
+    waits: Estimators of quantiles of the wait times of riders who
+        stopped waiting in the window.
+    on_duty: The number of drivers on duty when the window starts.
+    joins: The number of drivers who came on duty in the window.
+    join_times: The total of the times at which they came on duty.
+    busy: The total time drivers spent on rides in the window, for rides
+        that have ended.
+    """
+    __slots__ = ("start", "end", "requests", "finished", "cancelled",
+                 "waits", "on_duty", "joins", "join_times", "busy")
+
+    start: int
+    end: int
+    requests: int
+    finished: int
+    cancelled: int
+    waits: List[P2Quantile]
+    on_duty: int
+    joins: int
+    join_times: int
+    busy: int
+
+    def __init__(self, start: int, end: int, on_duty: int,
+                 quantiles: Tuple[float, ...]) -> None:
+        """Initialize an empty window from <start> to <end>, with <on_duty>
+        drivers on duty.
+
+        """
+        self.start = start
+        self.end = end
+        self.requests = 0
+        self.finished = 0
+        self.cancelled = 0
+        self.waits = [P2Quantile(q) for q in quantiles]
+        self.on_duty = on_duty
+        self.joins = 0
+        self.join_times = 0
+        self.busy = 0
+
+    def overlap(self, start: int, end: int) -> int:
+        """Return the length of the part of <start> to <end> in this window.
+
+        """
+        return max(0, min(end, self.end) - max(start, self.start))
+
+
+class WindowedMonitor(StreamingMonitor):
+    """A streaming monitor that also reports rider wait percentiles, the
+    cancellation rate and driver utilisation in consecutive windows of
+    time.
+
+    Time is split into windows of <width> time units, and only the latest
+    <history> windows are kept, each in constant memory: wait percentiles
+    are estimated by P-square quantile sketches, not by storing waits.
+    window_report() can be called at any time during a run.
+
+    A rider's wait counts towards the window in which they stop waiting. A
+    driver is on duty from their first request, and busy from each pickup
+    to the following drop-off; utilisation is the fraction of on-duty time
+    that drivers are busy.
+
+    >>> monitor = WindowedMonitor(width=10)
+    >>> monitor.notify(0, DRIVER, REQUEST, "d", Location(0, 0))
+    >>> monitor.notify(2, RIDER, REQUEST, "r", Location(0, 4))
+    >>> monitor.notify(6, RIDER, PICKUP, "r", Location(0, 4))
+    >>> monitor.notify(6, DRIVER, PICKUP, "d", Location(0, 4))
+    >>> monitor.notify(8, DRIVER, DROPOFF, "d", Location(0, 6))
+    >>> window = monitor.window_report()[0]
+    >>> window["wait_p50"], window["cancellation_rate"], window["utilisation"]
+    (4, 0.0, 0.25)
+    """
+
+    # === Private Attributes ===
+    _width: int
+    #       The length of each window.
+    _quantiles: Tuple[float, ...]
+    #       The wait time quantiles estimated in each window.
+    _windows: Deque[_Window]
+    #       The latest windows, oldest first.
+    _on_duty: int
+    #       The number of drivers on duty.
+    _riding: Dict[str, int]
+    #       The time each driver on a ride picked their rider up, keyed by
+    #       driver id.
+    _now: int
+    #       The time of the latest activity.
+
+    def __init__(self, width: int = 60, history: int = 1440,
+                 quantiles: Tuple[float, ...] = (0.5, 0.95, 0.99)) -> None:
+        """Initialize a WindowedMonitor with windows of <width> time units,
+        keeping the latest <history> windows, and estimating the wait time
+        <quantiles> in each.
+
+        Precondition: width > 0 and history > 0
+        """
+        super().__init__()
+        self._width = width
+        self._quantiles = quantiles
+        self._windows = deque(maxlen=history)
+        self._on_duty = 0
+        self._riding = {}
+        self._now = 0
+
+    def notify(self, timestamp: int, category: str, description: str,
+               identifier: str, location: Location) -> None:
+        """Notify the monitor of the activity.
+
+        timestamp: The time of the activity.
+        category: The category (DRIVER or RIDER) for the activity.
+        description: A description (REQUEST | CANCEL | PICKUP | DROP_OFF)
+            of the activity.
+        identifier: The identifier for the actor.
+        location: The location of the activity.
+        """
+        new_driver = category == DRIVER and identifier not in self._drivers
+        super().notify(timestamp, category, description, identifier,
+                       location)
+        window = self._window_at(timestamp)
+        if category == RIDER:
+            first, count = self._riders[identifier]
+            if count == 1:
+                window.requests += 1
+            elif count == 2:
+                window.finished += 1
+                if description == CANCEL:
+                    window.cancelled += 1
+                for estimator in window.waits:
+                    estimator.add(timestamp - first)
+        else:
+            if new_driver:
+                window.joins += 1
+                window.join_times += timestamp
+                self._on_duty += 1
+            if description == PICKUP:
+                self._riding[identifier] = timestamp
+            elif description == DROPOFF and identifier in self._riding:
+                start = self._riding.pop(identifier)
+                for past in reversed(self._windows):
+                    if past.end <= start:
+                        break
+                    past.busy += past.overlap(start, timestamp)
+
+    def window_report(self) -> List[Dict[str, Optional[float]]]:
+        """Return a report of each window kept, oldest first, up to the
+        time of the latest activity.
+
+        Each report holds the start and end of the window, the number of
+        rider requests, the wait time quantiles (None if no rider stopped
+        waiting in the window), the cancellation rate (None likewise), and
+        the driver utilisation (None if no driver was on duty).
+        """
+        # Count the rides still going on up to now.
+        ongoing = {}
+        for start in self._riding.values():
+            for window in reversed(self._windows):
+                if window.end <= start:
+                    break
+                ongoing[window.start] = ongoing.get(window.start, 0) + \
+                    window.overlap(start, self._now)
+        reports = []
+        for window in self._windows:
+            end = min(window.end, self._now)
+            busy = window.busy + ongoing.get(window.start, 0)
+            duty = (window.on_duty * (end - window.start)
+                    + window.joins * end - window.join_times)
+            report = {"start": window.start, "end": window.end,
+                      "requests": window.requests}
+            for estimator in window.waits:
+                report[f"wait_p{estimator.quantile * 100:g}"] = \
+                    estimator.value()
+            report["cancellation_rate"] = (
+                window.cancelled / window.finished if window.finished
+                else None)
+            report["utilisation"] = busy / duty if duty > 0 else None
+            reports.append(report)
+        return reports
+
+    def _window_at(self, timestamp: int) -> _Window:
+        """Return the window containing <timestamp>, opening windows up to
+        it if needed.
+
+        Precondition: <timestamp> is at least the time of every earlier
+        activity.
+        """
+        self._now = timestamp
+        windows = self._windows
+        if windows and timestamp < windows[-1].end:
+            return windows[-1]
+        start = timestamp - timestamp % self._width
+        if windows:
+            # Open the empty windows in between, up to the history kept.
+            first = max(windows[-1].end,
+                        start - (windows.maxlen - 1) * self._width)
+            for gap in range(first, start, self._width):
+                windows.append(_Window(gap, gap + self._width, self._on_duty,
+                                       self._quantiles))
+        windows.append(_Window(start, start + self._width, self._on_duty,
+                               self._quantiles))
+        return windows[-1]
+
+
 if __name__ == "__main__":
     import python_ta
     python_ta.check_all(
         config={
             'max-args': 6,
-            'extra-imports': ['typing', 'location']})
+            'extra-imports': ['collections', 'typing', 'location',
+                              'quantiles', 'spill']})
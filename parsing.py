@@ -0,0 +1,382 @@
+"""A bulk parser for large event files.
+
+create_event_list parses an event file one line at a time, building each
+Driver or Rider as it goes. This module parses the raw bytes of the file
+instead, in ranges that end on line boundaries, into compact columns of
+numbers and a table of actor ids, without making any object per event.
+The ranges can be parsed by a pool of worker processes, each reading its
+own range of the file, so loading a multi-gigabyte trace uses every core.
+
+The columns can be turned into Events with EventArrays.events, or used as
+they are, for example to analyse a trace without simulating it.
+
+A malformed line is reported as a ValueError naming the file and the line
+number, counting from 1.
+"""
+
+import gc
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from binformat import DRIVER_REQUEST, RIDER_REQUEST
+from driver import Driver
+from event import Event, DriverRequest, RiderRequest
+from location import Location
+from rider import Rider
+
+# The number of fields on a line of each event type, keyed by event type.
+_FIELDS = {b"DriverRequest": 5, b"RiderRequest": 6}
+
+# The type codes of the columns of EventArrays, in the order they are
+# passed between processes.
+_COLUMNS = (("timestamp", "q"), ("kind", "B"), ("actor", "I"), ("row", "i"),
+            ("column", "i"), ("dest_row", "i"), ("dest_column", "i"),
+            ("value", "i"))
+
+# The columns and id table parsed from a range of a file, the number of
+# lines in the range, and the line number within the range and message of
+# the first malformed line, if there is one.
+_Parsed = Tuple[Tuple[array, ...], List[str], int, Optional[Tuple[int, str]]]
+
+
+class EventArrays:
+    """The events of an event file, as columns of numbers.
+
+    The columns are parallel arrays, with one entry per event, in file
+    order. Drivers have a destination of 0,0.
+
+    === Public Attributes ===
+    timestamp: The timestamp of each event.
+    kind: DRIVER_REQUEST or RIDER_REQUEST, as in binformat, for each event.
+    actor: The index into ids of the id of each event's driver or rider.
+    row: The row of each driver's location or rider's origin.
+    column: The column of each driver's location or rider's origin.
+    dest_row: The row of each rider's destination.
+    dest_column: The column of each rider's destination.
+    value: The speed of each driver or patience of each rider.
+    ids: The actor ids, in the order they first appear in the file.
+    """
+
+    timestamp: array
+    kind: array
+    actor: array
+    row: array
+    column: array
+    dest_row: array
+    dest_column: array
+    value: array
+    ids: List[str]
+
+    # === Private Attributes ===
+    _index: Dict[str, int]
+    #     The index of each id in ids.
+
+    def __init__(self) -> None:
+        """Initialize EventArrays with no events.
+
+        """
+        for name, code in _COLUMNS:
+            setattr(self, name, array(code))
+        self.ids = []
+        self._index = {}
+
+    def __len__(self) -> int:
+        """Return the number of events.
+
+        """
+        return len(self.timestamp)
+
+    def events(self) -> Iterator[Event]:
+        """Yield the events, in file order.
+
+        """
+        ids = self.ids
+        for (timestamp, kind, actor, row, col, dest_row, dest_col,
+             value) in zip(*[getattr(self, name) for name, _ in _COLUMNS]):
+            if kind == DRIVER_REQUEST:
+                yield DriverRequest(timestamp, Driver(
+                    ids[actor], Location(row, col), value))
+            else:
+                yield RiderRequest(timestamp, Rider(
+                    ids[actor], value, Location(row, col),
+                    Location(dest_row, dest_col)))
+
+    def _extend(self, columns: Tuple[array, ...], ids: List[str]) -> None:
+        """Append the <columns> parsed from a range of the file, whose actor
+        column indexes <ids>.
+
+        """
+        renumber = []
+        for identifier in ids:
+            number = self._index.get(identifier)
+            if number is None:
+                number = self._index[identifier] = len(self.ids)
+                self.ids.append(identifier)
+            renumber.append(number)
+        for (name, _), column in zip(_COLUMNS, columns):
+            if name == "actor":
+                column = array("I", map(renumber.__getitem__, column))
+            getattr(self, name).extend(column)
+
+
+def load_arrays(filename: str, processes: int = 1,
+                chunk_bytes: int = 2 ** 24) -> EventArrays:
+    """Return the events in the event file <filename> as EventArrays.
+
+    Raise ValueError, naming the line, if a line is malformed.
+
+    processes: The number of worker processes to parse with, or 0 for one
+        per core. With 1, the file is parsed in this process.
+    chunk_bytes: The approximate size of the ranges the file is parsed in.
+
+    >>> arrays = load_arrays("events.txt")
+    >>> len(arrays), arrays.ids[:2]
+    (12, ['Amaranth', 'Bergamot'])
+    >>> print(next(arrays.events()))
+    0 -- Driver Amaranth currently at (1, 1) with speed 1: Request a rider
+    """
+    processes = processes or os.cpu_count() or 1
+    jobs = [(filename, start, end)
+            for start, end in _split(filename, chunk_bytes, processes)]
+    if processes == 1:
+        return _merge(filename, map(_parse_range, jobs))
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return _merge(filename, pool.map(_parse_range, jobs))
+
+
+def load_events(filename: str, processes: int = 1,
+                chunk_bytes: int = 2 ** 24) -> List[Event]:
+    """Return a list of the Events in the event file <filename>, in file
+    order, as create_event_list does.
+
+    Raise ValueError, naming the line, if a line is malformed.
+
+    processes: The number of worker processes to parse with, or 0 for one
+        per core. With 1, the file is parsed in this process.
+    chunk_bytes: The approximate size of the ranges the file is parsed in.
+    """
+    arrays = load_arrays(filename, processes, chunk_bytes)
+    with _paused_gc():
+        return list(arrays.events())
+
+
+def parse_chunk(data: bytes) -> _Parsed:
+    """Parse the lines of an event file in <data>, and return the columns
+    and id table of their events, the number of lines, and the line number
+    within <data> and message of the first malformed line, or None.
+
+    Parsing stops at the first malformed line.
+
+    >>> columns, ids, lines, error = parse_chunk(
+    ...     b"# header\\n3 DriverRequest Amaranth 1,2 1\\n4 Ride\\n")
+    >>> list(columns[0]), ids, lines, error
+    ([3], ['Amaranth'], 3, (3, "unknown event type 'Ride'"))
+    >>> parse_chunk(b"0 DriverRequest A 1 1 1\\n")[3]
+    (1, "expected a location as row,col, not '1'")
+    >>> parse_chunk(b"0 RiderRequest R 4 2 1,5 15\\n")[3]
+    (1, "expected a location as row,col, not '4'")
+    """
+    # Each event is appended to <flat> as one value per column, and the
+    # columns are sliced out at the end, which is much faster than
+    # appending to each column in turn.
+    flat = []
+    index = {}
+    lines = data.split(b"\n")
+    if lines and not lines[-1]:
+        lines.pop()
+    for number, line in enumerate(lines, 1):
+        # Well-formed lines are parsed without checking each field in turn.
+        # A line that does not have the expected fields, or whose locations
+        # are not row,col, is parsed again by _parse_fields.
+        tokens = line.split()
+        try:
+            if len(tokens) == 6 and tokens[1] == b"RiderRequest":
+                origin = tokens[3].split(b",")
+                dest = tokens[4].split(b",")
+                if len(origin) == 2 and len(dest) == 2:
+                    flat.extend((int(tokens[0]), RIDER_REQUEST,
+                                 index.setdefault(tokens[2], len(index)),
+                                 int(origin[0]), int(origin[1]),
+                                 int(dest[0]), int(dest[1]),
+                                 int(tokens[5])))
+                    continue
+            elif len(tokens) == 5 and tokens[1] == b"DriverRequest":
+                location = tokens[3].split(b",")
+                if len(location) == 2:
+                    flat.extend((int(tokens[0]), DRIVER_REQUEST,
+                                 index.setdefault(tokens[2], len(index)),
+                                 int(location[0]), int(location[1]), 0, 0,
+                                 int(tokens[4])))
+                    continue
+        except ValueError:
+            pass
+        if not tokens or tokens[0].startswith(b"#"):
+            continue
+        try:
+            fields = _parse_fields(tokens)
+        except ValueError as error:
+            return (_columns(flat), _decode(index), number,
+                    (number, str(error)))
+        flat.extend(fields[:2])
+        flat.append(index.setdefault(tokens[2], len(index)))
+        flat.extend(fields[2:])
+    return _columns(flat), _decode(index), len(lines), None
+
+
+def _parse_fields(tokens: List[bytes]) -> Tuple[int, ...]:
+    """Return the timestamp, kind, row, column, destination row and column,
+    and speed or patience of the event on a line split into <tokens>.
+
+    Raise ValueError, saying why, if the line is malformed.
+
+    >>> _parse_fields(b"3 DriverRequest Amaranth 1,2 1 extra".split())
+    (3, 0, 1, 2, 0, 0, 1)
+    >>> _parse_fields(b"3 DriverRequest Amaranth 1;2 1".split())
+    Traceback (most recent call last):
+    ValueError: expected a location as row,col, not '1;2'
+    """
+    if len(tokens) < 2:
+        raise ValueError("expected an event type")
+    fields = _FIELDS.get(tokens[1])
+    if fields is None:
+        name = tokens[1].decode("utf-8", "replace")
+        raise ValueError(f"unknown event type {name!r}")
+    if len(tokens) < fields:
+        raise ValueError(f"expected {fields} fields, not {len(tokens)}")
+    timestamp = _parse_int(tokens[0], "timestamp")
+    row, col = _parse_location(tokens[3])
+    if fields == 6:
+        dest_row, dest_col = _parse_location(tokens[4])
+        patience = _parse_int(tokens[5], "patience")
+        return timestamp, RIDER_REQUEST, row, col, dest_row, dest_col, \
+            patience
+    return timestamp, DRIVER_REQUEST, row, col, 0, 0, \
+        _parse_int(tokens[4], "speed")
+
+
+def _parse_location(token: bytes) -> Tuple[int, int]:
+    """Return the row and column of the location <token>.
+
+    Raise ValueError if it is not in the format 'row,col'.
+    """
+    parts = token.split(b",")
+    try:
+        if len(parts) == 2:
+            return int(parts[0]), int(parts[1])
+    except ValueError:
+        pass
+    raise ValueError(f"expected a location as row,col, not "
+                     f"{token.decode('utf-8', 'replace')!r}")
+
+
+def _parse_int(token: bytes, name: str) -> int:
+    """Return the integer <token>, the field called <name>.
+
+    Raise ValueError if it is not an integer.
+    """
+    try:
+        return int(token)
+    except ValueError:
+        raise ValueError(f"expected an integer {name}, not "
+                         f"{token.decode('utf-8', 'replace')!r}") from None
+
+
+def _columns(flat: List[int]) -> Tuple[array, ...]:
+    """Return the columns of the events in <flat>, which holds the value of
+    each column of each event in turn.
+
+    """
+    width = len(_COLUMNS)
+    return tuple(array(code, flat[i::width])
+                 for i, (_, code) in enumerate(_COLUMNS))
+
+
+def _parse_range(job: Tuple[str, int, int]) -> _Parsed:
+    """Parse the bytes from offset <start> up to <end> of the event file
+    <filename>, where <job> is (<filename>, <start>, <end>), as parse_chunk
+    does.
+
+    """
+    filename, start, end = job
+    with open(filename, "rb") as file:
+        file.seek(start)
+        data = file.read(end - start)
+    with _paused_gc():
+        return parse_chunk(data)
+
+
+def _merge(filename: str, parsed: Iterator[_Parsed]) -> EventArrays:
+    """Return the EventArrays of the ranges of the event file <filename>
+    parsed in <parsed>, in file order.
+
+    Raise ValueError at the first malformed line.
+    """
+    arrays = EventArrays()
+    line = 0
+    for columns, ids, lines, error in parsed:
+        if error is not None:
+            raise ValueError(f"{filename}, line {line + error[0]}: "
+                             f"{error[1]}")
+        arrays._extend(columns, ids)
+        line += lines
+    return arrays
+
+
+def _split(filename: str, chunk_bytes: int,
+           processes: int) -> List[Tuple[int, int]]:
+    """Return the (start, end) offsets of ranges of the file <filename> of
+    about <chunk_bytes> bytes each, and at least <processes> of them if the
+    file is large enough, each ending just after a newline or at the end of
+    the file.
+
+    """
+    size = os.path.getsize(filename)
+    step = max(1, min(chunk_bytes, size // processes))
+    ranges = []
+    start = 0
+    with open(filename, "rb") as file:
+        while start < size:
+            file.seek(min(start + step, size) - 1)
+            file.readline()
+            end = min(file.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+@contextmanager
+def _paused_gc() -> Iterator[None]:
+    """Pause the cyclic garbage collector for the duration of the block.
+
+    Parsing allocates millions of objects that all stay alive, none of them
+    in reference cycles, and each allocation may otherwise trigger a
+    collection that scans every object made so far.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _decode(index: Dict[bytes, int]) -> List[str]:
+    """Return the ids in <index>, decoded, in index order.
+
+    """
+    return [identifier.decode("utf-8") for identifier in index]
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={
+            'allowed-io': ['_parse_range', '_split'],
+            'extra-imports': ['array', 'concurrent.futures', 'contextlib', 'gc',
+                              'os', 'typing',
+                              'binformat', 'driver', 'event', 'location',
+                              'rider']})
@@ -0,0 +1,118 @@
+"""Hot-path profiling for the simulation.
+
+A Profiler attached to a Simulation records, for every event it does, the
+type of the event, the wall time its do() took and the depth of the event
+queue, and for every request_driver call, the time the dispatcher took to
+match and the number of drivers it scanned. A Simulation without a profiler
+runs its plain event loop, so profiling costs nothing when it is disabled.
+"""
+
+from typing import Callable, Dict, List, Tuple
+
+from event import Event
+
+# A subscriber is called after each event with the event, the wall time its
+# do() took in seconds, and the depth of the event queue afterwards.
+Subscriber = Callable[[Event, float, int], None]
+
+
+class Profiler:
+    """A record of where a simulation spends its time.
+
+    === Public Attributes ===
+    event_counts: The number of events done, keyed by event type name.
+    event_seconds: The total wall time spent doing events, keyed by event
+        type name.
+    queue_depth: The depth of the event queue after the last event done at
+        each simulated time, as (timestamp, depth) pairs in time order.
+    match_calls: The number of request_driver calls.
+    match_seconds: The total wall time of request_driver calls.
+    match_max_seconds: The longest wall time of a request_driver call.
+    drivers_scanned: The total number of drivers scanned by request_driver
+        calls.
+    """
+
+    event_counts: Dict[str, int]
+    event_seconds: Dict[str, float]
+    queue_depth: List[Tuple[int, int]]
+    match_calls: int
+    match_seconds: float
+    match_max_seconds: float
+    drivers_scanned: int
+
+    # === Private Attributes ===
+    _subscribers: List[Subscriber]
+    #     The functions called after each event.
+
+    def __init__(self) -> None:
+        """Initialize an empty Profiler.
+
+        """
+        self.event_counts = {}
+        self.event_seconds = {}
+        self.queue_depth = []
+        self.match_calls = 0
+        self.match_seconds = 0.0
+        self.match_max_seconds = 0.0
+        self.drivers_scanned = 0
+        self._subscribers = []
+
+    def subscribe(self, subscriber: Subscriber) -> None:
+        """Call <subscriber> after each event, with the event, the wall time
+        its do() took in seconds, and the depth of the event queue.
+
+        """
+        self._subscribers.append(subscriber)
+
+    def record_event(self, event: Event, seconds: float, depth: int) -> None:
+        """Record that doing <event> took <seconds>, leaving <depth> events
+        in the event queue.
+
+        >>> profiler = Profiler()
+        >>> profiler.record_event(Event(3), 0.5, 2)
+        >>> profiler.record_event(Event(3), 0.25, 4)
+        >>> profiler.event_counts, profiler.queue_depth
+        ({'Event': 2}, [(3, 4)])
+        """
+        name = type(event).__name__
+        self.event_counts[name] = self.event_counts.get(name, 0) + 1
+        self.event_seconds[name] = self.event_seconds.get(name, 0.0) + seconds
+        if self.queue_depth and self.queue_depth[-1][0] == event.timestamp:
+            self.queue_depth[-1] = (event.timestamp, depth)
+        else:
+            self.queue_depth.append((event.timestamp, depth))
+        for subscriber in self._subscribers:
+            subscriber(event, seconds, depth)
+
+    def record_match(self, seconds: float, scanned: int) -> None:
+        """Record a request_driver call that took <seconds> and scanned
+        <scanned> drivers.
+
+        """
+        self.match_calls += 1
+        self.match_seconds += seconds
+        self.match_max_seconds = max(self.match_max_seconds, seconds)
+        self.drivers_scanned += scanned
+
+    def summary(self) -> Dict[str, object]:
+        """Return a summary of the profile.
+
+        """
+        calls = max(self.match_calls, 1)
+        return {
+            "events": {name: {"count": count,
+                              "seconds": self.event_seconds[name]}
+                       for name, count in self.event_counts.items()},
+            "event_seconds": sum(self.event_seconds.values()),
+            "max_queue_depth": max((depth for _, depth in self.queue_depth),
+                                   default=0),
+            "match_calls": self.match_calls,
+            "match_mean_seconds": self.match_seconds / calls,
+            "match_max_seconds": self.match_max_seconds,
+            "drivers_scanned_per_match": self.drivers_scanned / calls,
+        }
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={'extra-imports': ['typing', 'event']})
@@ -0,0 +1,133 @@
+"""Streaming quantile estimates in constant memory"""
+
+from bisect import insort
+from typing import List, Optional
+
+
+class P2Quantile:
+    """An estimate of one quantile of a stream of numbers, by the P-square
+    algorithm of Jain and Chlamtac.
+
+    The estimator keeps five markers, whatever the length of the stream:
+    the minimum, the maximum, the estimated quantile, and estimates halfway
+    to it from either side. Each new number moves the markers by at most
+    one position, with their heights adjusted by piecewise-parabolic
+    interpolation. Up to five numbers, the estimate is exact.
+
+    >>> median = P2Quantile(0.5)
+    >>> median.value() is None
+    True
+    >>> for x in [5, 1, 4, 2, 3]:
+    ...     median.add(x)
+    >>> median.value()
+    3
+    >>> for x in range(6, 1001):
+    ...     median.add(x)
+    >>> round(median.value())
+    500
+
+    === Public Attributes ===
+    quantile: The quantile estimated, between 0 and 1.
+    count: The number of numbers added.
+    """
+    __slots__ = ("quantile", "count", "_heights", "_positions", "_desired",
+                 "_increments")
+
+    quantile: float
+    count: int
+
+    # === Private Attributes ===
+    _heights: List[float]
+    #     The heights of the markers, in increasing order.
+    _positions: List[int]
+    #     The positions of the markers in the stream, in sorted order,
+    #     counting from 1.
+    _desired: List[float]
+    #     The ideal positions of the markers.
+    _increments: List[float]
+    #     The amount each ideal position grows by per number added.
+
+    def __init__(self, quantile: float) -> None:
+        """Initialize an estimator of <quantile>.
+
+        Precondition: 0 <= quantile <= 1
+        """
+        self.quantile = quantile
+        self.count = 0
+        self._heights = []
+        self._positions = [1, 2, 3, 4, 5]
+        self._desired = [1, 1 + 2 * quantile, 1 + 4 * quantile,
+                         3 + 2 * quantile, 5]
+        self._increments = [0, quantile / 2, quantile, (1 + quantile) / 2, 1]
+
+    def add(self, x: float) -> None:
+        """Add <x> to the stream.
+
+        """
+        self.count += 1
+        heights = self._heights
+        if self.count <= 5:
+            insort(heights, x)
+            return
+
+        positions = self._positions
+        if x < heights[0]:
+            heights[0] = x
+            cell = 0
+        elif x >= heights[4]:
+            heights[4] = x
+            cell = 3
+        else:
+            cell = 0
+            while x >= heights[cell + 1]:
+                cell += 1
+        for i in range(cell + 1, 5):
+            positions[i] += 1
+        for i in range(5):
+            self._desired[i] += self._increments[i]
+
+        for i in range(1, 4):
+            offset = self._desired[i] - positions[i]
+            if (offset >= 1 and positions[i + 1] - positions[i] > 1) or \
+                    (offset <= -1 and positions[i - 1] - positions[i] < -1):
+                step = 1 if offset > 0 else -1
+                height = self._parabolic(i, step)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = self._linear(i, step)
+                heights[i] = height
+                positions[i] += step
+
+    def value(self) -> Optional[float]:
+        """Return the estimated quantile, or None if no number has been
+        added.
+
+        """
+        if self.count == 0:
+            return None
+        if self.count <= 5:
+            return self._heights[round(self.quantile * (self.count - 1))]
+        return self._heights[2]
+
+    def _parabolic(self, i: int, step: int) -> float:
+        """Return the height of marker <i> moved by <step> positions, by
+        parabolic interpolation between its neighbours.
+
+        """
+        q, n = self._heights, self._positions
+        return q[i] + step / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + step) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - step) * (q[i] - q[i - 1])
+            / (n[i] - n[i - 1]))
+
+    def _linear(self, i: int, step: int) -> float:
+        """Return the height of marker <i> moved by <step> positions, by
+        linear interpolation towards its neighbour in that direction.
+
+        """
+        q, n = self._heights, self._positions
+        return q[i] + step * (q[i + step] - q[i]) / (n[i + step] - n[i])
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={'extra-imports': ['bisect', 'typing']})
@@ -26,6 +26,7 @@ class Rider:
     dest : Location where customer wants to go
     status : Current mood of the rider in reference to a ride
     """
+    __slots__ = ("id", "patience", "origin", "dest", "status")
     id: str
     patience: int
     origin: Location
@@ -0,0 +1,335 @@
+"""Road networks for the simulation.
+
+By default, drivers travel on an open grid, where the distance between two
+locations is their Manhattan distance. A RoadNetwork is a grid with
+obstacles: blocked locations, streets that take longer than one block to
+drive along, and one-way streets. A DistanceOracle answers shortest
+distance queries on a road network, and can be given to a Dispatcher, so
+that its drivers' travel times follow the roads.
+
+A road network is loaded from a text file with one command per line:
+
+    grid <rows> <columns>            the size of the grid; must come first
+    block <location>                 no street enters or leaves <location>
+    weight <from> <to> <blocks>      the street between neighbouring
+                                     locations is <blocks> long, both ways
+    oneway <from> <to> [<blocks>]    the street between neighbouring
+                                     locations only runs from <from> to <to>
+
+where locations are written 'row,col', and blank lines and lines starting
+with # are skipped.
+"""
+
+import math
+from collections import OrderedDict
+from heapq import heappop, heappush
+from typing import Dict, List, Optional, Tuple
+
+from location import Location, deserialize_location
+
+
+class RoadNetwork:
+    """A grid of locations joined by streets.
+
+    Every location starts out joined to each of its up to four neighbours
+    by a two-way street one block long.
+
+    === Public Attributes ===
+    rows: The number of rows in the grid.
+    columns: The number of columns in the grid.
+    """
+
+    rows: int
+    columns: int
+
+    # === Private Attributes ===
+    _streets: List[Dict[int, int]]
+    #     For each location, by node number, the length of the street to
+    #     each location it leads to, keyed by node number.
+    #
+    # === Representation Invariants ===
+    # Streets only join neighbouring locations, and are at least one block
+    # long.
+
+    def __init__(self, rows: int, columns: int) -> None:
+        """Initialize an open grid of <rows> by <columns> locations.
+
+        """
+        self.rows = rows
+        self.columns = columns
+        self._streets = []
+        for row in range(rows):
+            for col in range(columns):
+                streets = {}
+                for r, c in ((row - 1, col), (row + 1, col),
+                             (row, col - 1), (row, col + 1)):
+                    if 0 <= r < rows and 0 <= c < columns:
+                        streets[r * columns + c] = 1
+                self._streets.append(streets)
+
+    def node(self, location: Location) -> int:
+        """Return the node number of <location>.
+
+        """
+        if not (0 <= location.rows < self.rows
+                and 0 <= location.columns < self.columns):
+            raise ValueError(f"{location} is outside the road network")
+        return location.rows * self.columns + location.columns
+
+    def block(self, location: Location) -> None:
+        """Remove every street into and out of <location>.
+
+        """
+        node = self.node(location)
+        for streets in self._neighbours(node):
+            streets.pop(node, None)
+        self._streets[node] = {}
+
+    def set_weight(self, start: Location, end: Location,
+                   blocks: int) -> None:
+        """Make the streets between neighbouring locations <start> and <end>
+        <blocks> long, in whichever directions they run.
+
+        """
+        _check_length(blocks)
+        first, second = self._pair(start, end)
+        if second in self._streets[first]:
+            self._streets[first][second] = blocks
+        if first in self._streets[second]:
+            self._streets[second][first] = blocks
+
+    def one_way(self, start: Location, end: Location,
+                blocks: Optional[int] = None) -> None:
+        """Make the street between neighbouring locations <start> and <end>
+        run only from <start> to <end>, and make it <blocks> long if given.
+
+        """
+        first, second = self._pair(start, end)
+        self._streets[second].pop(first, None)
+        if blocks is not None:
+            _check_length(blocks)
+            if second in self._streets[first]:
+                self._streets[first][second] = blocks
+
+    def reverse_streets(self) -> List[List[Tuple[int, int]]]:
+        """Return, for each location by node number, the (node number,
+        length) pairs of the streets that lead into it.
+
+        """
+        reverse = [[] for _ in self._streets]
+        for node, streets in enumerate(self._streets):
+            for neighbour, blocks in streets.items():
+                reverse[neighbour].append((node, blocks))
+        return reverse
+
+    def _pair(self, start: Location, end: Location) -> Tuple[int, int]:
+        """Return the node numbers of <start> and <end>.
+
+        Raise ValueError if they are not neighbours.
+        """
+        if abs(start.rows - end.rows) + abs(start.columns - end.columns) != 1:
+            raise ValueError(f"{start} and {end} are not neighbours")
+        return self.node(start), self.node(end)
+
+    def _neighbours(self, node: int) -> List[Dict[int, int]]:
+        """Return the streets out of each neighbour of <node>.
+
+        """
+        row, col = divmod(node, self.columns)
+        return [self._streets[r * self.columns + c]
+                for r, c in ((row - 1, col), (row + 1, col),
+                             (row, col - 1), (row, col + 1))
+                if 0 <= r < self.rows and 0 <= c < self.columns]
+
+
+class DistanceOracle:
+    """Shortest distances on a road network.
+
+    The oracle keeps a shortest-path tree into each of the most recently
+    queried destinations, and grows each tree only as far as the queries
+    need, so a query whose origin the tree already reaches takes a couple
+    of dictionary lookups. A dispatcher asks for the distances of many
+    drivers to the same rider, so most queries are answered this way.
+    Trees that have not been used for longest are evicted once there are
+    more than <cache_size>.
+
+    Distances on a road network are never shorter than Manhattan distances,
+    so the bounds that DriverGrid searches with stay valid.
+
+    >>> roads = RoadNetwork(3, 3)
+    >>> roads.block(Location(1, 1))
+    >>> roads.one_way(Location(0, 0), Location(0, 1))
+    >>> oracle = DistanceOracle(roads)
+    >>> oracle.distance(Location(0, 0), Location(0, 1))
+    1
+    >>> oracle.distance(Location(0, 1), Location(0, 0))
+    7
+
+    === Public Attributes ===
+    searched: The number of locations settled by all searches so far.
+    """
+
+    searched: int
+
+    # === Private Attributes ===
+    _network: RoadNetwork
+    #     The road network, as it was when the oracle was made.
+    _reverse: List[List[Tuple[int, int]]]
+    #     For each location by node number, the streets that lead into it.
+    _cache_size: int
+    #     The most trees kept at once.
+    _trees: OrderedDict
+    #     The trees kept, keyed by destination node number, from least to
+    #     most recently used.
+
+    def __init__(self, network: RoadNetwork, cache_size: int = 1024) -> None:
+        """Initialize a DistanceOracle for <network>.
+
+        Later changes to <network> are not seen by the oracle.
+        """
+        self._network = network
+        self._reverse = network.reverse_streets()
+        self._cache_size = cache_size
+        self._trees = OrderedDict()
+        self.searched = 0
+
+    def distance(self, origin: Location, destination: Location) -> float:
+        """Return the length of the shortest route from <origin> to
+        <destination>, or math.inf if there is no route.
+
+        >>> roads = RoadNetwork(2, 2)
+        >>> roads.one_way(Location(0, 1), Location(0, 0))
+        >>> roads.one_way(Location(1, 0), Location(0, 0))
+        >>> DistanceOracle(roads).distance(Location(0, 0), Location(1, 1))
+        inf
+        """
+        target = self._network.node(destination)
+        tree = self._trees.get(target)
+        if tree is None:
+            tree = self._trees[target] = _Tree(target)
+            if len(self._trees) > self._cache_size:
+                self._trees.popitem(last=False)
+        else:
+            self._trees.move_to_end(target)
+        source = self._network.node(origin)
+        dist = tree.settled.get(source)
+        if dist is None:
+            dist = self._grow(tree, source)
+            if dist is None:
+                return math.inf
+        return dist
+
+    def precompute(self, destinations: List[Location]) -> None:
+        """Build complete trees into each of <destinations>, such as
+        hotspots, so later queries into them never search.
+
+        """
+        for destination in destinations:
+            target = self._network.node(destination)
+            tree = self._trees.setdefault(target, _Tree(target))
+            self._grow(tree, None)
+        while len(self._trees) > self._cache_size:
+            self._trees.popitem(last=False)
+
+    def _grow(self, tree: '_Tree', source: Optional[int]) -> Optional[int]:
+        """Grow <tree> until it reaches <source>, or as far as it goes if
+        <source> is None, and return the distance from <source>, or None if
+        it cannot be reached.
+
+        """
+        settled, tentative, frontier = tree.settled, tree.tentative, \
+            tree.frontier
+        reverse = self._reverse
+        while frontier:
+            dist, node = heappop(frontier)
+            if node in settled:
+                continue
+            settled[node] = dist
+            self.searched += 1
+            for neighbour, blocks in reverse[node]:
+                candidate = dist + blocks
+                if neighbour not in settled and \
+                        candidate < tentative.get(neighbour, candidate + 1):
+                    tentative[neighbour] = candidate
+                    heappush(frontier, (candidate, neighbour))
+            if node == source:
+                return dist
+        return None if source is None else settled.get(source)
+
+
+class _Tree:
+    """A partly grown shortest-path tree into a destination.
+
+    === Public Attributes ===
+    settled: The distance from each location the tree reaches, keyed by
+        node number.
+    tentative: The shortest distance found so far from each location on
+        the frontier, keyed by node number.
+    frontier: The (distance, node number) pairs still to settle, as a heap.
+    """
+    __slots__ = ("settled", "tentative", "frontier")
+
+    settled: Dict[int, int]
+    tentative: Dict[int, int]
+    frontier: List[Tuple[int, int]]
+
+    def __init__(self, target: int) -> None:
+        """Initialize a tree into the node numbered <target>.
+
+        """
+        self.settled = {}
+        self.tentative = {target: 0}
+        self.frontier = [(0, target)]
+
+
+def _check_length(blocks: int) -> None:
+    """Raise ValueError unless a street can be <blocks> long.
+
+    """
+    if blocks < 1:
+        raise ValueError(f"A street must be at least one block long, "
+                         f"not {blocks}")
+
+
+def load_roads(filename: str) -> RoadNetwork:
+    """Return the road network described in the file <filename>.
+
+    """
+    network = None
+    with open(filename, "r") as file:
+        for number, line in enumerate(file, 1):
+            tokens = line.split()
+            if not tokens or tokens[0].startswith("#"):
+                continue
+            try:
+                if tokens[0] == "grid":
+                    network = RoadNetwork(int(tokens[1]), int(tokens[2]))
+                elif network is None:
+                    raise ValueError("the grid size must come first")
+                elif tokens[0] == "block":
+                    network.block(deserialize_location(tokens[1]))
+                elif tokens[0] == "weight":
+                    network.set_weight(deserialize_location(tokens[1]),
+                                       deserialize_location(tokens[2]),
+                                       int(tokens[3]))
+                elif tokens[0] == "oneway":
+                    network.one_way(
+                        deserialize_location(tokens[1]),
+                        deserialize_location(tokens[2]),
+                        int(tokens[3]) if len(tokens) > 3 else None)
+                else:
+                    raise ValueError(f"unknown command {tokens[0]!r}")
+            except (ValueError, IndexError) as error:
+                raise ValueError(f"{filename}, line {number}: {error}") \
+                    from error
+    if network is None:
+        raise ValueError(f"{filename} has no grid size")
+    return network
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={
+            'allowed-io': ['load_roads'],
+            'extra-imports': ['collections', 'heapq', 'typing', 'location']})
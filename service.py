@@ -0,0 +1,360 @@
+"""A live dispatch service.
+
+A DispatchService serves a Dispatcher over a local TCP socket in real time.
+Time is driven by the wall clock instead of the event queue: one simulated
+time unit lasts <time_unit> seconds, each request is done at the simulated
+time it arrives, and the events it spawns, such as pickups, drop-offs and
+cancellations, are done when the wall clock reaches them.
+
+Clients send one request per line, and get one response line per request,
+in the order the requests were sent. Requests are lines of an event file
+without the timestamp, or a cancellation or statistics request:
+
+    RiderRequest <id> <origin> <destination> <patience>
+                                    -> "driver <id>" or "none"
+    DriverRequest <id> <location> <speed>
+                                    -> "rider <id>" or "none"
+    Cancel <rider id>               -> "ok"
+    Stats                           -> the statistics, as a JSON object
+
+and any request that cannot be served gets "error <reason>".
+
+Requests from every client share one bounded queue, served in arrival
+order. When it is full, connections stop being read until it has room, so
+a client that sends faster than the service can dispatch is slowed down by
+TCP flow control instead of growing the queue without bound.
+
+Run this module to start a service:
+
+    python service.py --port 8765 --speed 10
+    python service.py --lint            # check the module with python_ta
+
+=== Constants ===
+DEFAULT_PORT: The port a service listens on by default.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from operator import methodcaller
+from typing import Dict, List, Optional, Tuple
+
+from container import PriorityQueue
+from dispatcher import Dispatcher
+from event import (Event, Cancellation, DriverRequest, Pickup, RiderRequest,
+                   parse_event)
+from monitor import Monitor, StreamingMonitor
+from rider import Rider, WAITING
+
+DEFAULT_PORT = 8765
+
+
+class DispatchService:
+    """A service that dispatches riders and drivers as requests arrive.
+
+    === Public Attributes ===
+    requests: The number of requests served.
+    latency_seconds: The total time between reading a request and having
+        its response ready, over all requests served.
+    latency_max_seconds: The longest time between reading a request and
+        having its response ready.
+    """
+
+    requests: int
+    latency_seconds: float
+    latency_max_seconds: float
+
+    # === Private Attributes ===
+    _dispatcher: Dispatcher
+    #     The dispatcher that requests are served by.
+    _monitor: Monitor
+    #     The monitor that activities are recorded in.
+    _time_unit: float
+    #     The wall time, in seconds, that one simulated time unit lasts.
+    _max_pending: int
+    #     The most requests that may wait to be served.
+    _requests: Optional[asyncio.Queue]
+    #     The requests waiting to be served, as (line, time read, future
+    #     for the response) tuples, or None if the service is not started.
+    _events: PriorityQueue
+    #     The spawned events that have not been done yet.
+    _riders: Dict[str, Tuple[Rider, Cancellation]]
+    #     The riders that may still cancel, keyed by id, with their
+    #     scheduled Cancellation.
+    _wake: Optional[asyncio.Event]
+    #     Set when an event is scheduled, to wake the scheduler.
+    _start: float
+    #     The loop time at which the service started.
+    _tasks: List[asyncio.Task]
+    #     The worker and scheduler tasks of the service.
+
+    def __init__(self, dispatcher: Optional[Dispatcher] = None,
+                 monitor: Optional[Monitor] = None, time_unit: float = 1.0,
+                 max_pending: int = 1024) -> None:
+        """Initialize a DispatchService.
+
+        dispatcher: The dispatcher to serve. Defaults to a new Dispatcher.
+        monitor: The monitor to record activities in. Defaults to a new
+            StreamingMonitor, since a service may run indefinitely.
+        time_unit: The wall time, in seconds, of one simulated time unit.
+        max_pending: The most requests that may wait to be served before
+            clients are slowed down.
+        """
+        self._dispatcher = Dispatcher() if dispatcher is None else dispatcher
+        self._monitor = StreamingMonitor() if monitor is None else monitor
+        self._time_unit = time_unit
+        self._max_pending = max_pending
+        self._requests = None
+        self._events = PriorityQueue(methodcaller('is_live'))
+        self._riders = {}
+        self._wake = None
+        self._start = 0.0
+        self._tasks = []
+        self.requests = 0
+        self.latency_seconds = 0.0
+        self.latency_max_seconds = 0.0
+
+    async def start(self, host: str = "127.0.0.1",
+                    port: int = DEFAULT_PORT) -> asyncio.AbstractServer:
+        """Start the clock and serve requests on <host> and <port>, and
+        return the server.
+
+        Close the server and call stop() to shut the service down.
+        """
+        loop = asyncio.get_running_loop()
+        self._start = loop.time()
+        self._requests = asyncio.Queue(self._max_pending)
+        self._wake = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._work()),
+                       asyncio.create_task(self._schedule())]
+        return await asyncio.start_server(self._handle, host, port)
+
+    async def serve(self, host: str = "127.0.0.1",
+                    port: int = DEFAULT_PORT) -> None:
+        """Serve requests on <host> and <port> until cancelled.
+
+        """
+        server = await self.start(host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.stop()
+
+    def stop(self) -> None:
+        """Stop the worker and scheduler tasks of the service.
+
+        """
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def now(self) -> int:
+        """Return the current simulated time.
+
+        """
+        elapsed = asyncio.get_running_loop().time() - self._start
+        return int(elapsed / self._time_unit)
+
+    def stats(self) -> Dict[str, object]:
+        """Return the statistics of the service: the request count and
+        latencies, the number of requests waiting and events scheduled, and
+        the monitor report.
+
+        """
+        return {"time": self.now(),
+                "requests": self.requests,
+                "latency_mean_seconds":
+                    self.latency_seconds / max(self.requests, 1),
+                "latency_max_seconds": self.latency_max_seconds,
+                "pending": self._requests.qsize(),
+                "scheduled": len(self._events),
+                "report": self._monitor.report()}
+
+    async def _handle(self, reader: asyncio.StreamReader,
+                      writer: asyncio.StreamWriter) -> None:
+        """Serve the requests of one client connection, responding in the
+        order they were sent.
+
+        """
+        loop = asyncio.get_running_loop()
+        responses = asyncio.Queue(self._max_pending)
+        sender = asyncio.create_task(self._respond(responses, writer))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                future = loop.create_future()
+                # Both queues are bounded, so a full queue stops this
+                # connection being read until it has room.
+                if not await _put_while(responses, future, sender):
+                    break
+                await self._requests.put((line.decode("utf-8"),
+                                          loop.time(), future))
+        except ConnectionError:
+            pass
+        finally:
+            await _put_while(responses, None, sender)
+            await sender
+
+    async def _respond(self, responses: asyncio.Queue,
+                       writer: asyncio.StreamWriter) -> None:
+        """Write the response to each request of a connection, in order,
+        until None is taken from <responses>, then close the connection.
+
+        """
+        try:
+            while True:
+                future = await responses.get()
+                if future is None:
+                    break
+                writer.write((await future + "\n").encode("utf-8"))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _work(self) -> None:
+        """Serve requests, in the order they were read.
+
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            line, read_at, future = await self._requests.get()
+            response = self._dispatch(line)
+            if not future.done():
+                future.set_result(response)
+            latency = loop.time() - read_at
+            self.requests += 1
+            self.latency_seconds += latency
+            self.latency_max_seconds = max(self.latency_max_seconds, latency)
+
+    async def _schedule(self) -> None:
+        """Do each scheduled event once the wall clock reaches it.
+
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wake.clear()
+            if self._events.is_empty():
+                await self._wake.wait()
+                continue
+            due = self._start + self._events.peek().timestamp * self._time_unit
+            if due > loop.time():
+                try:
+                    await asyncio.wait_for(self._wake.wait(),
+                                           due - loop.time())
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            event = self._events.remove()
+            if isinstance(event, (Pickup, Cancellation)):
+                # The rider has been picked up or has given up.
+                self._riders.pop(event.rider.id, None)
+            self._add(event.do(self._dispatcher, self._monitor))
+
+    def _dispatch(self, line: str) -> str:
+        """Serve the request <line> and return the response.
+
+        """
+        tokens = line.split()
+        if not tokens:
+            return "error empty request"
+        if tokens[0] == "Stats":
+            return json.dumps(self.stats())
+        if tokens[0] == "Cancel":
+            if len(tokens) != 2 or tokens[1] not in self._riders:
+                return "error no such waiting rider"
+            rider, cancellation = self._riders.pop(tokens[1])
+            cancellation.cancel()
+            if rider.status == WAITING:
+                Cancellation(self.now(), rider).do(self._dispatcher,
+                                                   self._monitor)
+            return "ok"
+        try:
+            event = parse_event(f"{self.now()} {line}")
+        except (ValueError, IndexError) as error:
+            return f"error {error}"
+        if event is None:
+            return "error empty request"
+        if isinstance(event, RiderRequest) and \
+                event.rider.id in self._riders:
+            return "error rider is already waiting"
+
+        spawned = event.do(self._dispatcher, self._monitor)
+        self._add(spawned)
+        response = "none"
+        for new in spawned:
+            if isinstance(new, Pickup):
+                if isinstance(event, DriverRequest):
+                    response = f"rider {new.rider.id}"
+                else:
+                    response = f"driver {new.driver.id}"
+            elif isinstance(new, Cancellation):
+                self._riders[new.rider.id] = (new.rider, new)
+        return response
+
+    def _add(self, events: List[Event]) -> None:
+        """Schedule <events>, waking the scheduler.
+
+        """
+        if events:
+            self._events.add_all(events)
+            self._wake.set()
+
+
+async def _put_while(queue: asyncio.Queue, item: object,
+                     consumer: asyncio.Task) -> bool:
+    """Put <item> on <queue>, waiting for room while <consumer>, the task
+    that takes items from <queue>, is running. Return whether it was put.
+
+    A consumer that has stopped, such as the sender of a connection the
+    client has dropped, never makes room, so a put must not wait on it.
+    """
+    if consumer.done():
+        return False
+    if not queue.full():
+        queue.put_nowait(item)
+        return True
+    put = asyncio.ensure_future(queue.put(item))
+    await asyncio.wait({put, consumer}, return_when=asyncio.FIRST_COMPLETED)
+    if put.done():
+        return True
+    put.cancel()
+    return False
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Serve requests with the options on the command line <argv> until
+    interrupted, and return the exit status.
+
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="simulated time units per second")
+    parser.add_argument("--max-pending", type=int, default=1024)
+    args = parser.parse_args(argv)
+    service = DispatchService(time_unit=1 / args.speed,
+                              max_pending=args.max_pending)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['--lint']:
+        import python_ta
+        python_ta.check_all(
+            config={
+                'extra-imports': ['argparse', 'asyncio', 'json', 'sys',
+                                  'operator', 'typing', 'container',
+                                  'dispatcher', 'event', 'monitor', 'rider']})
+    else:
+        sys.exit(main())
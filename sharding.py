@@ -0,0 +1,570 @@
+"""Spatially sharded simulation across processes.
+
+The city grid is split into rectangular regions, and each region runs its
+own event queue, Dispatcher and monitor, in a process of its own. A rider
+is simulated by the region containing their origin, and is only matched
+with drivers in that region. A driver belongs to the region they are in:
+when a ride ends in another region, the driver's Dropoff is handed off to
+that region, which takes the driver over from then on.
+
+The event file is parsed once, into columns of numbers, and each region is
+sent only the columns of its own initial events.
+
+Regions are kept in step by conservative time synchronization. A handoff
+is the Dropoff of a rider whose ride leaves their region, so it is due no
+sooner than the rider's pickup plus the shortest time the ride can take:
+its Manhattan distance at the fastest driver speed. From the riders it has
+not picked up yet, each region reports to every other region the earliest
+time a handoff to it could still be due: a waiting rider may be picked up
+at once, and a rider who has yet to request a ride no sooner than their
+request. Each region may then run every event before the earliest time
+reported to it, however far ahead that is, before handoffs are next
+exchanged. A region always runs at least the earliest pending time unit,
+and handoffs due within its window are delivered in further rounds until
+none are left. Handoffs are always delivered in a fixed order, so results
+do not depend on process timing.
+"""
+
+from __future__ import annotations
+import heapq
+import multiprocessing
+from array import array
+from operator import methodcaller
+from typing import Dict, List, Optional, Set, Tuple
+
+from binformat import DRIVER_REQUEST
+from container import PriorityQueue
+from dispatcher import Dispatcher
+from event import Event, Dropoff, RiderRequest
+from location import Location, manhattan_distance
+from monitor import DRIVER, StreamingMonitor
+from parsing import EventArrays, load_arrays
+from rider import Rider, WAITING
+
+# A handoff is a (timestamp, source region, sequence number, Dropoff event,
+# the location and description of the driver's latest activity) tuple.
+Handoff = Tuple[int, int, int, Dropoff, Tuple[Location, str]]
+
+# For each region that a region may hand drivers off to, keyed by region:
+# the shortest ride there of its waiting riders, and the earliest time a
+# rider who has yet to request a ride could be dropped off there, or None
+# for either if there is no such rider.
+Bounds = Dict[int, Tuple[Optional[int], Optional[int]]]
+
+# The names of the columns of EventArrays.
+_COLUMNS = ("timestamp", "kind", "actor", "row", "column", "dest_row",
+            "dest_column", "value")
+
+
+class Partition:
+    """A split of the city grid into a <splits[0]> by <splits[1]> grid of
+    rectangular regions, numbered in row-major order.
+
+    Locations outside the grid belong to the nearest region.
+
+    >>> partition = Partition(10, 10, (2, 2))
+    >>> [partition.region_of(Location(r, c)) for r, c in
+    ...  [(0, 0), (0, 9), (9, 0), (9, 9)]]
+    [0, 1, 2, 3]
+
+    === Public Attributes ===
+    rows: The number of rows in the grid.
+    columns: The number of columns in the grid.
+    splits: The number of regions along the rows and along the columns.
+    """
+
+    rows: int
+    columns: int
+    splits: Tuple[int, int]
+
+    def __init__(self, rows: int, columns: int,
+                 splits: Tuple[int, int]) -> None:
+        """Initialize a Partition.
+
+        """
+        self.rows = rows
+        self.columns = columns
+        self.splits = splits
+
+    def __len__(self) -> int:
+        """Return the number of regions.
+
+        """
+        return self.splits[0] * self.splits[1]
+
+    def region_of(self, location: Location) -> int:
+        """Return the region containing <location>.
+
+        """
+        row = min(max(location.rows * self.splits[0] // self.rows, 0),
+                  self.splits[0] - 1)
+        col = min(max(location.columns * self.splits[1] // self.columns, 0),
+                  self.splits[1] - 1)
+        return row * self.splits[1] + col
+
+
+class ShardedSimulation:
+    """A simulation split across processes by region.
+
+    The report of a ShardedSimulation has the same statistics as that of a
+    Simulation, aggregated over all regions.
+
+    >>> ShardedSimulation((1, 1), processes=False).run("events.txt")
+    {'rider_wait_time': 0.5, 'driver_total_distance': 4.5, \
+'driver_ride_distance': 3.8333333333333335}
+    """
+
+    # === Private Attributes ===
+    _splits: Tuple[int, int]
+    #     The number of regions along the rows and along the columns.
+    _processes: bool
+    #     Whether each region runs in a process of its own, rather than in
+    #     this process.
+
+    def __init__(self, splits: Tuple[int, int] = (2, 2),
+                 processes: bool = True) -> None:
+        """Initialize a ShardedSimulation.
+
+        """
+        self._splits = splits
+        self._processes = processes
+
+    def run(self, filename: str) -> Dict[str, float]:
+        """Run the simulation on the events in the event file <filename>.
+
+        Return a dictionary containing statistics of the simulation, as
+        Simulation.run does. Raise ValueError, naming the line, if a line is
+        malformed.
+        """
+        arrays = load_arrays(filename)
+        max_speed = max((speed for kind, speed in zip(arrays.kind,
+                                                      arrays.value)
+                         if kind == DRIVER_REQUEST), default=1)
+        partition = Partition(max(arrays.row, default=0) + 1,
+                              max(arrays.column, default=0) + 1,
+                              self._splits)
+        parts = _split_regions(arrays, partition)
+
+        if self._processes:
+            regions = [_RemoteRegion(i, partition, part, max_speed)
+                       for i, part in enumerate(parts)]
+        else:
+            regions = [_Region(i, partition, list(part.events()), max_speed)
+                       for i, part in enumerate(parts)]
+        try:
+            return _coordinate(regions)
+        finally:
+            for region in regions:
+                region.close()
+
+
+def _split_regions(arrays: EventArrays,
+                   partition: Partition) -> List[EventArrays]:
+    """Return the events of <arrays> that each region of <partition> does,
+    in file order.
+
+    The location of a driver, or origin of a rider, decides their region.
+    """
+    members = [[] for _ in range(len(partition))]
+    for i, (row, col) in enumerate(zip(arrays.row, arrays.column)):
+        members[partition.region_of(Location(row, col))].append(i)
+    parts = []
+    for indices in members:
+        part = EventArrays()
+        for name in _COLUMNS:
+            column = getattr(arrays, name)
+            getattr(part, name).extend([column[i] for i in indices])
+        # Each region numbers the ids of its own events.
+        part.ids = [arrays.ids[actor] for actor in part.actor]
+        part.actor = array("I", range(len(indices)))
+        parts.append(part)
+    return parts
+
+
+def _coordinate(regions: list) -> Dict[str, float]:
+    """Advance <regions> in safe windows until every region runs out of
+    events, and return the merged report.
+
+    """
+    next_times = [region.next_time() for region in regions]
+    bounds = [region.bounds() for region in regions]
+    inboxes = [[] for _ in regions]
+    while True:
+        due = [t for t in next_times if t is not None]
+        due += [handoff[0] for inbox in inboxes for handoff in inbox]
+        if not due:
+            break
+        ends = _window_ends(min(due), bounds)
+        active = [i for i, t in enumerate(next_times)
+                  if (t is not None and t < ends[i]) or inboxes[i]]
+        while active:
+            for i in active:
+                regions[i].send_advance(ends[i], sorted(inboxes[i],
+                                                        key=_handoff_order))
+                inboxes[i] = []
+            for i in active:
+                outgoing, next_times[i], bounds[i] = \
+                    regions[i].receive_advance()
+                for target, handoff in outgoing:
+                    inboxes[target].append(handoff)
+            # Handoffs due within a window need another round.
+            active = [i for i, inbox in enumerate(inboxes)
+                      if any(handoff[0] < ends[i] for handoff in inbox)]
+
+    return _merge([region.partial_report() for region in regions])
+
+
+def _window_ends(now: int, bounds: List[Bounds]) -> List[float]:
+    """Return the time before which each region may safely do every event,
+    when no region has an event or handoff due before <now>, and the
+    regions reported <bounds>.
+
+    A region may run to the end if no handoff to it can still be due.
+
+    >>> _window_ends(10, [{1: (4, 12)}, {0: (None, 30)}])
+    [30, 12]
+    >>> _window_ends(10, [{1: (0, None)}, {}])
+    [inf, 11]
+    """
+    ends = [float("inf")] * len(bounds)
+    for reported in bounds:
+        for target, (ride, future) in reported.items():
+            if ride is not None:
+                ends[target] = min(ends[target], now + ride)
+            if future is not None:
+                ends[target] = min(ends[target], future)
+    return [max(end, now + 1) for end in ends]
+
+
+def _handoff_order(handoff: Handoff) -> Tuple[int, int, int]:
+    """Return the key handoffs are delivered in: by timestamp, then source
+    region, then the order the source sent them in.
+
+    """
+    return handoff[0], handoff[1], handoff[2]
+
+
+def _merge(partials: List[tuple]) -> Dict[str, float]:
+    """Return the report for the partial reports of every region.
+
+    An average over no riders or drivers is 0.0, as in Monitor.report.
+
+    >>> _merge([(0, 0, 0, 0, set()), (0, 0, 0, 0, set())])
+    {'rider_wait_time': 0.0, 'driver_total_distance': 0.0, \
+'driver_ride_distance': 0.0}
+    """
+    wait_time = sum(partial[0] for partial in partials)
+    wait_count = sum(partial[1] for partial in partials)
+    total_distance = sum(partial[2] for partial in partials)
+    ride_distance = sum(partial[3] for partial in partials)
+    drivers = set()
+    for partial in partials:
+        drivers |= partial[4]
+    count = len(drivers)
+    return {"rider_wait_time": wait_time / wait_count if wait_count else 0.0,
+            "driver_total_distance": total_distance / count if count else 0.0,
+            "driver_ride_distance": ride_distance / count if count else 0.0}
+
+
+def _ride_bound(rider: Rider, max_speed: int) -> int:
+    """Return the shortest time the ride of <rider> can take, for drivers
+    no faster than <max_speed>.
+
+    """
+    return round(manhattan_distance(rider.origin, rider.dest) / max_speed)
+
+
+class _RegionMonitor(StreamingMonitor):
+    """A streaming monitor for one region, whose drivers may be handed off
+    to and from other regions.
+
+    """
+
+    # === Private Attributes ===
+    _seen: Set[str]
+    #       The ids of every driver who has had an activity in this region.
+
+    def __init__(self) -> None:
+        """Initialize a _RegionMonitor.
+
+        """
+        super().__init__()
+        self._seen = set()
+
+    def notify(self, timestamp: int, category: str, description: str,
+               identifier: str, location: Location) -> None:
+        """Notify the monitor of the activity.
+
+        """
+        super().notify(timestamp, category, description, identifier,
+                       location)
+        if category == DRIVER:
+            self._seen.add(identifier)
+
+    def hand_off(self, identifier: str) -> Tuple[Location, str]:
+        """Stop tracking the driver <identifier>, who is leaving this region,
+        and return the location and description of their latest activity.
+
+        """
+        return self._drivers.pop(identifier)
+
+    def take_over(self, identifier: str, last: Tuple[Location, str]) -> None:
+        """Start tracking the driver <identifier>, arriving in this region,
+        whose latest activity had the location and description <last>.
+
+        """
+        self._drivers[identifier] = last
+
+    def partial_report(self) -> tuple:
+        """Return the totals of this region, to be merged with those of the
+        other regions.
+
+        """
+        return (self._wait_time, self._wait_count, self._total_distance,
+                self._ride_distance, self._seen)
+
+
+class _Region:
+    """The events, dispatcher and monitor of one region.
+
+    """
+
+    # === Private Attributes ===
+    _index: int
+    #     The number of this region.
+    _partition: Partition
+    #     The split of the grid into regions.
+    _events: PriorityQueue
+    #     The events this region has yet to do.
+    _dispatcher: Dispatcher
+    #     The dispatcher for riders and drivers in this region.
+    _monitor: _RegionMonitor
+    #     The monitor for activities in this region.
+    _sent: int
+    #     The number of handoffs this region has sent.
+    _reply: tuple
+    #     The result of the latest call to send_advance.
+    _leaving: List[Tuple[int, int, int, Rider]]
+    #     The (request time, target region, shortest ride time, rider) of
+    #     each rider whose ride leaves this region, in request order.
+    _later: List[Dict[int, int]]
+    #     For each i, the earliest time that a rider in _leaving[i:] could
+    #     be dropped off in each target region, keyed by target region.
+    _requested: int
+    #     The number of riders in _leaving who have requested a ride.
+    _waiting: Dict[int, list]
+    #     For each target region, a heap of the (shortest ride time, number,
+    #     rider) of the riders in _leaving who have requested a ride and may
+    #     still be waiting.
+
+    def __init__(self, index: int, partition: Partition,
+                 events: List[Event], max_speed: int) -> None:
+        """Initialize a region with the initial <events> that belong to it,
+        for drivers no faster than <max_speed>.
+
+        """
+        self._index = index
+        self._partition = partition
+        self._events = PriorityQueue(methodcaller('is_live'))
+        self._events.add_all(events)
+        self._dispatcher = Dispatcher()
+        self._monitor = _RegionMonitor()
+        self._sent = 0
+        self._reply = ([], None, {})
+
+        self._leaving = []
+        for event in sorted(events, key=lambda e: e.timestamp):
+            if isinstance(event, RiderRequest):
+                target = partition.region_of(event.rider.dest)
+                if target != index:
+                    self._leaving.append(
+                        (event.timestamp, target,
+                         _ride_bound(event.rider, max_speed), event.rider))
+        self._later = [{}]
+        for timestamp, target, ride, _ in reversed(self._leaving):
+            later = dict(self._later[-1])
+            later[target] = min(later.get(target, timestamp + ride),
+                                timestamp + ride)
+            self._later.append(later)
+        self._later.reverse()
+        self._requested = 0
+        self._waiting = {}
+
+    def next_time(self) -> Optional[int]:
+        """Return the time of this region's next event, or None if it has
+        none.
+
+        """
+        if self._events.is_empty():
+            return None
+        return self._events.peek().timestamp
+
+    def bounds(self) -> Bounds:
+        """Return the bounds on the handoffs this region may still send.
+
+        """
+        bounds = {}
+        for target, heap in self._waiting.items():
+            while heap and heap[0][2].status != WAITING:
+                heapq.heappop(heap)
+            if heap:
+                bounds[target] = (heap[0][0], None)
+        for target, time in self._later[self._requested].items():
+            bounds[target] = (bounds.get(target, (None,))[0], time)
+        return bounds
+
+    def send_advance(self, end: float, handoffs: List[Handoff]) -> None:
+        """Take over the drivers in <handoffs>, then do every event before
+        <end>.
+
+        """
+        for _, _, _, dropoff, last in handoffs:
+            self._monitor.take_over(dropoff.driver.id, last)
+            self._events.add(dropoff)
+        outgoing = []
+        while not self._events.is_empty() and \
+                self._events.peek().timestamp < end:
+            event = self._events.remove()
+            for spawned in event.do(self._dispatcher, self._monitor):
+                target = self._index
+                if isinstance(spawned, Dropoff):
+                    target = self._partition.region_of(spawned.rider.dest)
+                if target == self._index:
+                    self._events.add(spawned)
+                else:
+                    last = self._monitor.hand_off(spawned.driver.id)
+                    outgoing.append((target, (spawned.timestamp, self._index,
+                                              self._sent, spawned, last)))
+                    self._sent += 1
+        while self._requested < len(self._leaving) and \
+                self._leaving[self._requested][0] < end:
+            _, target, ride, rider = self._leaving[self._requested]
+            heapq.heappush(self._waiting.setdefault(target, []),
+                           (ride, self._requested, rider))
+            self._requested += 1
+        self._reply = (outgoing, self.next_time(), self.bounds())
+
+    def receive_advance(self) -> Tuple[List[Tuple[int, Handoff]],
+                                       Optional[int], Bounds]:
+        """Return the handoffs sent by the latest send_advance, each with its
+        target region, the time of this region's next event, and the bounds
+        on the handoffs it may still send.
+
+        """
+        return self._reply
+
+    def partial_report(self) -> tuple:
+        """Return the totals of this region.
+
+        """
+        return self._monitor.partial_report()
+
+    def close(self) -> None:
+        """Release this region.
+
+        """
+
+
+class _RemoteRegion:
+    """A region that runs in a process of its own.
+
+    """
+
+    # === Private Attributes ===
+    _connection: multiprocessing.connection.Connection
+    #     The coordinator's end of the pipe to the region's process.
+    _process: multiprocessing.Process
+    #     The region's process.
+    _next_time: Optional[int]
+    #     The time of the region's first event.
+    _bounds: Bounds
+    #     The bounds on the region's first handoffs.
+
+    def __init__(self, index: int, partition: Partition,
+                 events: EventArrays, max_speed: int) -> None:
+        """Start a process for region <index>, with its initial <events>,
+        for drivers no faster than <max_speed>.
+
+        """
+        self._connection, child = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(
+            target=_serve,
+            args=(child, index, partition, events, max_speed), daemon=True)
+        self._process.start()
+        child.close()
+        self._next_time, self._bounds = self._connection.recv()
+
+    def next_time(self) -> Optional[int]:
+        """Return the time of the region's first event.
+
+        """
+        return self._next_time
+
+    def bounds(self) -> Bounds:
+        """Return the bounds on the region's first handoffs.
+
+        """
+        return self._bounds
+
+    def send_advance(self, end: float, handoffs: List[Handoff]) -> None:
+        """Ask the region to take over <handoffs> and do every event before
+        <end>, without waiting for it to finish.
+
+        """
+        self._connection.send(("advance", end, handoffs))
+
+    def receive_advance(self) -> Tuple[List[Tuple[int, Handoff]],
+                                       Optional[int], Bounds]:
+        """Wait for the region to finish advancing, and return its outgoing
+        handoffs, the time of its next event, and the bounds on the
+        handoffs it may still send.
+
+        """
+        return self._connection.recv()
+
+    def partial_report(self) -> tuple:
+        """Return the totals of the region.
+
+        """
+        self._connection.send(("report",))
+        return self._connection.recv()
+
+    def close(self) -> None:
+        """Stop the region's process.
+
+        """
+        self._connection.send(("stop",))
+        self._process.join()
+        self._connection.close()
+
+
+def _serve(connection: multiprocessing.connection.Connection, index: int,
+           partition: Partition, events: EventArrays,
+           max_speed: int) -> None:
+    """Run region <index>, with its initial <events>, in this process,
+    answering commands from the coordinator on <connection> until told to
+    stop.
+
+    """
+    region = _Region(index, partition, list(events.events()), max_speed)
+    connection.send((region.next_time(), region.bounds()))
+    while True:
+        command = connection.recv()
+        if command[0] == "advance":
+            region.send_advance(command[1], command[2])
+            connection.send(region.receive_advance())
+        elif command[0] == "report":
+            connection.send(region.partial_report())
+        else:
+            break
+    connection.close()
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={
+            'extra-imports': ['heapq', 'multiprocessing', 'array',
+                              'operator', 'typing', 'binformat', 'container',
+                              'dispatcher', 'event', 'location', 'monitor',
+                              'parsing', 'rider']})
@@ -1,10 +1,15 @@
 """Starting point for simulation"""
 
-from typing import List, Dict
-from container import PriorityQueue
+from collections import abc
+from operator import methodcaller
+from time import perf_counter
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+from container import Container, PriorityQueue
 from dispatcher import Dispatcher
 from event import Event, create_event_list
 from monitor import Monitor
+from profiling import Profiler
+from tracing import TraceWriter
 
 
 class Simulation:
@@ -26,53 +31,202 @@ class Simulation:
     """
 
     # === Private Attributes ===
-    _events: PriorityQueue
+    _events: Container
     #     A sequence of events arranged in priority determined by the event
-    #     sorting order.
+    #     sorting order. Events that are no longer live are skipped.
     _dispatcher: Dispatcher
     #     The dispatcher associated with the simulation.
     _monitor: Monitor
     #     The monitor associated with the simulation.
-
-    def __init__(self) -> None:
+    _profiler: Optional[Profiler]
+    #     The profiler that records where the simulation spends its time, or
+    #     None if the simulation is not profiled.
+    _tracer: Optional[TraceWriter]
+    #     The writer of the trace of events done and activities recorded, or
+    #     None if the simulation is not traced.
+    _source: Iterator[Event]
+    #     The initial events not yet taken from a lazily read source, in
+    #     timestamp order.
+    _pending: Optional[Event]
+    #     The earliest initial event from _source that has not been done yet,
+    #     or None if the source is exhausted.
+
+    def __init__(self, monitor: Optional[Monitor] = None,
+                 dispatcher: Optional[Dispatcher] = None,
+                 events: Optional[Container] = None,
+                 profiler: Optional[Profiler] = None,
+                 tracer: Optional[TraceWriter] = None) -> None:
         """Initialize a Simulation.
 
+        monitor: The monitor to record activities with, such as a
+            StreamingMonitor, or an EvictingMonitor for runs too long to
+            keep every rider in memory. Defaults to a new Monitor, which
+            keeps the full history of activities.
+        dispatcher: The dispatcher to match riders and drivers with, such as
+            a BatchDispatcher. Defaults to a new Dispatcher, which matches
+            each rider greedily as they request a driver.
+        events: The empty event queue to schedule events in, such as a
+            CalendarQueue keyed by timestamp. Defaults to a PriorityQueue
+            that skips events which are no longer live.
+        profiler: A profiler to record event timings, queue depth and
+            dispatcher matching in. Defaults to None, for no profiling.
+        tracer: A trace writer to record every event done and every
+            activity recorded in. Defaults to None, for no tracing.
         """
-        self._events = PriorityQueue()
-        self._dispatcher = Dispatcher()
-        self._monitor = Monitor()
-
-    def run(self, initial_events: List[Event]) -> Dict[str, float]:
+        if events is None:
+            events = PriorityQueue(methodcaller('is_live'))
+        self._events = events
+        self._dispatcher = Dispatcher() if dispatcher is None else dispatcher
+        self._monitor = Monitor() if monitor is None else monitor
+        self._profiler = profiler
+        self._tracer = tracer
+        self._source = iter([])
+        self._pending = None
+
+    def run(self, initial_events: Iterable[Event],
+            until: Optional[int] = None) -> Dict[str, float]:
         """Run the simulation on the list of events in <initial_events>.
 
         Return a dictionary containing statistics of the simulation,
         according to the specifications in the assignment handout.
 
-        initial_events: An initial list of events.
+        initial_events: An initial list of events, or any other sequence of
+            them, in any order. This may instead be an iterator or other
+            iterable that yields events in timestamp order, such as
+            event.stream_events; it is then read lazily, as simulated time
+            reaches each event, and ValueError is raised if an event is
+            earlier than the one before it.
+        until: If not None, stop before the first event at or after this
+            time, and return statistics of the activities so far. A later
+            call of run, with an empty list of initial events, resumes the
+            simulation where it stopped.
+
+        A run stopped before any driver has requested a rider reports
+        averages of 0.0, and resumes where it stopped:
+
+        >>> from driver import Driver
+        >>> from event import DriverRequest, RiderRequest
+        >>> from location import Location
+        >>> from rider import Rider
+        >>> simulation = Simulation()
+        >>> simulation.run([
+        ...     RiderRequest(0, Rider("Cerise", 10, Location(1, 1),
+        ...                           Location(2, 2))),
+        ...     DriverRequest(5, Driver("Amaranth", Location(1, 1), 1))],
+        ...     until=3)
+        {'rider_wait_time': 0.0, 'driver_total_distance': 0.0, \
+'driver_ride_distance': 0.0}
+        >>> simulation.run([])
+        {'rider_wait_time': 5.0, 'driver_total_distance': 2.0, \
+'driver_ride_distance': 2.0}
+
+        >>> events = create_event_list("customev.txt")
+        >>> Simulation().run(iter(events))
+        Traceback (most recent call last):
+        ...
+        ValueError: Initial events are out of timestamp order: 0 follows 15
         """
-        for ev in initial_events:
-            self._events.add(ev)
-        while not self._events.is_empty():
-            curev = self._events.remove()
-            ret = curev.do(self._dispatcher, self._monitor)
-            if ret is not None:
-                for j in ret:
-                    self._events.add(j)
-
-        # Add all initial events to the event queue.
-
-        # Until there are no more events, remove an event
-        # from the event queue and do it. Add any returned
-        # events to the event queue.
+        if isinstance(initial_events, abc.Sequence):
+            # Add all initial events to the event queue.
+            self._events.add_all(initial_events)
+        else:
+            self._source = iter(initial_events)
+            self._pending = next(self._source, None)
+
+        # Until there are no more events, take the next event from the
+        # source or the event queue, whichever is earlier, and do it. Add
+        # any returned events to the event queue.
+        pending, source = self._pending, self._source
+        if self._profiler is None and self._tracer is None:
+            while pending is not None or not self._events.is_empty():
+                if until is not None and self._next_time(pending) >= until:
+                    break
+                curev, pending = self._next_event(pending, source)
+                ret = curev.do(self._dispatcher, self._monitor)
+                if ret is not None:
+                    for j in ret:
+                        self._events.add(j)
+        else:
+            pending = self._run_observed(pending, source, until)
+        self._pending = pending
         return self._monitor.report()
 
+    def _run_observed(self, pending: Optional[Event],
+                      source: Iterator[Event],
+                      until: Optional[int]) -> Optional[Event]:
+        """Do every event from <source> and the event queue before <until>,
+        as run does, recording each event and each dispatcher match in the
+        profiler, and each event and each activity in the trace, if there
+        are ones. Return the new pending source event.
+
+        <pending> is the earliest event from <source> that has not been done
+        yet, or None if the source is exhausted.
+        """
+        profiler, tracer = self._profiler, self._tracer
+        monitor = self._monitor if tracer is None \
+            else tracer.watch(self._monitor)
+        if profiler is not None:
+            self._dispatcher.set_match_observer(profiler.record_match)
+        try:
+            while pending is not None or not self._events.is_empty():
+                if until is not None and self._next_time(pending) >= until:
+                    break
+                curev, pending = self._next_event(pending, source)
+                if tracer is not None:
+                    tracer.record_event(curev)
+                start = perf_counter()
+                ret = curev.do(self._dispatcher, monitor)
+                elapsed = perf_counter() - start
+                if ret is not None:
+                    for j in ret:
+                        self._events.add(j)
+                if profiler is not None:
+                    profiler.record_event(curev, elapsed, len(self._events))
+        finally:
+            if profiler is not None:
+                self._dispatcher.set_match_observer(None)
+        return pending
+
+    def _next_time(self, pending: Optional[Event]) -> int:
+        """Return the time of the next event to do, given the pending source
+        event <pending>.
+
+        Precondition: <pending> is not None or the event queue is not empty.
+        """
+        if self._events.is_empty():
+            return pending.timestamp
+        if pending is None:
+            return self._events.peek().timestamp
+        return min(pending.timestamp, self._events.peek().timestamp)
+
+    def _next_event(self, pending: Optional[Event],
+                    source: Iterator[Event]) -> Tuple[Event, Optional[Event]]:
+        """Return the next event to do and the new pending source event.
+
+        <pending> is the earliest event from <source> that has not been done
+        yet, or None if the source is exhausted. Source events are initial
+        events, so they are done before queued events with equal timestamps.
+
+        Precondition: <pending> is not None or the event queue is not empty.
+        """
+        if pending is not None and (self._events.is_empty()
+                                    or pending <= self._events.peek()):
+            following = next(source, None)
+            if following is not None and following < pending:
+                raise ValueError(
+                    f"Initial events are out of timestamp order: "
+                    f"{following.timestamp} follows {pending.timestamp}")
+            return pending, following
+        return self._events.remove(), pending
+
 
 if __name__ == "__main__":
     import python_ta
     python_ta.check_all(
         config={
-            'extra-imports': ['typing', 'container', 'dispatcher', 'event',
-                              'monitor']})
+            'extra-imports': ['collections', 'operator', 'time', 'typing',
+                              'container', 'dispatcher', 'event', 'monitor',
+                              'profiling', 'tracing']})
 
     events = create_event_list("events.txt")
     sim = Simulation()
@@ -0,0 +1,390 @@
+"""Spatial indexes for the simulation"""
+
+from __future__ import annotations
+import math
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from driver import Driver
+from location import Location
+from rider import Rider
+
+Cell = Tuple[int, int]
+
+
+class DriverGrid:
+    """A grid-bucketed index over drivers, answering nearest-driver queries
+    by travel time.
+
+    The city grid is split into square cells of <cell_size> blocks, and each
+    driver is stored in the bucket of the cell containing its location.
+    A query searches the cells around the query location in rings of
+    increasing distance, and stops once no driver in an unsearched ring can
+    beat the best travel time found so far.
+
+    Drivers report their own moves to the grid, so the index stays in sync
+    as drivers drive and ride while indexed.
+
+    Ties in travel time are resolved in favour of the driver that was added
+    to the grid *earliest*.
+
+    === Public Attributes ===
+    scanned: The number of drivers whose travel time has been computed by
+        nearest() so far.
+    """
+    scanned: int
+
+    # === Private Attributes ===
+    _cell_size: int
+    #     The width and height, in blocks, of a cell.
+    _buckets: Dict[Cell, Dict[str, Driver]]
+    #     The drivers in each non-empty cell, keyed by driver id.
+    _cells: Dict[str, Cell]
+    #     The cell each indexed driver is stored in, keyed by driver id.
+    _order: Dict[str, int]
+    #     The sequence number each indexed driver was added with.
+    _speeds: Dict[int, int]
+    #     The number of indexed drivers with each speed.
+    _added: int
+    #     The number of drivers ever added to the grid.
+    #
+    # === Representation Invariants ===
+    # _cells, _order and the buckets hold exactly the same drivers.
+    # No bucket in _buckets is empty, and no count in _speeds is zero.
+
+    def __init__(self, cell_size: int = 4) -> None:
+        """Initialize an empty DriverGrid.
+
+        Precondition: cell_size > 0
+        """
+        self._cell_size = cell_size
+        self._buckets = {}
+        self._cells = {}
+        self._order = {}
+        self._speeds = {}
+        self._added = 0
+        self.scanned = 0
+
+    def __len__(self) -> int:
+        """Return the number of drivers in this grid.
+
+        """
+        return len(self._cells)
+
+    def __contains__(self, driver: Driver) -> bool:
+        """Return True iff <driver> is in this grid.
+
+        """
+        return driver.id in self._cells
+
+    def __iter__(self) -> Iterator[Driver]:
+        """Yield the drivers in this grid, in the order they were added.
+
+        """
+        ids = sorted(self._order, key=self._order.get)
+        for identifier in ids:
+            yield self._buckets[self._cells[identifier]][identifier]
+
+    def add(self, driver: Driver) -> None:
+        """Add <driver> to this grid and start tracking its moves.
+
+        Precondition: <driver> is not in this grid.
+        """
+        cell = self._cell_of(driver.location)
+        self._buckets.setdefault(cell, {})[driver.id] = driver
+        self._cells[driver.id] = cell
+        self._order[driver.id] = self._added
+        self._added += 1
+        speed = driver.get_speed()
+        self._speeds[speed] = self._speeds.get(speed, 0) + 1
+        driver.set_move_listener(self.relocate)
+
+    def remove(self, driver: Driver) -> None:
+        """Remove <driver> from this grid and stop tracking its moves.
+
+        Precondition: <driver> is in this grid.
+        """
+        cell = self._cells.pop(driver.id)
+        del self._order[driver.id]
+        bucket = self._buckets[cell]
+        del bucket[driver.id]
+        if not bucket:
+            del self._buckets[cell]
+        speed = driver.get_speed()
+        self._speeds[speed] -= 1
+        if not self._speeds[speed]:
+            del self._speeds[speed]
+        driver.set_move_listener(None)
+
+    def relocate(self, driver: Driver) -> None:
+        """Move <driver> to the bucket of its current location.
+
+        Precondition: <driver> is in this grid.
+        """
+        cell = self._cell_of(driver.location)
+        old = self._cells[driver.id]
+        if cell != old:
+            bucket = self._buckets[old]
+            del bucket[driver.id]
+            if not bucket:
+                del self._buckets[old]
+            self._buckets.setdefault(cell, {})[driver.id] = driver
+            self._cells[driver.id] = cell
+
+    def nearest(self, location: Location) -> Optional[Driver]:
+        """Return the driver with the shortest travel time to <location>,
+        or None if no driver in this grid can reach it.
+
+        >>> from roads import DistanceOracle, RoadNetwork
+        >>> roads = RoadNetwork(3, 3)
+        >>> roads.one_way(Location(0, 1), Location(0, 0))
+        >>> roads.one_way(Location(1, 0), Location(0, 0))
+        >>> oracle = DistanceOracle(roads)
+        >>> stuck = Driver("Amaranth", Location(0, 0), 1)
+        >>> free = Driver("Bergamot", Location(2, 2), 1)
+        >>> grid = DriverGrid()
+        >>> for driver in (stuck, free):
+        ...     driver.set_distance_oracle(oracle)
+        ...     grid.add(driver)
+        >>> grid.nearest(Location(0, 1)).id
+        'Bergamot'
+        >>> grid.remove(free)
+        >>> grid.nearest(Location(0, 1)) is None
+        True
+        """
+        if not self._buckets:
+            return None
+        max_speed = max(self._speeds)
+        origin = self._cell_of(location)
+        best = None
+        ring = 0
+        while True:
+            if best is not None and \
+                    self._ring_bound(ring, max_speed) > best[0]:
+                return best[2]
+            if (2 * ring + 1) ** 2 >= len(self._buckets):
+                # The remaining rings are mostly empty cells, so visit the
+                # non-empty buckets directly instead.
+                for cell, bucket in self._buckets.items():
+                    dist = _chebyshev(origin, cell)
+                    if dist >= ring and (
+                            best is None or self._ring_bound(
+                                dist, max_speed) <= best[0]):
+                        best = self._scan(bucket, location, best)
+                return None if best is None else best[2]
+            for cell in _ring_cells(origin, ring):
+                bucket = self._buckets.get(cell)
+                if bucket:
+                    best = self._scan(bucket, location, best)
+            ring += 1
+
+    def _scan(self, bucket: Dict[str, Driver], location: Location,
+              best: Optional[Tuple[int, int, Driver]]) \
+            -> Optional[Tuple[int, int, Driver]]:
+        """Return the best (travel time, sequence number, driver) triple
+        among <best> and the drivers in <bucket> that can reach <location>.
+
+        """
+        self.scanned += len(bucket)
+        for identifier, driver in bucket.items():
+            candidate = (driver.get_travel_time(location),
+                         self._order[identifier], driver)
+            if candidate[0] != math.inf and (
+                    best is None or candidate[:2] < best[:2]):
+                best = candidate
+        return best
+
+    def _ring_bound(self, ring: int, max_speed: int) -> int:
+        """Return a lower bound on the travel time of any driver in a cell
+        <ring> cells away from the query cell.
+
+        """
+        if ring == 0:
+            return 0
+        return round(((ring - 1) * self._cell_size + 1) / max_speed)
+
+    def _cell_of(self, location: Location) -> Cell:
+        """Return the cell containing <location>.
+
+        """
+        return (location.rows // self._cell_size,
+                location.columns // self._cell_size)
+
+
+class RiderGrid:
+    """A grid-bucketed index over waiting riders, answering best-rider
+    queries for a driver.
+
+    Riders are bucketed by the cell of their origin, as drivers are in a
+    DriverGrid, and a query searches rings of cells around the driver until
+    no rider in an unsearched ring can beat the best score found so far.
+    Scores are at least the driver's travel time to the rider, so the
+    travel time bounds of a DriverGrid apply.
+
+    Ties in score are resolved in favour of the rider that was added to the
+    grid *earliest*.
+
+    === Public Attributes ===
+    scanned: The number of riders scored by best() so far.
+    """
+    scanned: int
+
+    # === Private Attributes ===
+    _cell_size: int
+    #     The width and height, in blocks, of a cell.
+    _buckets: Dict[Cell, Dict[str, Rider]]
+    #     The riders in each non-empty cell, keyed by rider id.
+    _order: Dict[str, int]
+    #     The sequence number each indexed rider was added with.
+    _added: int
+    #     The number of riders ever added to the grid.
+    #
+    # === Representation Invariants ===
+    # _order and the buckets hold exactly the same riders, and no bucket in
+    # _buckets is empty.
+
+    def __init__(self, cell_size: int = 4) -> None:
+        """Initialize an empty RiderGrid.
+
+        Precondition: cell_size > 0
+        """
+        self._cell_size = cell_size
+        self._buckets = {}
+        self._order = {}
+        self._added = 0
+        self.scanned = 0
+
+    def __len__(self) -> int:
+        """Return the number of riders in this grid.
+
+        """
+        return len(self._order)
+
+    def __contains__(self, rider: Rider) -> bool:
+        """Return True iff <rider> is in this grid.
+
+        """
+        return rider.id in self._order
+
+    def add(self, rider: Rider) -> None:
+        """Add <rider> to this grid.
+
+        Precondition: <rider> is not in this grid.
+        """
+        cell = self._cell_of(rider.origin)
+        self._buckets.setdefault(cell, {})[rider.id] = rider
+        self._order[rider.id] = self._added
+        self._added += 1
+
+    def remove(self, rider: Rider) -> None:
+        """Remove <rider> from this grid.
+
+        Precondition: <rider> is in this grid.
+        """
+        del self._order[rider.id]
+        cell = self._cell_of(rider.origin)
+        bucket = self._buckets[cell]
+        del bucket[rider.id]
+        if not bucket:
+            del self._buckets[cell]
+
+    def best(self, driver: Driver,
+             score: Callable[[Rider, int], Optional[float]]) \
+            -> Optional[Rider]:
+        """Return the rider with the lowest score for <driver>, or None if
+        no rider in this grid can be reached by <driver> and scored.
+
+        score: Returns the score of a rider, given the driver's travel time
+            to them, or None if the driver should not be sent to them. A
+            score is never less than the travel time.
+        """
+        if not self._buckets:
+            return None
+        speed = driver.get_speed()
+        origin = self._cell_of(driver.location)
+        best = None
+        ring = 0
+        while True:
+            if best is not None and self._ring_bound(ring, speed) > best[0]:
+                return best[2]
+            if (2 * ring + 1) ** 2 >= len(self._buckets):
+                for cell, bucket in self._buckets.items():
+                    dist = _chebyshev(origin, cell)
+                    if dist >= ring and (
+                            best is None or self._ring_bound(
+                                dist, speed) <= best[0]):
+                        best = self._scan(bucket, driver, score, best)
+                return None if best is None else best[2]
+            for cell in _ring_cells(origin, ring):
+                bucket = self._buckets.get(cell)
+                if bucket:
+                    best = self._scan(bucket, driver, score, best)
+            ring += 1
+
+    def _scan(self, bucket: Dict[str, Rider], driver: Driver,
+              score: Callable[[Rider, int], Optional[float]],
+              best: Optional[Tuple[float, int, Rider]]) \
+            -> Optional[Tuple[float, int, Rider]]:
+        """Return the best (score, sequence number, rider) triple among
+        <best> and the riders in <bucket> that <driver> can reach and that
+        can be scored.
+
+        """
+        self.scanned += len(bucket)
+        for identifier, rider in bucket.items():
+            travel_time = driver.get_travel_time(rider.origin)
+            if travel_time == math.inf:
+                continue
+            value = score(rider, travel_time)
+            if value is not None:
+                candidate = (value, self._order[identifier], rider)
+                if best is None or candidate[:2] < best[:2]:
+                    best = candidate
+        return best
+
+    def _ring_bound(self, ring: int, speed: int) -> int:
+        """Return a lower bound on the travel time of a driver with <speed>
+        to any rider in a cell <ring> cells away from the driver's cell.
+
+        """
+        if ring == 0:
+            return 0
+        return round(((ring - 1) * self._cell_size + 1) / speed)
+
+    def _cell_of(self, location: Location) -> Cell:
+        """Return the cell containing <location>.
+
+        """
+        return (location.rows // self._cell_size,
+                location.columns // self._cell_size)
+
+
+def _chebyshev(first: Cell, second: Cell) -> int:
+    """Return the number of rings between cells <first> and <second>.
+
+    """
+    return max(abs(first[0] - second[0]), abs(first[1] - second[1]))
+
+
+def _ring_cells(centre: Cell, ring: int) -> Iterator[Cell]:
+    """Yield the cells exactly <ring> rings away from <centre>.
+
+    >>> sorted(_ring_cells((0, 0), 1))
+    [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+    """
+    row, col = centre
+    if ring == 0:
+        yield centre
+        return
+    for c in range(col - ring, col + ring + 1):
+        yield row - ring, c
+        yield row + ring, c
+    for r in range(row - ring + 1, row + ring):
+        yield r, col - ring
+        yield r, col + ring
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={'extra-imports': ['math', 'typing', 'driver', 'location',
+                                  'rider']})
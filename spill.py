@@ -0,0 +1,157 @@
+"""A disk-backed store of finished riders.
+
+An EvictingMonitor forgets each rider once they stop waiting. To keep a
+record of every rider without holding them in memory, it can append one
+record per finished rider to a RiderSpill, which buffers records and
+writes them to a file in large pieces. read_spill reads the records back
+one at a time.
+
+A spill file is a sequence of records, with all integers little-endian:
+the length of the rider id in bytes (uint16), its UTF-8 encoding, the
+request time and the time the rider stopped waiting (int64), the outcome
+(uint8, 0 if picked up and 1 if cancelled), and the row and column of the
+rider's origin (int32).
+
+=== Constants ===
+PICKED_UP: The outcome of a rider who was picked up.
+GAVE_UP: The outcome of a rider who cancelled.
+"""
+
+import struct
+from typing import BinaryIO, Iterator, Tuple
+
+from location import Location
+
+PICKED_UP = 0
+GAVE_UP = 1
+
+_LENGTH = struct.Struct("<H")
+_RECORD = struct.Struct("<qqBii")
+
+# The size of the pieces a spill file is read in.
+_READ_SIZE = 2 ** 20
+
+# A finished rider: (id, request time, time they stopped waiting, outcome,
+# origin).
+SpilledRider = Tuple[str, int, int, int, Location]
+
+
+class RiderSpill:
+    """An append-only file of finished riders.
+
+    Use a RiderSpill as a context manager, or close it when the run is
+    done, so that the rest of the buffer is written out.
+
+    >>> import os, tempfile
+    >>> with tempfile.TemporaryDirectory() as directory:
+    ...     filename = os.path.join(directory, "riders.spill")
+    ...     with RiderSpill(filename) as spill:
+    ...         spill.append("Cerise", 3, 8, GAVE_UP, Location(4, 2))
+    ...     [record] = read_spill(filename)
+    >>> record[:4], str(record[4])
+    (('Cerise', 3, 8, 1), '(4, 2)')
+
+    === Public Attributes ===
+    riders: The number of riders appended.
+    """
+
+    riders: int
+
+    # === Private Attributes ===
+    _file: BinaryIO
+    #     The spill file.
+    _buffer: bytearray
+    #     The records not yet written to the file.
+    _buffer_size: int
+    #     The size the buffer may grow to before it is written out.
+
+    def __init__(self, filename: str, buffer_size: int = 2 ** 20) -> None:
+        """Initialize a RiderSpill that writes a new file called <filename>,
+        holding up to <buffer_size> bytes of records in memory.
+
+        """
+        self._file = open(filename, "wb")
+        self._buffer = bytearray()
+        self._buffer_size = buffer_size
+        self.riders = 0
+
+    def __enter__(self) -> 'RiderSpill':
+        """Return this spill.
+
+        """
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """Close this spill.
+
+        """
+        self.close()
+
+    def append(self, identifier: str, requested: int, finished: int,
+               outcome: int, origin: Location) -> None:
+        """Append the record of the rider <identifier>, who requested a
+        driver at <requested> from <origin>, and stopped waiting at
+        <finished> with <outcome>.
+
+        """
+        encoded = identifier.encode("utf-8")
+        self._buffer += _LENGTH.pack(len(encoded))
+        self._buffer += encoded
+        self._buffer += _RECORD.pack(requested, finished, outcome,
+                                     origin.rows, origin.columns)
+        self.riders += 1
+        if len(self._buffer) >= self._buffer_size:
+            self._flush()
+
+    def close(self) -> None:
+        """Write out the rest of the records and close the file.
+
+        """
+        if not self._file.closed:
+            self._flush()
+            self._file.close()
+
+    def _flush(self) -> None:
+        """Write out the buffer.
+
+        """
+        self._file.write(self._buffer)
+        self._buffer.clear()
+
+
+def read_spill(filename: str) -> Iterator[SpilledRider]:
+    """Yield the finished riders in the spill file <filename>, in the order
+    they were appended.
+
+    """
+    data = b""
+    offset = 0
+    with open(filename, "rb") as file:
+        while True:
+            chunk = file.read(_READ_SIZE)
+            if not chunk:
+                break
+            data = data[offset:] + chunk
+            offset = 0
+            end = len(data)
+            while offset + _LENGTH.size <= end:
+                (length,) = _LENGTH.unpack_from(data, offset)
+                start = offset + _LENGTH.size + length
+                if start + _RECORD.size > end:
+                    break
+                identifier = data[offset + _LENGTH.size:start].decode("utf-8")
+                requested, finished, outcome, row, col = \
+                    _RECORD.unpack_from(data, start)
+                offset = start + _RECORD.size
+                yield (identifier, requested, finished, outcome,
+                       Location(row, col))
+    if offset < len(data):
+        raise ValueError(f"{filename} is truncated")
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={
+            'allowed-io': ['RiderSpill.__init__', 'read_spill'],
+            'extra-imports': ['struct', 'typing', 'location']})
@@ -0,0 +1,188 @@
+"""Parameter sweeps and replications over a process pool.
+
+A sweep runs every scenario several times, once per replication, spreading
+the scenario x replication jobs over a pool of worker processes so that
+every core is used and no run pays interpreter startup. Each scenario is
+either a synthetic workload, which is generated with a different seed for
+each replication, or a fixed event file, which each worker reads once and
+then parses afresh for every run. A simulation of a fixed file is
+deterministic, so its replications would all be the same, and it is only
+run once. The report of each run is merged into a table of means and 95%
+confidence intervals per scenario.
+"""
+
+import math
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from dispatcher import Dispatcher
+from event import parse_event
+from generator import Workload, generate
+from monitor import StreamingMonitor
+from simulation import Simulation
+
+# The two-sided 95% critical values of Student's t distribution, indexed
+# by degrees of freedom. Larger samples use the normal value.
+_T95 = (0.0, 12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262,
+        2.228, 2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093,
+        2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045,
+        2.042)
+_Z95 = 1.960
+
+# The lines of each event file read by this worker process, keyed by file
+# name.
+_FILES: Dict[str, List[str]] = {}
+
+
+class Scenario:
+    """A scenario to simulate in a sweep.
+
+    === Public Attributes ===
+    name: The name of the scenario.
+    filename: The event file to simulate, or None to generate one.
+    workload: The workload to generate an event file from, if filename is
+        None.
+    make_dispatcher: Returns the dispatcher to simulate with, or None for a
+        default Dispatcher. It must be picklable, such as a class or a
+        module-level function.
+    """
+
+    name: str
+    filename: Optional[str]
+    workload: Optional[Workload]
+    make_dispatcher: Optional[Callable[[], Dispatcher]]
+
+    def __init__(self, name: str, filename: Optional[str] = None,
+                 workload: Optional[Workload] = None,
+                 make_dispatcher: Optional[Callable[[], Dispatcher]] = None) \
+            -> None:
+        """Initialize a Scenario.
+
+        Precondition: exactly one of filename and workload is not None.
+        """
+        self.name = name
+        self.filename = filename
+        self.workload = workload
+        self.make_dispatcher = make_dispatcher
+
+
+def run_sweep(scenarios: List[Scenario], replications: int = 10,
+              workers: Optional[int] = None, base_seed: int = 0) \
+        -> Dict[str, Dict[str, Dict[str, float]]]:
+    """Run each of <scenarios> <replications> times over a pool of
+    <workers> processes, and return the aggregate of their reports.
+
+    Replication i of a generated scenario uses the seed base_seed + i. A
+    scenario with a fixed event file is run once, since every replication
+    of it would give the same report.
+    workers: The number of worker processes, or None for one per core.
+    """
+    workers = workers or os.cpu_count() or 1
+    jobs = [(scenario, base_seed + i) for scenario in scenarios
+            for i in range(1 if scenario.filename is not None
+                           else replications)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        reports = list(pool.map(_run_job, jobs,
+                                chunksize=max(1, len(jobs) // (4 * workers))))
+    grouped = {}
+    for (scenario, _), report in zip(jobs, reports):
+        grouped.setdefault(scenario.name, []).append(report)
+    return {name: aggregate(group) for name, group in grouped.items()}
+
+
+def aggregate(reports: List[Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    """Return the mean, sample standard deviation, 95% confidence interval
+    half-width and sample size of each statistic in <reports>.
+
+    >>> stats = aggregate([{"x": 1.0}, {"x": 2.0}, {"x": 3.0}])
+    >>> stats["x"]["mean"], stats["x"]["stdev"], round(stats["x"]["ci95"], 3)
+    (2.0, 1.0, 2.484)
+    """
+    stats = {}
+    for key in reports[0]:
+        values = [report[key] for report in reports]
+        n = len(values)
+        mean = sum(values) / n
+        if n > 1:
+            stdev = math.sqrt(sum((v - mean) ** 2 for v in values) / (n - 1))
+            critical = _T95[n - 1] if n - 1 < len(_T95) else _Z95
+            ci95 = critical * stdev / math.sqrt(n)
+        else:
+            stdev = ci95 = 0.0
+        stats[key] = {"mean": mean, "stdev": stdev, "ci95": ci95, "n": n}
+    return stats
+
+
+def format_table(results: Dict[str, Dict[str, Dict[str, float]]]) -> str:
+    """Return <results> from run_sweep as a text table, with one row per
+    scenario and one mean +/- 95% confidence interval column per statistic.
+    A statistic of a single run has no confidence interval, so only its
+    value is shown.
+
+    >>> print(format_table({"file": aggregate([{"x": 1.0}]),
+    ...                     "workload": aggregate([{"x": 1.0}, {"x": 3.0}])}))
+    scenario                                   x
+    file                                   1.000
+    workload                    2.000 +/- 12.706
+    """
+    keys = sorted({key for stats in results.values() for key in stats})
+    lines = ["scenario".ljust(16) + "".join(key.rjust(28) for key in keys)]
+    for name, stats in results.items():
+        cells = []
+        for key in keys:
+            stat = stats.get(key)
+            if stat is None:
+                cell = "-"
+            elif stat["n"] == 1:
+                cell = f"{stat['mean']:.3f}"
+            else:
+                cell = f"{stat['mean']:.3f} +/- {stat['ci95']:.3f}"
+            cells.append(cell.rjust(28))
+        lines.append(name.ljust(16) + "".join(cells))
+    return "\n".join(lines)
+
+
+def _run_job(job: Tuple[Scenario, int]) -> Dict[str, float]:
+    """Simulate one replication of a scenario in this worker process, and
+    return the report.
+
+    job: The scenario and the seed of the replication.
+    """
+    scenario, seed = job
+    if scenario.filename is not None:
+        lines = _read_lines(scenario.filename)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "events.txt")
+            generate(scenario.workload, filename, seed)
+            with open(filename) as file:
+                lines = file.readlines()
+    events = [event for event in map(parse_event, lines)
+              if event is not None]
+    dispatcher = None
+    if scenario.make_dispatcher is not None:
+        dispatcher = scenario.make_dispatcher()
+    return Simulation(StreamingMonitor(), dispatcher).run(events)
+
+
+def _read_lines(filename: str) -> List[str]:
+    """Return the lines of the event file <filename>, reading it only the
+    first time this worker process needs it.
+
+    """
+    if filename not in _FILES:
+        with open(filename) as file:
+            _FILES[filename] = file.readlines()
+    return _FILES[filename]
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={
+            'allowed-io': ['_run_job', '_read_lines'],
+            'extra-imports': ['math', 'os', 'tempfile', 'concurrent.futures',
+                              'typing', 'dispatcher', 'event', 'generator',
+                              'monitor', 'simulation']})
@@ -0,0 +1,396 @@
+"""Binary traces of simulation runs.
+
+A TraceWriter given to a Simulation records every event the simulation
+does, and every activity its events notify the monitor of, to an
+append-only binary trace file. Records are packed into a large in-memory
+buffer, which is written out, compressed with zlib if asked, whenever it
+fills, so tracing costs little throughput and the trace never has to fit
+in memory.
+
+A trace can be replayed into a monitor, to rebuild the report of the run
+without dispatching again, and two traces can be compared record by
+record, to find the first point where two runs diverge, such as a run with
+an optimized dispatcher and a run with the reference one.
+
+A trace file starts with a header of a magic string (8 bytes), a version
+(uint32) and a compression flag (uint8), followed by the records, which are
+zlib-compressed as one stream if the flag is set. All integers are
+little-endian. Each record starts with a tag byte:
+
+    id:      tag 0, length (uint16), UTF-8 encoding of a string; the
+             strings are numbered in the order they appear, from 0
+    event:   tag 1, timestamp (int64), and the numbers of the strings of the
+             event type, rider id and driver id (uint32, NONE for none)
+    notify:  tag 2, timestamp (int64), category and description codes
+             (uint8), the number of the actor id string (uint32), and the
+             row and column of the location (int32)
+
+Run this module to replay or compare traces:
+
+    python tracing.py replay run.trace
+    python tracing.py diff reference.trace optimized.trace
+    python tracing.py --lint            # check the module with python_ta
+
+=== Constants ===
+NONE: The string number recorded for a missing rider or driver.
+"""
+
+import argparse
+import json
+import struct
+import sys
+import zlib
+from itertools import zip_longest
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from event import Event
+from location import Location
+from monitor import Monitor, RIDER, DRIVER, REQUEST, CANCEL, PICKUP, DROPOFF
+
+NONE = 0xFFFFFFFF
+
+_MAGIC = b"RIDETRC\0"
+_VERSION = 1
+_HEADER = struct.Struct("<8sIB")
+_ID = struct.Struct("<BH")
+_EVENT = struct.Struct("<BqIII")
+_NOTIFY = struct.Struct("<BqBBIii")
+_ID_TAG, _EVENT_TAG, _NOTIFY_TAG = 0, 1, 2
+
+# The activity categories and descriptions, indexed by their codes.
+_CATEGORIES = (RIDER, DRIVER)
+_DESCRIPTIONS = (REQUEST, CANCEL, PICKUP, DROPOFF)
+
+# The size of the pieces a trace file is read in.
+_READ_SIZE = 2 ** 20
+
+# A record read from a trace: ("event", timestamp, event type, rider id or
+# None, driver id or None), or ("notify", timestamp, category, description,
+# actor id, location).
+TraceRecord = Tuple
+
+
+class TraceWriter:
+    """A writer of a binary trace of a simulation run.
+
+    Use a TraceWriter as a context manager, or close it when the run is
+    done, so that the rest of the buffer is written out.
+
+    === Public Attributes ===
+    records: The number of event and notify records written.
+    """
+
+    records: int
+
+    # === Private Attributes ===
+    _file: BinaryIO
+    #     The trace file.
+    _compressor: Optional[object]
+    #     The zlib compressor of the records, or None if they are not
+    #     compressed.
+    _buffer: bytearray
+    #     The records not yet written to the file.
+    _buffer_size: int
+    #     The size the buffer may grow to before it is written out.
+    _ids: Dict[str, int]
+    #     The number of each string recorded so far.
+
+    def __init__(self, filename: str, compress: bool = False,
+                 buffer_size: int = 2 ** 20) -> None:
+        """Initialize a TraceWriter that writes a new trace file called
+        <filename>.
+
+        compress: Whether to compress the records with zlib, which makes
+            the trace several times smaller for a little more time.
+        buffer_size: The number of bytes of records held in memory before
+            they are written out.
+        """
+        self._file = open(filename, "wb")
+        self._file.write(_HEADER.pack(_MAGIC, _VERSION, compress))
+        self._compressor = zlib.compressobj(1) if compress else None
+        self._buffer = bytearray()
+        self._buffer_size = buffer_size
+        self._ids = {}
+        self.records = 0
+
+    def __enter__(self) -> 'TraceWriter':
+        """Return this writer.
+
+        """
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """Close this writer.
+
+        """
+        self.close()
+
+    def record_event(self, event: Event) -> None:
+        """Record that <event> is done.
+
+        """
+        rider = getattr(event, "rider", None)
+        driver = getattr(event, "driver", None)
+        record = _EVENT.pack(
+            _EVENT_TAG, event.timestamp, self._id(type(event).__name__),
+            NONE if rider is None else self._id(rider.id),
+            NONE if driver is None else self._id(driver.id))
+        self._append(record)
+
+    def record_notify(self, timestamp: int, category: str, description: str,
+                      identifier: str, location: Location) -> None:
+        """Record that the monitor is notified of an activity, with the
+        arguments of Monitor.notify.
+
+        """
+        record = _NOTIFY.pack(
+            _NOTIFY_TAG, timestamp, _CATEGORIES.index(category),
+            _DESCRIPTIONS.index(description), self._id(identifier),
+            location.rows, location.columns)
+        self._append(record)
+
+    def watch(self, monitor: Monitor) -> '_TracedMonitor':
+        """Return a stand-in for <monitor>, to give to events, that records
+        each notify and passes it on to <monitor>.
+
+        """
+        return _TracedMonitor(self, monitor)
+
+    def close(self) -> None:
+        """Write out the rest of the trace and close the file.
+
+        """
+        if self._file.closed:
+            return
+        self._flush()
+        if self._compressor is not None:
+            self._file.write(self._compressor.flush())
+        self._file.close()
+
+    def _id(self, string: str) -> int:
+        """Return the number of <string>, recording it if it is new.
+
+        """
+        number = self._ids.get(string)
+        if number is None:
+            number = self._ids[string] = len(self._ids)
+            encoded = string.encode("utf-8")
+            self._buffer += _ID.pack(_ID_TAG, len(encoded))
+            self._buffer += encoded
+        return number
+
+    def _append(self, record: bytes) -> None:
+        """Add the event or notify <record> to the buffer, writing the
+        buffer out if it is full.
+
+        """
+        self._buffer += record
+        self.records += 1
+        if len(self._buffer) >= self._buffer_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        """Write out the buffer.
+
+        """
+        data = bytes(self._buffer)
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        self._file.write(data)
+        self._buffer.clear()
+
+
+class _TracedMonitor:
+    """A stand-in for a monitor, given to events, that records each activity
+    it is notified of in a trace before passing it on to the monitor.
+
+    === Public Attributes ===
+    monitor: The monitor that activities are passed on to.
+    """
+    __slots__ = ("monitor", "_writer")
+
+    monitor: Monitor
+
+    # === Private Attributes ===
+    _writer: TraceWriter
+    #     The writer of the trace.
+
+    def __init__(self, writer: TraceWriter, monitor: Monitor) -> None:
+        """Initialize a _TracedMonitor for <monitor> that records in the
+        trace of <writer>.
+
+        """
+        self.monitor = monitor
+        self._writer = writer
+
+    def notify(self, timestamp: int, category: str, description: str,
+               identifier: str, location: Location) -> None:
+        """Record the activity, and notify the monitor of it.
+
+        """
+        self._writer.record_notify(timestamp, category, description,
+                                   identifier, location)
+        self.monitor.notify(timestamp, category, description, identifier,
+                            location)
+
+
+def read_trace(filename: str) -> Iterator[TraceRecord]:
+    """Yield the event and notify records in the trace file <filename>, in
+    the order they were written.
+
+    >>> import os, tempfile
+    >>> from driver import Driver
+    >>> from event import DriverRequest
+    >>> with tempfile.TemporaryDirectory() as directory:
+    ...     filename = os.path.join(directory, "run.trace")
+    ...     with TraceWriter(filename, compress=True) as writer:
+    ...         writer.record_event(DriverRequest(
+    ...             3, Driver("Amaranth", Location(1, 2), 1)))
+    ...         writer.record_notify(3, DRIVER, REQUEST, "Amaranth",
+    ...                              Location(1, 2))
+    ...     event, notify = read_trace(filename)
+    >>> event
+    ('event', 3, 'DriverRequest', None, 'Amaranth')
+    >>> notify[:5], str(notify[5])
+    (('notify', 3, 'driver', 'request', 'Amaranth'), '(1, 2)')
+    """
+    ids = []
+    data = b""
+    offset = 0
+    for chunk in _read_chunks(filename):
+        data = data[offset:] + chunk
+        offset = 0
+        end = len(data)
+        while offset < end:
+            tag = data[offset]
+            if tag == _NOTIFY_TAG:
+                if offset + _NOTIFY.size > end:
+                    break
+                (_, timestamp, category, description, actor, row,
+                 col) = _NOTIFY.unpack_from(data, offset)
+                offset += _NOTIFY.size
+                yield ("notify", timestamp, _CATEGORIES[category],
+                       _DESCRIPTIONS[description], ids[actor],
+                       Location(row, col))
+            elif tag == _EVENT_TAG:
+                if offset + _EVENT.size > end:
+                    break
+                _, timestamp, kind, rider, driver = \
+                    _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                yield ("event", timestamp, ids[kind],
+                       None if rider == NONE else ids[rider],
+                       None if driver == NONE else ids[driver])
+            elif tag == _ID_TAG:
+                if offset + _ID.size > end:
+                    break
+                _, length = _ID.unpack_from(data, offset)
+                start = offset + _ID.size
+                if start + length > end:
+                    break
+                ids.append(data[start:start + length].decode("utf-8"))
+                offset = start + length
+            else:
+                raise ValueError(f"{filename} is corrupt: unknown record "
+                                 f"tag {tag}")
+    if offset < len(data):
+        raise ValueError(f"{filename} is truncated")
+
+
+def replay(filename: str,
+           monitor: Optional[Monitor] = None) -> Dict[str, float]:
+    """Notify <monitor> of every activity in the trace file <filename>, in
+    order, and return its report. No event is done again.
+
+    monitor: The monitor to rebuild. Defaults to a new Monitor.
+    """
+    if monitor is None:
+        monitor = Monitor()
+    for record in read_trace(filename):
+        if record[0] == "notify":
+            monitor.notify(*record[1:])
+    return monitor.report()
+
+
+def diff(first: str, second: str) \
+        -> Optional[Tuple[int, Optional[TraceRecord], Optional[TraceRecord]]]:
+    """Return the position, counting from 0, of the first record at which
+    the trace files <first> and <second> differ, with the record of each
+    trace there, or None for a trace that has ended. Return None if the
+    traces are the same.
+
+    """
+    pairs = zip_longest(read_trace(first), read_trace(second))
+    for position, (one, other) in enumerate(pairs):
+        if one != other:
+            return position, one, other
+    return None
+
+
+def _read_chunks(filename: str) -> Iterator[bytes]:
+    """Yield the records of the trace file <filename> in pieces,
+    decompressed if they were compressed.
+
+    """
+    with open(filename, "rb") as file:
+        header = file.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            raise ValueError(f"{filename} is not a trace file")
+        magic, version, compressed = _HEADER.unpack(header)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"{filename} is not a trace file, or an "
+                             f"unsupported version")
+        decompressor = zlib.decompressobj() if compressed else None
+        while True:
+            chunk = file.read(_READ_SIZE)
+            if not chunk:
+                break
+            yield chunk if decompressor is None \
+                else decompressor.decompress(chunk)
+        if decompressor is not None:
+            yield decompressor.flush()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Replay or compare the traces named on the command line <argv>,
+    report the result, and return the exit status: 1 if compared traces
+    differ, and 0 otherwise.
+
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    replay_parser = commands.add_parser(
+        "replay", help="rebuild the monitor report of a run")
+    replay_parser.add_argument("trace")
+    diff_parser = commands.add_parser(
+        "diff", help="find the first point where two runs diverge")
+    diff_parser.add_argument("first")
+    diff_parser.add_argument("second")
+    args = parser.parse_args(argv)
+
+    if args.command == "replay":
+        print(json.dumps(replay(args.trace), indent=2, sort_keys=True))
+        return 0
+    difference = diff(args.first, args.second)
+    if difference is None:
+        print("The traces are the same")
+        return 0
+    position, one, other = difference
+    print(f"The traces diverge at record {position}:")
+    print(f"  {args.first}: {one}")
+    print(f"  {args.second}: {other}")
+    return 1
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['--lint']:
+        import python_ta
+        python_ta.check_all(
+            config={
+                'allowed-io': ['TraceWriter.__init__', 'TraceWriter.close',
+                               'TraceWriter._flush', '_read_chunks', 'main'],
+                'extra-imports': ['argparse', 'json', 'struct', 'sys', 'zlib',
+                                  'itertools', 'typing', 'event', 'location',
+                                  'monitor']})
+    else:
+        sys.exit(main())